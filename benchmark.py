@@ -0,0 +1,362 @@
+# benchmark.py
+"""
+Benchmark lặp lại được cho các bước ETL trên một MySQL local
+(hoặc file SQLite nhúng khi DW_DB_BACKEND=sqlite, không cần MySQL server).
+
+Với mỗi hệ số quy mô (scale factor):
+  1. Sinh dữ liệu giả lập cố định theo seed (generate_logs) vào <work-dir>/sf<N>.
+  2. Tạo schema dùng xong bỏ (mặc định dw_bench; sqlite: file <work-dir>/sf<N>/dw_bench.sqlite)
+     rồi chạy create_tables trong đó; cache catalog H5 và staging Parquet của scale bị xóa
+     để bước parse luôn chạy nguội.
+  3. Chạy lần lượt từng bước trong một process con riêng (đo peak RSS độc lập),
+     ghi lại thời gian, số dòng, rows/sec, p50/p95 mỗi lô theo từng pha.
+Kết quả ghi ra JSON (mặc định bench_results/<git-commit>.json) để so sánh giữa các commit:
+
+    python benchmark.py --scales 1,4,16
+    python benchmark.py --compare bench_results/abc1234.json bench_results/def5678.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Các bước được đo (theo thứ tự DAG của pipeline_runner) và bảng kết quả của từng bước
+BENCH_STAGES = {
+    "load.load_staging": "songplays",
+    "load.load_warehouse": "songs",
+    "transform.create_aggregate": "songplays_daily",
+    "load.load_mart": "mart_daily_plays",
+}
+
+# Kích thước dữ liệu ở scale factor 1; số sự kiện/ngày, số user và catalog nhân theo scale
+BASE_SCALE = {"days": 3, "events_per_day": 20000, "users": 200, "catalog_size": 1000}
+DEFAULT_SEED = 42
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+# ---------------------------------------------------------------------------
+# Process con: chạy một bước và ghi số đo ra file JSON
+# ---------------------------------------------------------------------------
+
+def _count_rows(table):
+    from db import connection
+    try:
+        with connection() as (cur, conn):
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            return cur.fetchone()[0]
+    except Exception:
+        return None
+
+def _rows_logged(module_name, since_log_id):
+    """rows_loaded mà bước tự ghi vào etl_logs (None nếu bước không dùng ETLLogger)."""
+    from db import connection
+    try:
+        with connection() as (cur, conn):
+            cur.execute(
+                "SELECT SUM(rows_loaded) FROM etl_logs WHERE package_name = %s AND log_id > %s",
+                (module_name, since_log_id),
+            )
+            value = cur.fetchone()[0]
+    except Exception:
+        return None
+    return int(value) if value is not None else None
+
+def _logged_status(module_name, since_log_id):
+    """FAILED nếu bước đã ghi một lần chạy FAILED vào etl_logs, SUCCESS nếu có log, None nếu không."""
+    from db import connection
+    try:
+        with connection() as (cur, conn):
+            cur.execute(
+                "SELECT status FROM etl_logs WHERE package_name = %s AND log_id > %s",
+                (module_name, since_log_id),
+            )
+            statuses = {row[0] for row in cur.fetchall()}
+    except Exception:
+        return None
+    if "FAILED" in statuses:
+        return "FAILED"
+    return "SUCCESS" if statuses else None
+
+def _max_log_id():
+    from db import connection
+    try:
+        with connection() as (cur, conn):
+            cur.execute("SELECT COALESCE(MAX(log_id), 0) FROM etl_logs")
+            return cur.fetchone()[0]
+    except Exception:  # schema mới, chưa có etl_logs
+        return 0
+
+def _phase(seconds, rows, calls=None, p50=None, p95=None):
+    return {
+        "seconds": round(seconds, 6),
+        "rows": rows,
+        "calls": calls,
+        "rows_per_sec": round(rows / seconds, 2) if rows and seconds > 0 else None,
+        "p50_seconds": p50,
+        "p95_seconds": p95,
+    }
+
+def _timer_phases(timer):
+    """Các pha từ PhaseTimer của bước (có cả số lần gọi và p50/p95 mỗi lô)."""
+    return {
+        name: _phase(phase_seconds, rows, len(timer.samples.get(name, ())),
+                     timer.percentile(name, 50), timer.percentile(name, 95))
+        for name, (phase_seconds, rows) in timer.phases.items()
+    }
+
+def _logged_phases(module_name, since_log_id):
+    """Các pha bước tự ghi vào etl_log_metrics (bước không có TIMER cấp module; không có p50/p95)."""
+    from db import connection
+    try:
+        with connection() as (cur, conn):
+            cur.execute(
+                "SELECT m.phase, SUM(m.seconds), SUM(m.rows_processed) FROM etl_log_metrics m "
+                "JOIN etl_logs l ON l.log_id = m.log_id "
+                "WHERE l.package_name = %s AND l.log_id > %s AND m.phase <> 'total' "
+                "GROUP BY m.phase",
+                (module_name, since_log_id),
+            )
+            rows = cur.fetchall()
+    except Exception:
+        return {}
+    return {phase: _phase(float(seconds or 0), int(count or 0)) for phase, seconds, count in rows}
+
+def run_child(module_name, result_path):
+    from etl_logger import peak_rss_mb
+    from pipeline_runner import run_in_process
+
+    since = _max_log_id()
+    started = time.perf_counter()
+    run_in_process(module_name)
+    seconds = time.perf_counter() - started
+
+    # Bước có PhaseTimer cấp module (vd. load_staging.TIMER) thì đọc thẳng, không thì từ etl_log_metrics
+    timer = getattr(sys.modules.get(module_name), "TIMER", None)
+    phases = _timer_phases(timer) if timer is not None else _logged_phases(module_name, since)
+
+    table = BENCH_STAGES.get(module_name)
+    rows_out = _count_rows(table) if table else None
+    rows = _rows_logged(module_name, since)
+    rows = rows if rows is not None else rows_out
+    result = {
+        "stage": module_name,
+        "status": _logged_status(module_name, since),
+        "seconds": round(seconds, 6),
+        "rows": rows,
+        "rows_out": rows_out,
+        "rows_per_sec": round(rows / seconds, 2) if rows and seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "phases": phases,
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+# ---------------------------------------------------------------------------
+# Process cha: sinh dữ liệu, tạo schema, chạy các bước và gom kết quả
+# ---------------------------------------------------------------------------
+
+def scale_params(scale, seed):
+    return {
+        "days": BASE_SCALE["days"],
+        "events_per_day": BASE_SCALE["events_per_day"] * scale,
+        "users": BASE_SCALE["users"] * scale,
+        "catalog_size": BASE_SCALE["catalog_size"] * scale,
+        "seed": seed,
+    }
+
+def prepare_data(scale_dir, params, workers):
+    """Sinh dữ liệu cho một scale factor; dùng lại nếu đã sinh với đúng tham số."""
+    from generate_logs import generate_log_data
+
+    marker = os.path.join(scale_dir, "params.json")
+    if os.path.exists(marker):
+        with open(marker, encoding="utf-8") as f:
+            if json.load(f) == params:
+                print(f"[BENCH] Dùng lại dữ liệu đã sinh tại {scale_dir}")
+                return None
+    started = time.perf_counter()
+    generate_log_data(
+        days=params["days"], events_per_day=params["events_per_day"], users=params["users"],
+        catalog_size=params["catalog_size"], seed=params["seed"], workers=workers,
+        log_dir=os.path.join(scale_dir, "log_data"), song_dir=os.path.join(scale_dir, "song_data"),
+    )
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return round(time.perf_counter() - started, 3)
+
+def _server_connection():
+    import mysql.connector
+    from config import DB_CONFIG
+    return mysql.connector.connect(
+        host=DB_CONFIG["host"], user=DB_CONFIG["user"], password=DB_CONFIG["password"],
+        port=DB_CONFIG.get("port", 3306),
+    )
+
+def sqlite_schema_path(scale_dir, schema):
+    return os.path.join(scale_dir, f"{schema}.sqlite")
+
+def reset_sqlite_schema(path, drop_only=False):
+    import sqlite3
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return f"SQLite {sqlite3.sqlite_version}"
+
+def reset_schema(schema, drop_only=False):
+    conn = _server_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"DROP DATABASE IF EXISTS `{schema}`")
+        if not drop_only:
+            cur.execute(f"CREATE DATABASE `{schema}`")
+        cur.execute("SELECT VERSION()")
+        version = cur.fetchone()[0]
+        conn.commit()
+        return version
+    finally:
+        conn.close()
+
+def run_stage_child(module_name, env, result_path):
+    res = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "benchmark.py"), "--child", module_name, "--result", result_path],
+        cwd=ROOT, env=env, capture_output=True,
+    )
+    if res.returncode != 0:
+        print(res.stdout.decode("utf-8", errors="ignore"))
+        print(res.stderr.decode("utf-8", errors="ignore"))
+        raise RuntimeError(f"{module_name} exited with code {res.returncode}")
+    with open(result_path, encoding="utf-8") as f:
+        result = json.load(f)
+    if result.get("status") == "FAILED":
+        # Bước tự bắt lỗi và chỉ ghi FAILED vào etl_logs: số đo không dùng để so sánh được
+        raise RuntimeError(f"{module_name} ghi trạng thái FAILED vào etl_logs")
+    return result
+
+def reset_scale_cache(scale_dir):
+    """
+    Xóa cache catalog H5 và staging Parquet của scale (DW_STAGING_DATA_DIR=scale_dir) để mọi
+    lần chạy đều parse H5 từ đầu: kết quả giữa các commit mới so sánh được với nhau.
+    """
+    for name in ("cache", "parquet"):
+        shutil.rmtree(os.path.join(scale_dir, name), ignore_errors=True)
+
+def run_scale(scale, args):
+    params = scale_params(scale, args.seed)
+    scale_dir = os.path.join(os.path.abspath(args.work_dir), f"sf{scale}")
+    generate_seconds = prepare_data(scale_dir, params, args.workers)
+
+    from config import DB_BACKEND
+    env = os.environ.copy()
+    env.update(PYTHONUTF8="1", DW_DB_NAME=args.schema, DW_STAGING_DATA_DIR=scale_dir)
+    # Cache/staging do môi trường ngoài chỉ định thì vẫn phải nằm trong scale_dir để được xóa
+    env.pop("DW_SONG_CACHE_PATH", None)
+    env.pop("DW_PARQUET_STAGING_DIR", None)
+    reset_scale_cache(scale_dir)
+    if DB_BACKEND == "sqlite":
+        sqlite_path = sqlite_schema_path(scale_dir, args.schema)
+        db_version = reset_sqlite_schema(sqlite_path)
+        env["DW_SQLITE_PATH"] = sqlite_path
+    else:
+        db_version = reset_schema(args.schema)
+
+    stages = {}
+    try:
+        for module_name in ["create_tables"] + list(BENCH_STAGES):
+            print(f"[BENCH] sf{scale}: {module_name}...")
+            result = run_stage_child(module_name, env, os.path.join(scale_dir, f"{module_name}.result.json"))
+            stages[module_name] = result
+            print(f"[BENCH] sf{scale}: {module_name} {result['seconds']:.2f}s, "
+                  f"{result['rows_per_sec'] or '-'} rows/s, peak {result['peak_rss_mb'] or 0:.0f} MB")
+    finally:
+        if not args.keep_schema:
+            if DB_BACKEND == "sqlite":
+                reset_sqlite_schema(sqlite_path, drop_only=True)
+            else:
+                reset_schema(args.schema, drop_only=True)
+
+    return {
+        "scale": scale,
+        "params": params,
+        "events": params["days"] * params["events_per_day"],
+        "generate_seconds": generate_seconds,
+        "backend": DB_BACKEND,
+        "db_version": db_version,
+        "stages": stages,
+    }
+
+def compare(old_path, new_path):
+    """In chênh lệch thời gian và rows/sec từng bước giữa hai file kết quả."""
+    with open(old_path, encoding="utf-8") as f:
+        old = {r["scale"]: r for r in json.load(f)["runs"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {r["scale"]: r for r in json.load(f)["runs"]}
+    print(f"{'scale':<6} {'stage':<28} {'old s':>9} {'new s':>9} {'delta':>8}")
+    for scale in sorted(set(old) & set(new)):
+        for stage, after in new[scale]["stages"].items():
+            before = old[scale]["stages"].get(stage)
+            if not before:
+                continue
+            delta = (after["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0.0
+            print(f"sf{scale:<4} {stage:<28} {before['seconds']:>9.2f} {after['seconds']:>9.2f} {delta:>+7.1f}%")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các bước ETL trên MySQL local hoặc SQLite.")
+    parser.add_argument("--scales", default="1,4",
+                        help="Danh sách scale factor, cách nhau bởi dấu phẩy (mặc định 1,4)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed sinh dữ liệu")
+    parser.add_argument("--schema", default="dw_bench", help="Schema dùng xong bỏ (sẽ bị DROP)")
+    parser.add_argument("--keep-schema", action="store_true", help="Không DROP schema sau khi chạy")
+    parser.add_argument("--work-dir", default=os.path.join(ROOT, "data", "bench"),
+                        help="Thư mục chứa dữ liệu sinh ra cho từng scale factor")
+    parser.add_argument("--workers", type=int, default=None, help="Số process sinh dữ liệu")
+    parser.add_argument("--output", default=None,
+                        help="File JSON kết quả (mặc định bench_results/<git-commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="So sánh hai file kết quả rồi thoát")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        run_child(args.child, args.result)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    from config import DB_CONFIG, DB_BACKEND
+    if DB_BACKEND == "mysql" and args.schema == DB_CONFIG["database"]:
+        raise SystemExit(f"--schema {args.schema} trùng với database chính; chọn schema khác để benchmark.")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "runs": [run_scale(int(s), args) for s in args.scales.split(",") if s.strip()],
+    }
+
+    output = args.output or os.path.join(ROOT, "bench_results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"=== BENCHMARK XONG: kết quả tại {output} ===")
+
+if __name__ == "__main__":
+    main()
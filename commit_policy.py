@@ -0,0 +1,70 @@
+# commit_policy.py
+import time
+
+from config import COMMIT_EVERY_ROWS, COMMIT_EVERY_FILES, COMMIT_EVERY_SECONDS
+
+class CommitPolicy:
+    """
+    Gom nhiều file/dòng vào một transaction: commit khi đạt N dòng, N file
+    hoặc T giây (ngưỡng nào đến trước; 0 = tắt ngưỡng đó).
+
+    Dùng như context manager: thoát bình thường -> commit phần còn lại,
+    có exception -> rollback phần chưa commit rồi ném lại lỗi.
+    timer (etl_logger.PhaseTimer, tùy chọn) nhận thời gian commit ở pha "commit".
+    """
+
+    def __init__(self, conn, every_rows=COMMIT_EVERY_ROWS, every_files=COMMIT_EVERY_FILES,
+                 every_seconds=COMMIT_EVERY_SECONDS, timer=None):
+        self.conn = conn
+        self.timer = timer
+        self.every_rows = every_rows
+        self.every_files = every_files
+        self.every_seconds = every_seconds
+        self.batches = 0
+        self._reset()
+
+    def _reset(self):
+        self.pending_rows = 0
+        self.pending_files = 0
+        self.last_commit = time.monotonic()
+
+    def record(self, rows=0, files=0):
+        """Ghi nhận công việc vừa xong; commit nếu đã tới ngưỡng."""
+        self.pending_rows += rows
+        self.pending_files += files
+        if self._due():
+            self.commit()
+
+    def _due(self):
+        return (
+            (self.every_rows and self.pending_rows >= self.every_rows)
+            or (self.every_files and self.pending_files >= self.every_files)
+            or (self.every_seconds and time.monotonic() - self.last_commit >= self.every_seconds)
+        )
+
+    def commit(self, force=False):
+        """force: commit cả khi chưa ghi nhận dòng/file nào (vd. khối chỉ ghi users/time)."""
+        if self.pending_rows or self.pending_files or force:
+            started = time.perf_counter()
+            self.conn.commit()
+            self.batches += 1
+            if self.timer is not None:
+                self.timer.add("commit", time.perf_counter() - started, self.pending_rows)
+        self._reset()
+
+    def rollback(self):
+        try:
+            self.conn.rollback()
+        finally:
+            self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            print(f"Rollback {self.pending_files} file / {self.pending_rows} dòng chưa commit.")
+            self.rollback()
+        return False
@@ -1,6 +1,13 @@
 # config.py
 import os
 
+# Cách ghi dữ liệu log vào staging: "insert" (executemany) hoặc "load_data"
+# (LOAD DATA LOCAL INFILE qua bảng tạm, tự quay về "insert" nếu server tắt local_infile)
+INGEST_MODE = os.getenv("DW_INGEST_MODE", "insert")
+
+# Backend CSDL: "mysql" (mặc định) hoặc "sqlite" (file nhúng, chạy pipeline/benchmark không cần MySQL server)
+DB_BACKEND = os.getenv("DW_DB_BACKEND", "mysql")
+
 # MySQL connection (FreeSQLDatabase sample)
 DB_CONFIG = {
     "host": os.getenv("DW_DB_HOST", "localhost"),
@@ -8,14 +15,71 @@ DB_CONFIG = {
     "password": os.getenv("DW_DB_PASSWORD", ""),
     "database": os.getenv("DW_DB_NAME", "dms"),
     "port": int(os.getenv("DW_DB_PORT", 3306)),
+    # Pool kết nối dùng chung trong mỗi process (db.connection / db.create_connection)
+    "pool_size": int(os.getenv("DW_DB_POOL_SIZE", 5)),
+    "pool_timeout": float(os.getenv("DW_DB_POOL_TIMEOUT", 30)),
+    "allow_local_infile": os.getenv("DW_DB_LOCAL_INFILE", "1" if INGEST_MODE == "load_data" else "0") == "1",
 }
 
 # Local staging folders
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STAGING_DATA_DIR = os.getenv("DW_STAGING_DATA_DIR", os.path.join(BASE_DIR, "data"))
+# File CSDL khi DW_DB_BACKEND=sqlite; chờ tối đa SQLITE_BUSY_TIMEOUT giây khi process/thread khác đang ghi
+SQLITE_PATH = os.getenv("DW_SQLITE_PATH", os.path.join(STAGING_DATA_DIR, "warehouse.sqlite"))
+SQLITE_BUSY_TIMEOUT = float(os.getenv("DW_SQLITE_BUSY_TIMEOUT", 120))
 # subfolders
 SONG_DATA_DIR = os.path.join(STAGING_DATA_DIR, "song_data")
 LOG_DATA_DIR = os.path.join(STAGING_DATA_DIR, "log_data")
+# Dữ liệu giả lập của generate_logs, tách khỏi song_data (Million Song Subset thật) và log_data
+SYNTHETIC_SONG_DATA_DIR = os.path.join(STAGING_DATA_DIR, "synthetic", "song_data")
+SYNTHETIC_LOG_DATA_DIR = os.path.join(STAGING_DATA_DIR, "synthetic", "log_data")
+# File nén Million Song Subset mà extraction.extract đọc
+SONG_ARCHIVE_PATH = os.getenv("DW_SONG_ARCHIVE", os.path.join(STAGING_DATA_DIR, "millionsongsubset.tar.gz"))
+# Nguồn H5 của các loader: "dir" (song_data đã giải nén) hoặc "archive" (đọc thẳng từ tar trong bộ nhớ)
+SONG_SOURCE = os.getenv("DW_SONG_SOURCE", "dir")
+# Cache dạng cột (Parquet) của lượt đọc H5 dùng chung cho load_staging và load_warehouse
+SONG_CACHE_PATH = os.getenv("DW_SONG_CACHE_PATH", os.path.join(STAGING_DATA_DIR, "cache", "song_catalog.parquet"))
+
+# Staging dạng Parquet theo ngày (song song với staging MySQL) để transform đọc dạng cột
+PARQUET_STAGING = os.getenv("DW_PARQUET_STAGING", "1") == "1"
+PARQUET_STAGING_DIR = os.getenv("DW_PARQUET_STAGING_DIR", os.path.join(STAGING_DATA_DIR, "parquet"))
+
+# Số dòng mỗi lô khi ghi hàng loạt (executemany / multi-row INSERT)
+BATCH_SIZE = int(os.getenv("DW_BATCH_SIZE", 1000))
+
+# Số dòng JSON đọc mỗi khối khi stream file log (giới hạn bộ nhớ theo khối, không theo file)
+LOG_CHUNK_SIZE = int(os.getenv("DW_LOG_CHUNK_SIZE", 20000))
+
+# Số dòng mỗi lần fetchmany khi transform export bằng cursor không buffer
+EXPORT_CHUNK_SIZE = int(os.getenv("DW_EXPORT_CHUNK_SIZE", 50000))
+
+# Chính sách commit dùng chung cho các loader: commit khi đạt ngưỡng nào trước
+# (0 = tắt ngưỡng đó). Mặc định gom nhiều file vào một transaction thay vì commit từng file.
+COMMIT_EVERY_ROWS = int(os.getenv("DW_COMMIT_EVERY_ROWS", 50000))
+COMMIT_EVERY_FILES = int(os.getenv("DW_COMMIT_EVERY_FILES", 500))
+COMMIT_EVERY_SECONDS = float(os.getenv("DW_COMMIT_EVERY_SECONDS", 30))
+
+# Số process parse file H5 song song khi load song_data (1 = tuần tự như cũ)
+H5_WORKERS = int(os.getenv("DW_H5_WORKERS", 1))
+
+# Chế độ pipeline của load_staging: số làn (thread đọc JSON + thread ghi có kết nối riêng)
+# chạy chồng nhau, và số khối tối đa chờ ghi mỗi làn. 0 làn = đọc/ghi tuần tự như cũ.
+# Mỗi làn giữ một kết nối nên nên để PIPELINE_LANES < DW_DB_POOL_SIZE.
+PIPELINE_LANES = int(os.getenv("DW_PIPELINE_LANES", 0))
+PIPELINE_QUEUE_SIZE = int(os.getenv("DW_PIPELINE_QUEUE_SIZE", 4))
+
+# Số bài hát tối đa được giữ trong chỉ mục tra cứu (song, artist, length) trên RAM.
+# Kho nhạc lớn hơn ngưỡng này sẽ chuyển sang chế độ tra cứu theo từng lô.
+LOOKUP_MAX_ROWS = int(os.getenv("DW_LOOKUP_MAX_ROWS", 2000000))
+
+# Các bước tổng hợp tăng dần (create_aggregate, load_mart) quét lùi thêm chừng này giây
+# trước watermark, để không bỏ sót dòng của transaction commit chậm hơn load_time của nó.
+WATERMARK_LAG_SECONDS = int(os.getenv("DW_WATERMARK_LAG_SECONDS", 300))
+
+# Phân vùng songplays theo tháng: tháng đầu tiên có phân vùng riêng (dữ liệu cũ hơn
+# dồn vào phân vùng đầu) và số tháng tạo sẵn phía trước tháng hiện tại
+PARTITION_START_MONTH = os.getenv("DW_PARTITION_START_MONTH", "2018-01")
+PARTITION_MONTHS_AHEAD = int(os.getenv("DW_PARTITION_MONTHS_AHEAD", 3))
 
 # Schedules (document only — real scheduling via cron / task scheduler)
 SCHEDULE = {
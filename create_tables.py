@@ -1,6 +1,13 @@
+import argparse
+from datetime import date
 
-from db import create_connection
-from sql_queries import create_table_queries, drop_table_queries
+from db import connection, ensure_index
+from config import PARTITION_START_MONTH, PARTITION_MONTHS_AHEAD, DB_BACKEND
+from sql_queries import (
+    create_table_queries, drop_table_queries, secondary_indexes,
+    schema_migration_select, schema_migration_insert, songplay_missing_start_quarantine
+)
+from validation import MISSING_START_TIME
 
 def drop_tables(cur, conn):
     for q in drop_table_queries:
@@ -20,11 +27,128 @@ def create_tables(cur, conn):
         except Exception as e:
             print(f"Error creating table: {e}")
 
-def main():
-    cur, conn = create_connection()
-    drop_tables(cur, conn)
-    create_tables(cur, conn)
-    conn.close()
+# --- PHÂN VÙNG songplays THEO THÁNG ---
+
+def _month_start(year, month):
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+def partition_months(first=PARTITION_START_MONTH, months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """Các tháng (ngày đầu tháng) cần có phân vùng: từ `first` tới tháng hiện tại + months_ahead."""
+    today = today or date.today()
+    year, month = (int(x) for x in first.split("-"))
+    last = _month_start(today.year, today.month + months_ahead)
+    months = []
+    current = _month_start(year, month)
+    while current <= last:
+        months.append(current)
+        current = _month_start(current.year, current.month + 1)
+    return months
+
+def _partition_defs(months):
+    """pYYYYMM chứa dữ liệu < ngày đầu tháng kế tiếp; p_future hứng phần còn lại."""
+    defs = [
+        f"PARTITION p{m:%Y%m} VALUES LESS THAN ('{_month_start(m.year, m.month + 1):%Y-%m-%d}')"
+        for m in months
+    ]
+    defs.append("PARTITION p_future VALUES LESS THAN (MAXVALUE)")
+    return ", ".join(defs)
+
+def songplay_partitions(cur):
+    cur.execute(
+        "SELECT partition_name FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = 'songplays' AND partition_name IS NOT NULL"
+    )
+    return {row[0] for row in cur.fetchall()}
+
+def ensure_songplay_partitions(cur, conn, months=None):
+    """
+    Tách p_future thành các phân vùng tháng còn thiếu (sau tháng lớn nhất đã có).
+    p_future thường rỗng nên REORGANIZE gần như tức thời. Trả về số phân vùng tạo thêm.
+    Backend sqlite không có phân vùng.
+    """
+    if DB_BACKEND != "mysql":
+        return 0
+    existing = songplay_partitions(cur)
+    if "p_future" not in existing:
+        return 0
+    latest = max((p for p in existing if p != "p_future"), default=None)
+    missing = [m for m in (months or partition_months()) if latest is None or f"p{m:%Y%m}" > latest]
+    if not missing:
+        return 0
+    cur.execute(f"ALTER TABLE songplays REORGANIZE PARTITION p_future INTO ({_partition_defs(missing)})")
+    conn.commit()
+    print(f"Đã thêm {len(missing)} phân vùng tháng cho songplays.")
+    return len(missing)
+
+# --- MIGRATION (idempotent: chạy lại nhiều lần vẫn an toàn) ---
+
+def migrate_secondary_indexes(cur, conn):
+    for table, index, columns in secondary_indexes:
+        if ensure_index(cur, table, index, columns):
+            print(f"Created index {index} ON {table} ({columns})")
+
+def migrate_partition_songplays(cur, conn):
+    """Chuyển bảng songplays cũ (khóa chính songplay_id, có khóa ngoại) sang phân vùng theo tháng."""
+    if DB_BACKEND != "mysql" or songplay_partitions(cur):
+        return
+    # Bảng phân vùng không hỗ trợ khóa ngoại
+    cur.execute(
+        "SELECT constraint_name FROM information_schema.referential_constraints "
+        "WHERE constraint_schema = DATABASE() AND table_name = 'songplays'"
+    )
+    for (name,) in cur.fetchall():
+        cur.execute(f"ALTER TABLE songplays DROP FOREIGN KEY `{name}`")
+    # start_time vào khóa chính nên phải NOT NULL; dòng thiếu start_time không thuộc ngày nào:
+    # chép sang etl_rejects rồi mới xóa (cùng transaction) để không mất dữ liệu không dấu vết
+    cur.execute("SELECT COUNT(*) FROM songplays WHERE start_time IS NULL")
+    missing = cur.fetchone()[0]
+    if missing:
+        print(f"Chuyển {missing} songplays không có start_time sang etl_rejects "
+              f"(reason={MISSING_START_TIME}) trước khi đổi khóa chính.")
+        cur.execute(songplay_missing_start_quarantine, ("create_tables.001_partition_songplays", MISSING_START_TIME))
+        cur.execute("DELETE FROM songplays WHERE start_time IS NULL")
+    conn.commit()
+    cur.execute(
+        "ALTER TABLE songplays MODIFY start_time DATETIME NOT NULL, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (songplay_id, start_time)"
+    )
+    cur.execute(f"ALTER TABLE songplays PARTITION BY RANGE COLUMNS (start_time) "
+                f"({_partition_defs(partition_months())})")
+    print("Đã phân vùng songplays theo tháng.")
+
+# Thứ tự chạy; tên đã ghi trong schema_migrations sẽ được bỏ qua
+MIGRATIONS = [
+    ("001_partition_songplays", migrate_partition_songplays),
+    ("002_secondary_indexes", migrate_secondary_indexes),
+    # Index của bảng etl_rejects thêm sau (migration 002 đã chạy trên các DB cũ)
+    ("003_etl_rejects_index", migrate_secondary_indexes),
+]
+
+def run_migrations(cur, conn):
+    cur.execute(schema_migration_select)
+    applied = {row[0] for row in cur.fetchall()}
+    for version, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Migration {version}...")
+        migrate(cur, conn)
+        cur.execute(schema_migration_insert, (version,))
+        conn.commit()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tạo/nâng cấp schema warehouse.")
+    parser.add_argument("--drop", action="store_true",
+                        help="Xóa toàn bộ bảng rồi tạo lại (mặc định: chỉ tạo bảng thiếu và chạy migration)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with connection() as (cur, conn):
+        if args.drop:
+            drop_tables(cur, conn)
+        create_tables(cur, conn)
+        run_migrations(cur, conn)
+        ensure_songplay_partitions(cur, conn)
     print("Done create_tables")
 
 if __name__ == "__main__":
@@ -6,7 +6,12 @@ import plotly.graph_objects as go
 import subprocess
 import os
 import sys
-from db import create_connection
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db import connection, get_pool, pool_status
+from config import DB_CONFIG
+
+PAGE_STARTED = time.perf_counter()
 
 # --- CẤU HÌNH TRANG ---
 st.set_page_config(
@@ -32,23 +37,70 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- HÀM HỖ TRỢ ---
-@st.cache_data(ttl=300)
-def run_query(query, params=None):
-    """Chạy SQL query an toàn và trả về DataFrame."""
-    conn = None
-    try:
-        cur, conn = create_connection()
+@st.cache_resource
+def get_query_executor():
+    """
+    Tài nguyên dùng chung giữa các lần rerun/phiên: pool kết nối MySQL (tạo sẵn)
+    và thread pool chạy song song các truy vấn độc lập, mỗi thread mượn 1 kết nối.
+    """
+    get_pool()
+    return ThreadPoolExecutor(max_workers=DB_CONFIG.get("pool_size", 5), thread_name_prefix="dashboard-query")
+
+def _fetch(query, params=None):
+    """Chạy 1 query trên kết nối mượn từ pool; không gọi st.* để chạy được trong thread phụ."""
+    with connection() as (cur, conn):
         cur.execute(query, params or ())
         if cur.description:
             columns = [desc[0] for desc in cur.description]
-            data = cur.fetchall()
-            return pd.DataFrame(data, columns=columns)
+            return pd.DataFrame(cur.fetchall(), columns=columns)
         return pd.DataFrame()
+
+class PanelErrors(Exception):
+    """Có panel lỗi: mang theo kết quả từng phần, ném ra để st.cache_data không lưu lần chạy này."""
+
+    def __init__(self, frames, errors, query_ms):
+        super().__init__(errors)
+        self.frames, self.errors, self.query_ms = frames, errors, query_ms
+
+@st.cache_data(ttl=300)
+def _fetch_panels_cached(queries):
+    started = time.perf_counter()
+    executor = get_query_executor()
+    futures = {name: executor.submit(_fetch, query, params) for name, query, params in queries}
+    frames, errors = {}, {}
+    for name, future in futures.items():
+        try:
+            frames[name] = future.result()
+        except Exception as e:
+            frames[name] = pd.DataFrame()
+            errors[name] = str(e)
+    query_ms = (time.perf_counter() - started) * 1000
+    if errors:
+        # Lỗi DB thoáng qua không được giữ trong cache suốt TTL
+        raise PanelErrors(frames, errors, query_ms)
+    return frames, errors, query_ms
+
+def fetch_panels(queries):
+    """
+    Chạy song song các truy vấn độc lập của trang (chỉ cache khi mọi panel thành công).
+    queries: tuple (tên, sql, params); trả về (dict tên -> DataFrame, dict tên -> lỗi, số ms).
+    """
+    try:
+        return _fetch_panels_cached(queries)
+    except PanelErrors as e:
+        return e.frames, e.errors, e.query_ms
+
+@st.cache_data(ttl=300)
+def _run_query_cached(query, params=None):
+    return _fetch(query, params)
+
+def run_query(query, params=None):
+    """Chạy SQL query an toàn và trả về DataFrame (kết quả lỗi không được cache)."""
+    try:
+        return _run_query_cached(query, params)
     except Exception as e:
         st.error(f"Lỗi SQL: {e}")
         return pd.DataFrame()
-    finally:
-        if conn: conn.close()
 
 def run_script(script_name):
     """Hàm chạy script python từ giao diện."""
@@ -68,6 +120,57 @@ def run_script(script_name):
     except Exception as e:
         st.error(f"Không thể chạy script: {e}")
 
+# --- TRUY VẤN CỦA TRANG (độc lập nhau -> chạy song song một lượt) ---
+# Bộ lọc log đọc từ session_state để truy vấn log được gửi cùng lượt, trước khi vẽ radio
+log_filter = st.session_state.get("log_filter", "ALL")
+log_query = """
+    SELECT log_id, package_name, start_time, end_time, status,
+           rows_extracted, rows_loaded, batches_committed, error_message
+    FROM etl_logs
+    WHERE (%s = 'ALL' OR status = %s)
+    ORDER BY start_time DESC LIMIT 50
+"""
+PANEL_QUERIES = (
+    ("years", "SELECT DISTINCT year FROM time ORDER BY year DESC", None),
+    # Một dòng KPI tính sẵn bởi load_mart (không quét songplays/songs mỗi lần tải trang)
+    ("kpi", """
+        SELECT total_plays, total_users, total_songs, avg_song_duration
+        FROM mart_kpis WHERE id = 1
+    """, None),
+    ("trend", "SELECT date, total_plays FROM mart_daily_plays ORDER BY date", None),
+    ("map", """
+        SELECT name, location, latitude, longitude
+        FROM artists
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        LIMIT 500
+    """, None),
+    ("ua", """
+        SELECT os, CAST(SUM(plays) AS SIGNED) as count
+        FROM mart_device_plays
+        GROUP BY os
+    """, None),
+    # Đếm lượt nghe (songplays) theo thứ x giờ, tính sẵn trong mart_hourly_plays
+    ("heat", """
+        SELECT weekday, hour, CAST(SUM(plays) AS SIGNED) as plays
+        FROM mart_hourly_plays
+        GROUP BY weekday, hour
+    """, None),
+    ("logs", log_query, (log_filter, log_filter)),
+    ("perf", """
+        SELECT l.log_id, l.package_name, l.start_time, l.status,
+               m.seconds, m.rows_processed, m.rows_per_sec, m.peak_rss_mb
+        FROM etl_log_metrics m
+        JOIN etl_logs l ON l.log_id = m.log_id
+        WHERE m.phase = 'total'
+        ORDER BY l.start_time
+    """, None),
+)
+fetch_started = time.perf_counter()
+panels, panel_errors, query_ms = fetch_panels(PANEL_QUERIES)
+fetch_ms = (time.perf_counter() - fetch_started) * 1000
+for name, error in panel_errors.items():
+    st.error(f"Lỗi SQL ({name}): {error}")
+
 # --- SIDEBAR ---
 with st.sidebar:
     st.title("🎛️ Điều khiển")
@@ -79,11 +182,15 @@ with st.sidebar:
         default=["free", "paid"]
     )
     
-    df_years = run_query("SELECT DISTINCT year FROM time ORDER BY year DESC")
+    df_years = panels["years"]
     selected_year = st.selectbox("Chọn năm dữ liệu:", df_years['year']) if not df_years.empty else None
 
     st.markdown("---")
     st.caption("System Status: 🟢 Online")
+    pool = pool_status()
+    st.caption(f"DB pool: {pool['pool_size']} kết nối | lấy {pool['acquired']} lần | "
+               f"chờ TB {pool['wait_seconds'] / max(pool['waits'], 1) * 1000:.0f} ms | "
+               f"nối lại {pool['reconnects']}")
 
 # --- GIAO DIỆN CHÍNH ---
 st.title("🎧 Music Streaming Data Warehouse")
@@ -97,42 +204,19 @@ with tab1:
     st.markdown("### 📈 Chỉ số quan trọng (KPIs)")
     
     col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        # Sử dụng try-except để tránh lỗi nếu bảng chưa có dữ liệu
-        try:
-            count_plays = run_query("SELECT COUNT(*) as c FROM songplays").iloc[0]['c']
-            st.metric("Tổng lượt nghe", f"{count_plays:,}")
-        except:
-            st.metric("Tổng lượt nghe", "0")
-        
-    with col2:
-        try:
-            count_users = run_query("SELECT COUNT(*) as c FROM users").iloc[0]['c']
-            st.metric("Người dùng", f"{count_users}")
-        except:
-            st.metric("Người dùng", "0")
 
-    with col3:
-        try:
-            count_songs = run_query("SELECT COUNT(*) as c FROM songs").iloc[0]['c']
-            st.metric("Kho nhạc (Bài)", f"{count_songs:,}")
-        except:
-             st.metric("Kho nhạc (Bài)", "0")
+    df_kpi = panels["kpi"]
+    kpi = df_kpi.iloc[0] if not df_kpi.empty else {}
 
-    with col4:
-        try:
-            avg_duration = run_query("SELECT AVG(duration) as c FROM songs").iloc[0]['c']
-            val = avg_duration if avg_duration else 0
-            st.metric("Thời lượng TB", f"{round(val/60, 2)} phút")
-        except:
-             st.metric("Thời lượng TB", "0 phút")
+    col1.metric("Tổng lượt nghe", f"{int(kpi.get('total_plays') or 0):,}")
+    col2.metric("Người dùng", f"{int(kpi.get('total_users') or 0)}")
+    col3.metric("Kho nhạc (Bài)", f"{int(kpi.get('total_songs') or 0):,}")
+    col4.metric("Thời lượng TB", f"{round((kpi.get('avg_song_duration') or 0) / 60, 2)} phút")
 
     st.markdown("---")
 
     st.subheader("📅 Xu hướng lượt nghe theo thời gian")
-    trend_query = "SELECT date, total_plays FROM mart_daily_plays ORDER BY date"
-    df_trend = run_query(trend_query)
+    df_trend = panels["trend"]
     if not df_trend.empty:
         fig = px.area(df_trend, x='date', y='total_plays', 
                       title="Biểu đồ vùng: Số lượt nghe hàng ngày",
@@ -149,13 +233,7 @@ with tab2:
     
     with row1_col1:
         st.subheader("🗺️ Bản đồ phân bố Nghệ sĩ")
-        map_query = """
-            SELECT name, location, latitude, longitude
-            FROM artists 
-            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-            LIMIT 500
-        """
-        df_map = run_query(map_query)
+        df_map = panels["map"]
         if not df_map.empty:
             st.map(df_map, latitude='latitude', longitude='longitude')
         else:
@@ -163,20 +241,7 @@ with tab2:
 
     with row1_col2:
         st.subheader("🖥️ User Agent (Thiết bị)")
-        ua_query = """
-            SELECT 
-                CASE 
-                    WHEN user_agent LIKE '%Macintosh%' THEN 'Mac'
-                    WHEN user_agent LIKE '%Windows%' THEN 'Windows'
-                    WHEN user_agent LIKE '%Linux%' THEN 'Linux'
-                    WHEN user_agent LIKE '%iPhone%' THEN 'iPhone'
-                    ELSE 'Other'
-                END as os,
-                COUNT(*) as count
-            FROM songplays
-            GROUP BY os
-        """
-        df_ua = run_query(ua_query)
+        df_ua = panels["ua"]
         if not df_ua.empty:
             fig_donut = px.pie(df_ua, names='os', values='count', hole=0.4)
             st.plotly_chart(fig_donut, use_container_width=True)
@@ -186,12 +251,7 @@ with tab2:
     st.subheader("🔥 Heatmap: Thói quen nghe nhạc")
     st.caption("Trục dọc: Thứ trong tuần (0=Thứ 2), Trục ngang: Giờ trong ngày")
     
-    heat_query = """
-        SELECT weekday, hour, COUNT(*) as plays
-        FROM time
-        GROUP BY weekday, hour
-    """
-    df_heat = run_query(heat_query)
+    df_heat = panels["heat"]
     
     if not df_heat.empty:
         # Pivot table
@@ -252,20 +312,9 @@ with tab3:
     st.markdown("---")
     st.subheader("📝 Nhật ký hệ thống (ETL Logs)")
     
-    log_filter = st.radio("Trạng thái log:", ["ALL", "SUCCESS", "FAILED"], horizontal=True)
-    
-    base_log_query = """
-        SELECT log_id, package_name, start_time, end_time, status, 
-               rows_extracted, rows_loaded, error_message
-        FROM etl_logs
-    """
-    
-    if log_filter != "ALL":
-        base_log_query += f" WHERE status = '{log_filter}'"
-        
-    base_log_query += " ORDER BY start_time DESC LIMIT 50"
-    
-    df_logs = run_query(base_log_query)
+    st.radio("Trạng thái log:", ["ALL", "SUCCESS", "FAILED"], horizontal=True, key="log_filter")
+
+    df_logs = panels["logs"]
     
     if not df_logs.empty:
         st.dataframe(
@@ -282,6 +331,48 @@ with tab3:
     else:
         st.info("Chưa có log nào.")
 
+    st.markdown("---")
+    st.subheader("⏱️ Hiệu năng ETL (Throughput)")
+
+    df_perf = panels["perf"]
+
+    if not df_perf.empty:
+        perf_col1, perf_col2 = st.columns(2)
+        with perf_col1:
+            fig_tp = px.line(df_perf, x='start_time', y='rows_per_sec', color='package_name',
+                             markers=True, title="Rows/sec theo từng lần chạy")
+            st.plotly_chart(fig_tp, use_container_width=True)
+        with perf_col2:
+            fig_rss = px.line(df_perf, x='start_time', y='peak_rss_mb', color='package_name',
+                              markers=True, title="Peak RSS (MB)")
+            st.plotly_chart(fig_rss, use_container_width=True)
+
+        selected_pkg = st.selectbox("Chi tiết theo pha cho package:", sorted(df_perf['package_name'].unique()))
+        phase_query = """
+            SELECT m.log_id, m.phase, m.seconds
+            FROM etl_log_metrics m
+            JOIN etl_logs l ON l.log_id = m.log_id
+            WHERE l.package_name = %s AND m.phase <> 'total'
+            ORDER BY m.log_id DESC
+            LIMIT 200
+        """
+        df_phase = run_query(phase_query, (selected_pkg,))
+        if not df_phase.empty:
+            df_phase['log_id'] = df_phase['log_id'].astype(str)
+            fig_phase = px.bar(df_phase, x='log_id', y='seconds', color='phase',
+                               title=f"Thời gian theo pha: {selected_pkg}")
+            st.plotly_chart(fig_phase, use_container_width=True)
+    else:
+        st.info("Chưa có số liệu hiệu năng.")
+
 # Footer
 st.markdown("---")
-st.markdown("© 2024 Data Warehouse Project | Powered by **Streamlit** & **MySQL**")
\ No newline at end of file
+st.markdown("© 2024 Data Warehouse Project | Powered by **Streamlit** & **MySQL**")
+
+# Thời gian dựng trang (mục tiêu: tải nguội < 1 giây). query_ms là thời gian của lượt
+# truy vấn DB gần nhất; fetch_ms nhỏ hơn nhiều nghĩa là lần này lấy từ cache.
+render_ms = (time.perf_counter() - PAGE_STARTED) * 1000
+st.caption(f"⏱️ Render: {render_ms:.0f} ms | lấy dữ liệu: {fetch_ms:.0f} ms "
+           f"(lượt DB gần nhất: {len(PANEL_QUERIES)} câu song song trong {query_ms:.0f} ms)")
+if render_ms > 1000:
+    st.warning(f"Trang dựng chậm ({render_ms:.0f} ms > 1000 ms).")
\ No newline at end of file
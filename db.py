@@ -1,22 +1,182 @@
 # db.py
-import mysql.connector
-from mysql.connector import Error
-from config import DB_CONFIG
+import time
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
 
-def create_connection():
-    """Trả về (cursor, conn) giống mã cũ."""
+from mysql.connector import Error, pooling
+from mysql.connector.errors import PoolError, DataError, IntegrityError
+from config import DB_CONFIG, DB_BACKEND
+
+# Lỗi do dữ liệu của một dòng (sai kiểu, quá dài, trùng/thiếu khóa): chỉ câu lệnh đó hỏng,
+# transaction vẫn còn nên có thể ghi lại từng dòng để loại dòng lỗi. Lỗi khác (deadlock 1213,
+# lock wait timeout 1205, mất kết nối...) có thể đã rollback cả transaction nên phải ném lại.
+DATA_ERRORS = (DataError, IntegrityError)
+
+if DB_BACKEND == "sqlite":
+    import sqlite_backend
+    DATA_ERRORS += sqlite_backend.DATA_ERRORS
+
+# Bộ đếm tình trạng pool: số lần lấy kết nối, thời gian chờ, kết nối hỏng phải nối lại...
+POOL_STATS = {
+    "acquired": 0,
+    "released": 0,
+    "waits": 0,
+    "wait_seconds": 0.0,
+    "max_wait_seconds": 0.0,
+    "reconnects": 0,
+    "errors": 0,
+}
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_STATS_LOCK = threading.Lock()
+
+def get_pool():
+    """Tạo (một lần mỗi process) pool kết nối MySQL theo DB_CONFIG. Backend sqlite không dùng pool (None)."""
+    global _POOL
+    if DB_BACKEND == "sqlite":
+        return None
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                try:
+                    _POOL = pooling.MySQLConnectionPool(
+                        pool_name="dw_pool",
+                        pool_size=DB_CONFIG.get("pool_size", 5),
+                        host=DB_CONFIG["host"],
+                        user=DB_CONFIG["user"],
+                        password=DB_CONFIG["password"],
+                        database=DB_CONFIG["database"],
+                        port=DB_CONFIG.get("port", 3306),
+                        allow_local_infile=DB_CONFIG.get("allow_local_infile", False),
+                        autocommit=False
+                    )
+                    print(f"Ket noi thanh cong toi MySQL! (pool {_POOL.pool_size} ket noi)")
+                except Error as e:
+                    print(f"Loi ket noi DB: {e}")
+                    raise
+    return _POOL
+
+def _record(**changes):
+    with _STATS_LOCK:
+        for key, value in changes.items():
+            POOL_STATS[key] += value
+
+def acquire(timeout=None):
+    """
+    Lấy một kết nối từ pool; chờ (tối đa timeout giây) nếu pool đang hết.
+    Kết nối đã rớt sẽ được nối lại trước khi trả về.
+    Backend sqlite: mở một kết nối mới tới file CSDL (conn.close() đóng hẳn).
+    """
+    if DB_BACKEND == "sqlite":
+        _record(acquired=1)
+        return sqlite_backend.SQLiteConnection()
+    pool = get_pool()
+    timeout = DB_CONFIG.get("pool_timeout", 30) if timeout is None else timeout
+    started = time.perf_counter()
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except PoolError:
+            if time.perf_counter() - started >= timeout:
+                _record(errors=1)
+                raise
+            time.sleep(0.05)
+
+    waited = time.perf_counter() - started
+    with _STATS_LOCK:
+        POOL_STATS["acquired"] += 1
+        if waited > 0.001:
+            POOL_STATS["waits"] += 1
+            POOL_STATS["wait_seconds"] += waited
+            POOL_STATS["max_wait_seconds"] = max(POOL_STATS["max_wait_seconds"], waited)
+
+    if not conn.is_connected():
+        conn.reconnect(attempts=3, delay=1)
+        _record(reconnects=1)
+    return conn
+
+@contextmanager
+def connection(buffered=True):
+    """
+    Context manager trả về (cursor, conn) từ pool. Lỗi trong khối -> rollback;
+    kết nối luôn được trả về pool khi thoát (commit do nơi gọi quyết định).
+    buffered=False: kết quả chưa đọc hết khi lỗi được đọc bỏ trước khi trả kết nối về pool.
+    """
+    conn = acquire()
+    cur = conn.cursor(buffered=buffered)  # buffered để fetchone() an toàn
     try:
-        conn = mysql.connector.connect(
-            host=DB_CONFIG["host"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            database=DB_CONFIG["database"],
-            port=DB_CONFIG.get("port", 3306),
-            autocommit=False
-        )
-        cur = conn.cursor(buffered=True)  # buffered để fetchone() an toàn
-        print("Ket noi thanh cong toi MySQL!")
-        return cur, conn
-    except Error as e:
-        print(f"Loi ket noi DB: {e}")
+        yield cur, conn
+    except Exception:
+        if not buffered and DB_BACKEND != "sqlite":
+            try:
+                conn.consume_results()
+            except Error:
+                pass
+        try:
+            conn.rollback()
+        except Error:
+            pass
         raise
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()  # PooledMySQLConnection.close() = trả về pool
+            _record(released=1)
+
+def pool_status():
+    """Bộ đếm của pool kèm kích thước pool (để log / hiển thị trên dashboard)."""
+    status = dict(POOL_STATS)
+    status["pool_size"] = DB_CONFIG.get("pool_size", 5)
+    return status
+
+def ensure_column(cur, table, column, definition):
+    """Thêm cột vào bảng đã tồn tại nếu chưa có (cho các bảng tạo trước khi có cột này)."""
+    if DB_BACKEND == "sqlite":
+        if sqlite_backend.column_exists(cur, table, column):
+            return False
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    cur.execute(
+        "SELECT COUNT(*) FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column),
+    )
+    if cur.fetchone()[0] == 0:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
+def ensure_index(cur, table, index, columns):
+    """Tạo index nếu bảng chưa có index tên `index`."""
+    if DB_BACKEND == "sqlite":
+        if sqlite_backend.index_exists(cur, table, index):
+            return False
+        cur.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+        return True
+    cur.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index),
+    )
+    if cur.fetchone()[0] == 0:
+        cur.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+        return True
+    return False
+
+def to_date(value):
+    """Giá trị DATE/DATETIME đọc từ DB -> date (sqlite trả về chuỗi 'YYYY-MM-DD[ HH:MM:SS]')."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+def create_connection():
+    """Trả về (cursor, conn) giống mã cũ; conn lấy từ pool, conn.close() trả lại pool."""
+    conn = acquire()
+    cur = conn.cursor(buffered=True)  # buffered để fetchone() an toàn
+    return cur, conn
@@ -1,56 +1,147 @@
 # etl_logger.py
-from db import create_connection
-from sql_queries import etl_log_insert, etl_log_update_success, etl_log_update_fail
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from db import connection
+from sql_queries import (
+    etl_log_insert, etl_log_update_success, etl_log_update_fail, etl_log_metrics_insert
+)
+
+try:
+    import resource
+except ImportError:  # Windows không có module resource
+    resource = None
+
+def peak_rss_mb():
+    """Bộ nhớ RSS cao nhất của process hiện tại (MB), None nếu không đo được."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except Exception:
+        return None
+
+class PhaseTimer:
+    """
+    Cộng dồn thời gian và số dòng theo pha (parse, lookup, write, commit...).
+    Giữ thêm thời gian của từng lần gọi (tối đa max_samples lần gần nhất) để tính p50/p95 mỗi lô.
+    """
+
+    def __init__(self, max_samples=100000):
+        self.phases = {}
+        self.samples = {}
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, rows=0):
+        with self._lock:
+            total = self.phases.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += rows
+            self.samples.setdefault(name, deque(maxlen=self.max_samples)).append(seconds)
+
+    def percentile(self, name, q):
+        """Phân vị q (0-100) thời gian mỗi lần gọi của pha `name` (nội suy tuyến tính)."""
+        with self._lock:
+            values = sorted(self.samples.get(name, ()))
+        if not values:
+            return None
+        pos = (len(values) - 1) * q / 100
+        lo = int(pos)
+        hi = min(lo + 1, len(values) - 1)
+        return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+    @contextmanager
+    def track(self, name, rows=0):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started, rows)
 
 class ETLLogger:
-    def __init__(self, package_name):
+    """Ghi etl_logs; mỗi lần ghi mượn một kết nối từ pool rồi trả lại ngay."""
+
+    def __init__(self, package_name, timer=None):
         self.package_name = package_name
         self.log_id = None
-        self.cur = None
-        self.conn = None
+        self.timer = timer or PhaseTimer()
+        self.started = None
+        self.rejects = {}
+
+    def count_rejects(self, counts):
+        """Số dòng bị loại theo mã lý do (validation.Quarantine.counts), ghi vào etl_log_metrics."""
+        for reason, count in counts.items():
+            self.rejects[reason] = self.rejects.get(reason, 0) + count
 
     def start(self):
         """Bắt đầu ghi log: Trạng thái RUNNING"""
+        self.started = time.perf_counter()
         try:
-            self.cur, self.conn = create_connection()
-            self.cur.execute(etl_log_insert, (self.package_name,))
-            self.conn.commit()
-            self.log_id = self.cur.lastrowid
+            with connection() as (cur, conn):
+                cur.execute(etl_log_insert, (self.package_name,))
+                conn.commit()
+                self.log_id = cur.lastrowid
             print(f"[LOG STARTED] {self.package_name} (Log ID: {self.log_id})")
         except Exception as e:
             print(f"[LOG ERROR] Không thể khởi tạo log: {e}")
 
-    def log_success(self, extracted=0, loaded=0, rejected=0):
+    def phase(self, name, rows=0):
+        """Đo một pha: `with logger.phase("write", rows=n): ...`"""
+        return self.timer.track(name, rows)
+
+    def _metric_rows(self, loaded):
+        rows = [
+            (self.log_id, name, seconds, count, count / seconds if seconds > 0 else None, None)
+            for name, (seconds, count) in self.timer.phases.items()
+        ]
+        rows.extend((self.log_id, f"reject:{reason}", 0.0, count, None, None)
+                    for reason, count in self.rejects.items())
+        total = time.perf_counter() - self.started if self.started else 0.0
+        rows.append((self.log_id, "total", total, loaded,
+                     loaded / total if total > 0 else None, peak_rss_mb()))
+        return rows
+
+    def _write_metrics(self, cur, loaded):
+        try:
+            cur.executemany(etl_log_metrics_insert, self._metric_rows(loaded))
+        except Exception as e:
+            print(f"[LOG ERROR] Không ghi được metrics: {e}")
+
+    def log_success(self, extracted=0, loaded=0, rejected=0, batches=0):
         """Ghi nhận thành công: Trạng thái SUCCESS"""
-        if not self.log_id or not self.conn:
+        if not self.log_id:
             return
         try:
-            self.cur.execute(etl_log_update_success, (extracted, loaded, rejected, self.log_id))
-            self.conn.commit()
-            print(f"[LOG SUCCESS] Extracted: {extracted}, Loaded: {loaded}, Rejected: {rejected}")
+            with connection() as (cur, conn):
+                cur.execute(etl_log_update_success, (extracted, loaded, rejected, batches, self.log_id))
+                self._write_metrics(cur, loaded)
+                conn.commit()
+            print(f"[LOG SUCCESS] Extracted: {extracted}, Loaded: {loaded}, Rejected: {rejected}, Batches: {batches}")
         except Exception as e:
             print(f"[LOG ERROR] Lỗi khi update success: {e}")
-        finally:
-            self.close()
 
-    def log_fail(self, error_message):
+    def log_fail(self, error_message, batches=0):
         """Ghi nhận thất bại: Trạng thái FAILED"""
-        if not self.log_id or not self.conn:
+        if not self.log_id:
             return
         try:
             # Cắt lỗi nếu quá dài để tránh lỗi DB
             err_str = str(error_message)[:5000]
-            self.cur.execute(etl_log_update_fail, (err_str, self.log_id))
-            self.conn.commit()
+            with connection() as (cur, conn):
+                cur.execute(etl_log_update_fail, (err_str, batches, self.log_id))
+                self._write_metrics(cur, 0)
+                conn.commit()
             print(f"[LOG FAILED] Đã ghi nhận lỗi vào DB.")
         except Exception as e:
             print(f"[LOG ERROR] Lỗi khi update fail: {e}")
-        finally:
-            self.close()
 
     def close(self):
-        if self.conn:
-            try:
-                self.conn.close()
-            except:
-                pass
\ No newline at end of file
+        """Giữ cho tương thích: logger không còn giữ kết nối riêng."""
+        pass
@@ -1,47 +1,134 @@
 # extraction/extract.py
 import os
-import tarfile
-from config import SONG_DATA_DIR
 import sys
+import json
+import argparse
+import tarfile
+from config import SONG_DATA_DIR, SONG_ARCHIVE_PATH, SONG_SOURCE
 
 # Thêm đường dẫn để import được etl_logger từ thư mục cha
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from etl_logger import ETLLogger
+from extraction.h5_catalog import load_catalog
+
+# Manifest các member đã giải nén, nằm cạnh dữ liệu trong thư mục đích
+MANIFEST_NAME = ".archive_manifest.json"
+
+def _read_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def _archive_signature(tar_path):
+    st = os.stat(tar_path)
+    return {"path": os.path.abspath(tar_path), "size": st.st_size, "mtime": st.st_mtime}
+
+def _on_disk(dest, size, mtime):
+    try:
+        st = os.stat(dest)
+    except OSError:
+        return False
+    return st.st_size == size and int(st.st_mtime) == int(mtime)
+
+def _safe_dest(extract_to, name):
+    """Đường dẫn đích của member; chặn member kiểu ../ hoặc đường dẫn tuyệt đối."""
+    root = os.path.realpath(extract_to)
+    dest = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, dest]) != root:
+        raise ValueError(f"Member nằm ngoài thư mục đích: {name}")
+    return dest
+
+def extract_incremental(tar_path, extract_to):
+    """
+    Đọc archive theo luồng (không getmembers()), chỉ ghi member chưa có trên đĩa
+    hoặc khác size/mtime, rồi ghi manifest các member. Archive không đổi và mọi
+    file trong manifest còn nguyên thì không mở archive. Trả về (tổng số file, số file đã ghi).
+    """
+    manifest_path = os.path.join(extract_to, MANIFEST_NAME)
+    signature = _archive_signature(tar_path)
+    manifest = _read_manifest(manifest_path)
+    if manifest and manifest.get("archive") == signature:
+        members = manifest.get("members", {})
+        if all(_on_disk(_safe_dest(extract_to, n), s, m) for n, (s, m) in members.items()):
+            print(f"Archive khong doi, {len(members)} file da co san -> bo qua giai nen.")
+            return len(members), 0
+
+    members = {}
+    written = 0
+    with tarfile.open(tar_path, "r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            dest = _safe_dest(extract_to, member.name)
+            members[member.name] = [member.size, member.mtime]
+            if _on_disk(dest, member.size, member.mtime):
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp_path = dest + ".part"
+            with tar.extractfile(member) as src, open(tmp_path, "wb") as out:
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.replace(tmp_path, dest)
+            os.utime(dest, (member.mtime, member.mtime))
+            written += 1
 
-def main():
+    _write_manifest(manifest_path, {"archive": signature, "members": members})
+    print(f"Da giai nen {written} file moi/thay doi, bo qua {len(members) - written} file khong doi.")
+    return len(members), written
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Giải nén (tăng dần) Million Song Subset.")
+    parser.add_argument("--archive", default=SONG_ARCHIVE_PATH,
+                        help="File tar(.gz) nguồn (mặc định DW_SONG_ARCHIVE)")
+    parser.add_argument("--in-memory", action="store_true", default=SONG_SOURCE == "archive",
+                        help="Không giải nén: parse member .h5 thẳng từ luồng tar vào cache catalog "
+                             "(mặc định bật khi DW_SONG_SOURCE=archive)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     # Khởi tạo logger
     logger = ETLLogger("extraction.extract")
     logger.start()
 
-    # Đường dẫn file nén (Đảm bảo đường dẫn này đúng trên máy bạn)
-    tar_path = r"D:\DW\millionsongsubset.tar.gz" 
+    tar_path = args.archive
     extract_to = SONG_DATA_DIR
-    
+
     try:
         # --- ĐÃ SỬA: Dùng tiếng Việt không dấu hoặc tiếng Anh ---
-        print("=== BAT DAU EXTRACT (Starting Extract) ===") 
-        
+        print("=== BAT DAU EXTRACT (Starting Extract) ===")
+
         if not os.path.exists(tar_path):
             raise FileNotFoundError(f"File not found: {tar_path}")
 
-        os.makedirs(extract_to, exist_ok=True)
-        
-        file_count = 0
-        with tarfile.open(tar_path, "r") as tar:
-            # Đếm số file sẽ giải nén
-            members = tar.getmembers()
-            file_count = len(members)
-            tar.extractall(path=extract_to)
-            print(f"Da giai nen xong: {tar_path}")
+        if args.in_memory:
+            # Dựng sẵn cache catalog để load_staging / load_warehouse đọc lại
+            catalog = load_catalog(archive_path=tar_path)
+            file_count, written = len(catalog), 0
+        else:
+            os.makedirs(extract_to, exist_ok=True)
+            file_count, written = extract_incremental(tar_path, extract_to)
+        print(f"Da xu ly xong: {tar_path}")
 
         # Ghi log thành công
-        logger.log_success(extracted=file_count, loaded=0, rejected=0)
+        logger.log_success(extracted=file_count, loaded=written, rejected=0)
 
     except Exception as e:
         # --- ĐÃ SỬA: In lỗi không dấu ---
         print(f"Error: {e}")
         logger.log_fail(e)
-        raise 
+        raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,270 @@
+# extraction/h5_catalog.py
+"""
+Một lượt đọc H5 dùng chung cho load_staging và load_warehouse.
+
+Mỗi file .h5 trong SONG_DATA_DIR thành một dòng của bảng catalog (song + artist),
+được cache ra Parquet tại SONG_CACHE_PATH. Lần chạy sau chỉ parse lại những file
+mới hoặc có size/mtime khác với bản cache; file đã bị xóa sẽ rơi khỏi cache.
+Không có pyarrow/fastparquet thì vẫn parse bình thường, chỉ không ghi cache.
+
+Với DW_SONG_SOURCE=archive, catalog được đọc thẳng từ file tar (SONG_ARCHIVE_PATH):
+member .h5 được parse từ bộ nhớ, không giải nén ra đĩa; file_path khi đó có dạng
+<archive>/<tên member>. Archive không đổi size/mtime thì dùng luôn cache.
+"""
+import io
+import os
+import glob
+import json
+import tarfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import h5py
+
+from config import SONG_DATA_DIR, SONG_CACHE_PATH, H5_WORKERS, SONG_SOURCE, SONG_ARCHIVE_PATH
+
+SONG_COLUMNS = ["song_id", "title", "artist_id", "year", "duration"]
+ARTIST_COLUMNS = ["artist_id", "artist_name", "artist_location", "artist_latitude", "artist_longitude"]
+CATALOG_COLUMNS = (["file_path", "file_size", "file_mtime", "ok"]
+                   + SONG_COLUMNS + ARTIST_COLUMNS[1:])
+
+def get_h5_value(h5_group, field_name, index=0, default_val=None):
+    """
+    Trích xuất an toàn một giá trị từ nhóm H5,
+    xử lý các trường bị thiếu và giải mã bytes.
+    """
+    try:
+        value = h5_group[field_name][index]
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        # Chuyển đổi các kiểu dữ liệu của numpy (như np.float64)
+        # sang kiểu gốc của Python (float)
+        if hasattr(value, 'item'):
+            return value.item()
+        return value
+    except (KeyError, IndexError, TypeError, ValueError):
+        # Trả về giá trị mặc định nếu không tìm thấy trường
+        return default_val
+
+def parse_song_file(filepath):
+    """
+    Đọc 1 file H5 thành dict các cột của catalog. File lỗi hoặc thiếu
+    song_id/artist_id vẫn trả về một dòng với ok=False để được cache lại.
+    """
+    st = os.stat(filepath)
+    return _parse_h5(filepath, filepath, st.st_size, st.st_mtime)
+
+def parse_song_bytes(item):
+    """Như parse_song_file cho member của tar đã đọc vào bộ nhớ: item = (path, bytes, size, mtime)."""
+    path, data, size, mtime = item
+    return _parse_h5(io.BytesIO(data), path, size, mtime)
+
+def _parse_h5(source, filepath, size, mtime):
+    record = dict.fromkeys(CATALOG_COLUMNS)
+    record.update(file_path=filepath, file_size=size, file_mtime=mtime, ok=False)
+    try:
+        with h5py.File(source, 'r') as f:
+            metadata_songs = f.get('metadata', {}).get('songs', {})
+            analysis_songs = f.get('analysis', {}).get('songs', {})
+
+            year = get_h5_value(metadata_songs, 'year', default_val=0)
+            duration = get_h5_value(analysis_songs, 'duration', default_val=None)
+            latitude = get_h5_value(metadata_songs, 'artist_latitude', default_val=None)
+            longitude = get_h5_value(metadata_songs, 'artist_longitude', default_val=None)
+            record.update(
+                song_id=get_h5_value(metadata_songs, 'song_id', default_val=None),
+                title=get_h5_value(metadata_songs, 'title', default_val=None),
+                artist_id=get_h5_value(metadata_songs, 'artist_id', default_val=None),
+                year=int(year) if year else None,
+                duration=float(duration) if duration is not None else None,
+                artist_name=get_h5_value(metadata_songs, 'artist_name', default_val=None),
+                artist_location=get_h5_value(metadata_songs, 'artist_location', default_val=None),
+                artist_latitude=float(latitude) if latitude is not None else None,
+                artist_longitude=float(longitude) if longitude is not None else None,
+            )
+            record["ok"] = bool(record["song_id"] and record["artist_id"])
+    except Exception as e:
+        print(f"Lỗi khi đọc file H5 {filepath}: {e}")
+    return record
+
+def list_song_files(data_dir=SONG_DATA_DIR):
+    all_files = []
+    for root, dirs, files in os.walk(data_dir):
+        for f in glob.glob(os.path.join(root, "*.h5")):
+            all_files.append(os.path.abspath(f))
+    return all_files
+
+def _read_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        return pd.read_parquet(cache_path)
+    except Exception as e:
+        print(f"[H5 CACHE] Không đọc được cache {cache_path}: {e}")
+        return None
+
+def _write_cache(catalog, cache_path):
+    # File tạm riêng cho mỗi lần ghi (cùng thư mục để os.replace là atomic):
+    # hai process ghi cache cùng lúc không ghi đè file tạm của nhau
+    tmp_path = None
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix="." + os.path.basename(cache_path) + ".",
+                                        suffix=".tmp")
+        os.close(fd)
+        catalog.to_parquet(tmp_path, index=False)
+        # mkstemp tạo file 0600; trả về quyền mặc định theo umask như file ghi thường
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+    except ImportError as e:
+        print(f"[H5 CACHE] Bỏ qua ghi cache (thiếu thư viện Parquet): {e}")
+    except OSError as e:
+        print(f"[H5 CACHE] Không ghi được cache {cache_path}: {e}")
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _parse_files(files, workers):
+    if workers > 1 and len(files) > 1:
+        chunksize = max(1, min(64, len(files) // (workers * 4) or 1))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(parse_song_file, files, chunksize=chunksize))
+    return [parse_song_file(f) for f in files]
+
+def default_archive():
+    """Archive nguồn khi DW_SONG_SOURCE=archive; None nếu đọc thư mục song_data đã giải nén."""
+    return SONG_ARCHIVE_PATH if SONG_SOURCE == "archive" else None
+
+def catalog_signatures(catalog):
+    """
+    {file_path: (size, mtime)} cho FileManifest.pending khi catalog đọc từ archive
+    (member không có trên đĩa để stat/băm); None với catalog đọc từ thư mục.
+    """
+    if default_archive() is None:
+        return None
+    return dict(zip(catalog["file_path"], zip(catalog["file_size"], catalog["file_mtime"])))
+
+def _archive_signature(archive_path):
+    st = os.stat(archive_path)
+    return {"archive": os.path.abspath(archive_path), "size": st.st_size, "mtime": st.st_mtime}
+
+def _read_marker(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _finish_catalog(catalog):
+    catalog["ok"] = catalog["ok"].astype(bool)
+    catalog["year"] = catalog["year"].astype("Int64")
+    return catalog
+
+def load_archive_catalog(archive_path, cache_path=SONG_CACHE_PATH, workers=H5_WORKERS, use_cache=True,
+                         batch_size=512):
+    """
+    Catalog từ các member .h5 của một file tar, đọc tuần tự từ luồng nén (không giải nén ra đĩa).
+    Member có cùng size/mtime với cache thì không đọc nội dung; member mới/đổi được parse
+    theo từng lô batch_size (song song nếu workers > 1) để bộ nhớ không phụ thuộc kích thước archive.
+    """
+    signature = _archive_signature(archive_path)
+    marker = cache_path + ".archive.json"
+    cached = _read_cache(cache_path) if use_cache else None
+    prefix = os.path.join(archive_path, "")
+    if (cached is not None and _read_marker(marker) == signature
+            and cached["file_path"].str.startswith(prefix).all()):
+        print(f"[H5 CACHE] Archive {archive_path} không đổi, dùng cache ({len(cached)} bài).")
+        return _finish_catalog(cached[CATALOG_COLUMNS].copy())
+
+    known = {}
+    if cached is not None:
+        known = {(r.file_path, r.file_size, r.file_mtime): i for i, r in enumerate(cached.itertuples(index=False))}
+
+    kept, parsed, batch = [], [], []
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def flush():
+        if batch:
+            parsed.extend(pool.map(parse_song_bytes, batch) if pool else map(parse_song_bytes, batch))
+            batch.clear()
+
+    try:
+        with tarfile.open(archive_path, "r|*") as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith(".h5"):
+                    continue
+                path = os.path.join(archive_path, member.name)
+                hit = known.get((path, member.size, float(member.mtime)))
+                if hit is not None:
+                    kept.append(hit)
+                    continue
+                batch.append((path, tar.extractfile(member).read(), member.size, float(member.mtime)))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+    finally:
+        if pool:
+            pool.shutdown()
+
+    print(f"[H5 CACHE] Archive {archive_path}: {len(kept)} member lấy từ cache, {len(parsed)} member đã parse.")
+    frames = [pd.DataFrame(parsed, columns=CATALOG_COLUMNS)]
+    if kept:
+        frames.insert(0, cached.iloc[kept][CATALOG_COLUMNS])
+    catalog = _finish_catalog(pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0])
+
+    if use_cache:
+        _write_cache(catalog, cache_path)
+        with open(marker, "w", encoding="utf-8") as f:
+            json.dump(signature, f)
+    return catalog
+
+def load_catalog(data_dir=SONG_DATA_DIR, cache_path=SONG_CACHE_PATH, workers=H5_WORKERS, use_cache=True,
+                 archive_path=None):
+    """
+    Trả về DataFrame catalog (CATALOG_COLUMNS) cho mọi file .h5 trong data_dir,
+    chỉ parse những file chưa có trong cache hoặc đã đổi size/mtime.
+    archive_path (mặc định theo DW_SONG_SOURCE): đọc từ file tar thay cho data_dir.
+    """
+    archive_path = archive_path or default_archive()
+    if archive_path:
+        return load_archive_catalog(archive_path, cache_path, workers, use_cache)
+
+    files = list_song_files(data_dir)
+    cached = _read_cache(cache_path) if use_cache else None
+
+    stale = files
+    fresh = None
+    if cached is not None:
+        current = pd.DataFrame({"file_path": files}, dtype=object)
+        current["file_size"] = [os.stat(f).st_size for f in files]
+        current["file_mtime"] = [os.stat(f).st_mtime for f in files]
+        fresh = cached.merge(current, on=["file_path", "file_size", "file_mtime"], how="inner")
+        stale = sorted(set(files) - set(fresh["file_path"]))
+
+    print(f"[H5 CACHE] {len(files)} file H5, {len(files) - len(stale)} lấy từ cache, "
+          f"{len(stale)} cần parse ({workers} workers).")
+    parsed = pd.DataFrame(_parse_files(stale, workers), columns=CATALOG_COLUMNS)
+    if fresh is None or fresh.empty:
+        catalog = parsed
+    elif parsed.empty:
+        catalog = fresh[CATALOG_COLUMNS].copy()
+    else:
+        catalog = pd.concat([fresh[CATALOG_COLUMNS], parsed], ignore_index=True)
+    catalog = _finish_catalog(catalog)
+
+    if use_cache and (stale or cached is None or len(fresh) != len(cached)):
+        _write_cache(catalog, cache_path)
+    return catalog
+
+def song_frame(catalog):
+    """Các cột theo đúng thứ tự song_table_insert."""
+    return catalog.loc[catalog["ok"], SONG_COLUMNS]
+
+def artist_frame(catalog):
+    """Các cột theo đúng thứ tự artist_table_insert (artist_id, name, location, latitude, longitude)."""
+    return catalog.loc[catalog["ok"], ARTIST_COLUMNS]
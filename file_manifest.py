@@ -0,0 +1,94 @@
+# file_manifest.py
+import os
+import hashlib
+
+from config import STAGING_DATA_DIR
+from sql_queries import file_manifest_select, file_manifest_upsert
+
+def file_hash(filepath, chunk_size=1 << 20):
+    """SHA-256 nội dung file, đọc theo từng khối."""
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class FileManifest:
+    """
+    Bảng file_manifest cho một stage (vd. "load_staging.log"): chỉ trả về các
+    file mới hoặc đã đổi nội dung so với lần nạp trước.
+
+    - So size/mtime trước; chỉ băm lại nội dung khi size/mtime khác.
+    - mark() ghi manifest trên cùng connection với dữ liệu nên được commit/rollback
+      cùng transaction của CommitPolicy.
+    - full_reload=True: bỏ qua manifest cũ, nạp lại mọi file (vẫn ghi manifest mới).
+    """
+
+    def __init__(self, cur, conn, stage, full_reload=False, base_dir=STAGING_DATA_DIR):
+        self.cur = cur
+        self.conn = conn
+        self.stage = stage
+        self.full_reload = full_reload
+        self.base_dir = base_dir
+        self.known = {}
+        self._signatures = {}
+
+    def _key(self, filepath):
+        return os.path.relpath(filepath, self.base_dir)
+
+    def load(self):
+        if not self.full_reload:
+            self.cur.execute(file_manifest_select, (self.stage,))
+            self.known = {row[0]: tuple(row[1:]) for row in self.cur.fetchall()}
+        return self
+
+    def pending(self, all_files, signatures=None):
+        """
+        Lọc danh sách file, giữ lại file mới hoặc đã thay đổi.
+        signatures: {path: (size, mtime)} cho các "file" không có trên đĩa (member của tar);
+        với chúng chỉ so size/mtime, không băm nội dung.
+        """
+        result = []
+        touched = 0
+        for filepath in all_files:
+            if signatures is not None and filepath in signatures:
+                size, mtime = signatures[filepath]
+                size, mtime = int(size), float(mtime)
+                known = self.known.get(self._key(filepath))
+                if known is None or known[0] != size or known[1] != mtime:
+                    self._signatures[filepath] = (size, mtime, None)
+                    result.append(filepath)
+                continue
+            st = os.stat(filepath)
+            size, mtime = st.st_size, st.st_mtime
+            known = self.known.get(self._key(filepath))
+            if known is not None and known[0] == size and known[1] == mtime:
+                continue
+            digest = file_hash(filepath)
+            self._signatures[filepath] = (size, mtime, digest)
+            if known is not None and known[2] == digest:
+                # Chỉ đổi mtime (copy lại, touch...): cập nhật chữ ký, giữ trạng thái và số dòng
+                # của lần nạp thật, không nạp lại
+                status, rows_loaded, rows_rejected = known[3:6]
+                self.cur.execute(file_manifest_upsert, (
+                    self.stage, self._key(filepath), size, mtime, digest, status, rows_loaded, rows_rejected))
+                touched += 1
+                continue
+            result.append(filepath)
+        if touched:
+            self.conn.commit()
+        skipped = len(all_files) - len(result)
+        if skipped:
+            print(f"[MANIFEST] {self.stage}: bỏ qua {skipped} file đã nạp, còn {len(result)} file mới/thay đổi.")
+        return result
+
+    def mark(self, filepath, rows_loaded=0, rows_rejected=0, status="LOADED", cur=None):
+        """cur: ghi trên cursor khác (vd. kết nối của một làn pipeline) để cùng transaction với dữ liệu."""
+        size, mtime, digest = self._signatures.get(filepath) or self._signature(filepath)
+        (cur or self.cur).execute(file_manifest_upsert, (
+            self.stage, self._key(filepath), size, mtime, digest, status, rows_loaded, rows_rejected))
+
+    @staticmethod
+    def _signature(filepath):
+        st = os.stat(filepath)
+        return st.st_size, st.st_mtime, file_hash(filepath)
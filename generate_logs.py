@@ -1,53 +1,220 @@
 # generate_logs.py
-import json
+"""
+Sinh dữ liệu giả lập có thể phóng to: catalog bài hát (file H5 giống Million Song)
+và log nghe nhạc JSON-lines mà song/artist/length khớp đúng với catalog đó.
+
+File H5 và log mặc định ghi vào data/synthetic/song_data và data/synthetic/log_data để không
+lẫn vào / ghi đè dữ liệu thật; muốn load_staging đọc chúng thì thêm --into-song-data
+(ghi cả hai vào song_data và log_data, log khi đó khớp với catalog giả lập).
+
+Ví dụ:
+    python generate_logs.py                                   # 5 ngày x 50 sự kiện như trước
+    python generate_logs.py --days 30 --events-per-day 2000000 --users 50000 \\
+        --catalog-size 200000 --zipf 1.2 --seed 7 --workers 16
+    python generate_logs.py --into-song-data                  # ghi thẳng vào song_data + log_data
+"""
+import argparse
 import os
-import random
 import time
-from config import LOG_DATA_DIR
-
-def generate_log_data():
-    # Tạo thư mục nếu chưa có
-    if not os.path.exists(LOG_DATA_DIR):
-        os.makedirs(LOG_DATA_DIR)
-        print(f"Đã tạo thư mục: {LOG_DATA_DIR}")
-
-    print(f"=== BẮT ĐẦU TẠO LOG GIẢ LẬP TẠI: {LOG_DATA_DIR} ===")
-    
-    # Tạo 5 file log giả
-    for i in range(1, 6):
-        filename = f"2018-11-{i:02d}-events.json"
-        filepath = os.path.join(LOG_DATA_DIR, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            # Mỗi file có 50 dòng log (sự kiện)
-            for _ in range(50):
-                # Cấu trúc khớp với process_log_file trong load_staging.py
-                event = {
-                    "artist": "Synthesized Artist",
-                    "auth": "Logged In",
-                    "firstName": "User",
-                    "gender": random.choice(["M", "F"]),
-                    "itemInSession": random.randint(0, 50),
-                    "lastName": f"Test{random.randint(1,100)}",
-                    "length": random.uniform(100, 300),
-                    "level": random.choice(["free", "paid"]),
-                    "location": "Vietnam",
-                    "method": "PUT",
-                    "page": "NextSong",  # Quan trọng: process_log_file chỉ lấy NextSong
-                    "registration": 1541000000000,
-                    "sessionId": random.randint(100, 999),
-                    "song": "Synthesized Song",
-                    "status": 200,
-                    "ts": int(time.time() * 1000), # Thời gian hiện tại (ms)
-                    "userAgent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
-                    "userId": str(random.randint(1, 20))
-                }
-                # Ghi dạng JSON Lines (mỗi dòng 1 json object)
-                f.write(json.dumps(event) + "\n")
-        
-        print(f"-> Đã tạo file: {filename}")
-
-    print("=== HOÀN TẤT TẠO DỮ LIỆU LOG ===")
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import h5py
+
+from config import LOG_DATA_DIR, SONG_DATA_DIR, SYNTHETIC_LOG_DATA_DIR, SYNTHETIC_SONG_DATA_DIR
+
+FIRST_NAMES = ["Anh", "Binh", "Chi", "Dung", "Giang", "Hoa", "Khanh", "Linh", "Minh", "Nam", "Phuong", "Quan"]
+LAST_NAMES = ["Nguyen", "Tran", "Le", "Pham", "Hoang", "Vu", "Dang", "Bui", "Do", "Ngo"]
+LOCATIONS = ["Ha Noi", "Ho Chi Minh", "Da Nang", "Hai Phong", "Can Tho", "Hue", "Nha Trang"]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)",
+    "Mozilla/5.0 (X11; Linux x86_64)",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X)",
+    "Mozilla/5.0 (Linux; Android 13)",
+]
+OTHER_PAGES = np.array(["Home", "Settings", "Help", "Logout"])
+NEXT_SONG_RATIO = 0.9
+EVENTS_PER_CHUNK = 500_000
+
+SONG_DTYPE = [
+    ("song_id", "S18"), ("title", "S64"), ("artist_id", "S18"), ("artist_name", "S64"),
+    ("artist_location", "S32"), ("artist_latitude", "f8"), ("artist_longitude", "f8"), ("year", "i4"),
+]
+
+def build_catalog(catalog_size, seed):
+    """Catalog xác định theo seed; ~4 bài mỗi nghệ sĩ."""
+    rng = np.random.default_rng(seed)
+    n_artists = max(1, catalog_size // 4)
+    artist_idx = rng.integers(0, n_artists, catalog_size)
+    artist_loc = rng.integers(0, len(LOCATIONS), n_artists)
+    return pd.DataFrame({
+        "track_id": [f"TRSYN{i:013d}" for i in range(catalog_size)],
+        "song_id": [f"SOSYN{i:013d}" for i in range(catalog_size)],
+        "title": [f"Synthetic Song {i}" for i in range(catalog_size)],
+        "artist_id": [f"ARSYN{a:013d}" for a in artist_idx],
+        "artist_name": [f"Synthetic Artist {a}" for a in artist_idx],
+        "artist_location": np.array(LOCATIONS)[artist_loc[artist_idx]],
+        "artist_latitude": np.round(rng.uniform(8.5, 23.3, n_artists), 4)[artist_idx],
+        "artist_longitude": np.round(rng.uniform(102.1, 109.4, n_artists), 4)[artist_idx],
+        "year": rng.integers(1960, 2019, catalog_size),
+        # 5 chữ số thập phân như dữ liệu MSD; đọc lại bằng precise_float sẽ khớp tuyệt đối
+        "duration": np.round(rng.uniform(60, 600, catalog_size), 5),
+    })
+
+def write_h5_chunk(catalog, song_dir):
+    """Ghi mỗi bài thành 1 file H5 theo cấu trúc song_data/A/B/C/TR....h5."""
+    for row in catalog.itertuples(index=False):
+        folder = os.path.join(song_dir, *row.track_id[-3:])
+        os.makedirs(folder, exist_ok=True)
+        with h5py.File(os.path.join(folder, f"{row.track_id}.h5"), "w") as f:
+            meta = np.array([(
+                row.song_id.encode(), row.title.encode(), row.artist_id.encode(), row.artist_name.encode(),
+                row.artist_location.encode(), row.artist_latitude, row.artist_longitude, row.year,
+            )], dtype=SONG_DTYPE)
+            f.create_group("metadata").create_dataset("songs", data=meta)
+            f.create_group("analysis").create_dataset("songs", data=np.array([(row.duration,)], dtype=[("duration", "f8")]))
+    return len(catalog)
+
+# --- Trạng thái của mỗi worker sinh log (nạp một lần qua initializer) ---
+_CATALOG = {}
+
+def _init_log_worker(titles, artists, durations, zipf_s, seed):
+    n = len(titles)
+    # Độ phổ biến Zipf: bài hạng r có trọng số 1 / r^s; hạng được xáo theo seed
+    ranks = np.random.default_rng(seed).permutation(n) + 1
+    weights = 1.0 / np.power(ranks, zipf_s)
+    _CATALOG.update(titles=titles, artists=artists, durations=durations,
+                    cdf=np.cumsum(weights) / weights.sum())
+
+def _pick_songs(rng, size):
+    idx = np.searchsorted(_CATALOG["cdf"], rng.random(size), side="right")
+    return np.minimum(idx, len(_CATALOG["cdf"]) - 1)
+
+def generate_day(day_index, day, events, user_count, seed, log_dir):
+    """Sinh 1 file log cho 1 ngày, ghi theo từng khối để giới hạn bộ nhớ."""
+    rng = np.random.default_rng([seed, day_index])
+    day_start_ms = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+    path = os.path.join(log_dir, f"{day:%Y-%m-%d}-events.json")
+    items_so_far = np.zeros(user_count + 1, dtype=np.int64)
+    n_chunks = max(1, -(-events // EVENTS_PER_CHUNK))
+    window = 86_400_000 // n_chunks
+
+    with open(path, "w", encoding="utf-8") as f:
+        for k in range(n_chunks):
+            n = events // n_chunks + (1 if k < events % n_chunks else 0)
+            if n == 0:
+                continue
+            ts = np.sort(day_start_ms + k * window + rng.integers(0, window, n))
+            uid = rng.integers(1, user_count + 1, n)
+            is_song = rng.random(n) < NEXT_SONG_RATIO
+            song_idx = _pick_songs(rng, n)
+
+            # itemInSession tăng dần theo từng phiên (1 phiên / user / ngày), nối tiếp giữa các khối
+            order = pd.Series(uid).groupby(uid).cumcount().to_numpy()
+            item = items_so_far[uid] + order
+            np.add.at(items_so_far, uid, 1)
+
+            df = pd.DataFrame({
+                "artist": np.where(is_song, _CATALOG["artists"][song_idx], None),
+                "auth": "Logged In",
+                "firstName": np.array(FIRST_NAMES)[uid % len(FIRST_NAMES)],
+                "gender": np.where(uid % 2 == 0, "F", "M"),
+                "itemInSession": item,
+                "lastName": np.array(LAST_NAMES)[uid % len(LAST_NAMES)],
+                "length": np.where(is_song, _CATALOG["durations"][song_idx], np.nan),
+                "level": np.where(uid % 3 == 0, "paid", "free"),
+                "location": np.array(LOCATIONS)[uid % len(LOCATIONS)],
+                "method": np.where(is_song, "PUT", "GET"),
+                "page": np.where(is_song, "NextSong", OTHER_PAGES[rng.integers(0, len(OTHER_PAGES), n)]),
+                "registration": 1_500_000_000_000 + uid * 1000,
+                "sessionId": day_index * user_count + uid,
+                "song": np.where(is_song, _CATALOG["titles"][song_idx], None),
+                "status": 200,
+                "ts": ts,
+                "userAgent": np.array(USER_AGENTS)[uid % len(USER_AGENTS)],
+                "userId": uid.astype(str),
+            })
+            # Ghi dạng JSON Lines (mỗi dòng 1 json object)
+            f.write(df.to_json(orient="records", lines=True, double_precision=10))
+            f.write("\n")
+    return path, events
+
+def generate_log_data(days=5, events_per_day=50, users=20, catalog_size=100, zipf=1.1, seed=42,
+                      workers=None, start_date="2018-11-01", log_dir=SYNTHETIC_LOG_DATA_DIR,
+                      song_dir=SYNTHETIC_SONG_DATA_DIR, write_songs=True):
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(log_dir, exist_ok=True)
+    print(f"=== BẮT ĐẦU TẠO DỮ LIỆU GIẢ LẬP TẠI: {log_dir} / {song_dir} ===")
+    started = time.perf_counter()
+
+    catalog = build_catalog(catalog_size, seed)
+    if write_songs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            os.makedirs(song_dir, exist_ok=True)
+            step = max(1, -(-catalog_size // (workers * 4)))
+            chunks = [catalog.iloc[i:i + step] for i in range(0, catalog_size, step)]
+            written = sum(pool.map(write_h5_chunk, chunks, [song_dir] * len(chunks)))
+            print(f"-> Đã tạo {written} file H5 ({time.perf_counter() - started:.1f}s)")
+
+    first_day = date.fromisoformat(start_date)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_log_worker,
+        initargs=(catalog["title"].to_numpy(object), catalog["artist_name"].to_numpy(object),
+                  catalog["duration"].to_numpy(), zipf, seed),
+    ) as pool:
+        futures = [
+            pool.submit(generate_day, i, first_day + timedelta(days=i), events_per_day, users, seed, log_dir)
+            for i in range(days)
+        ]
+        total = 0
+        for future in futures:
+            path, n = future.result()
+            total += n
+            print(f"-> Đã tạo file: {os.path.basename(path)} ({n} sự kiện)")
+
+    print(f"=== HOÀN TẤT: {total} sự kiện, {catalog_size} bài hát trong {time.perf_counter() - started:.1f}s ===")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh log nghe nhạc + catalog H5 giả lập khớp nhau.")
+    parser.add_argument("--days", type=int, default=5, help="Số ngày (mỗi ngày 1 file log)")
+    parser.add_argument("--events-per-day", type=int, default=50, help="Số sự kiện mỗi ngày")
+    parser.add_argument("--users", type=int, default=20, help="Số người dùng")
+    parser.add_argument("--catalog-size", type=int, default=100, help="Số bài hát trong catalog")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Hệ số Zipf cho độ phổ biến bài hát (0 = đều)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed để dữ liệu lặp lại được")
+    parser.add_argument("--workers", type=int, default=None, help="Số process (mặc định = số CPU)")
+    parser.add_argument("--start-date", default="2018-11-01", help="Ngày đầu tiên (YYYY-MM-DD)")
+    parser.add_argument("--log-dir", help="Thư mục ghi log (mặc định data/synthetic/log_data)")
+    parser.add_argument("--song-dir", help="Thư mục ghi file H5 (mặc định data/synthetic/song_data)")
+    parser.add_argument("--into-song-data", action="store_true",
+                        help="Ghi H5 vào song_data và log vào log_data thật (ghi đè log cùng ngày, "
+                             "lẫn với Million Song Subset)")
+    parser.add_argument("--no-songs", action="store_true", help="Không ghi file H5 (chỉ sinh log)")
+    args = parser.parse_args(argv)
+    if args.into_song_data:
+        if args.log_dir or args.song_dir:
+            parser.error("--into-song-data không dùng cùng --log-dir/--song-dir")
+        args.log_dir, args.song_dir = LOG_DATA_DIR, SONG_DATA_DIR
+        return args
+    args.log_dir = args.log_dir or SYNTHETIC_LOG_DATA_DIR
+    args.song_dir = args.song_dir or SYNTHETIC_SONG_DATA_DIR
+    for path, real in ((args.log_dir, LOG_DATA_DIR), (args.song_dir, SONG_DATA_DIR)):
+        if os.path.abspath(path) == os.path.abspath(real):
+            parser.error(f"{path} là thư mục dữ liệu thật; dùng --into-song-data nếu thật sự muốn ghi vào đó")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    generate_log_data(
+        days=args.days, events_per_day=args.events_per_day, users=args.users,
+        catalog_size=args.catalog_size, zipf=args.zipf, seed=args.seed, workers=args.workers,
+        start_date=args.start_date, log_dir=args.log_dir, song_dir=args.song_dir,
+        write_songs=not args.no_songs,
+    )
 
 if __name__ == "__main__":
-    generate_log_data()
\ No newline at end of file
+    main()
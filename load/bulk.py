@@ -0,0 +1,77 @@
+# load/bulk.py
+"""Ghi hàng loạt dùng chung cho các loader (executemany theo lô, upsert catalog H5)."""
+import time
+
+from config import BATCH_SIZE
+from db import DATA_ERRORS
+from sql_queries import artist_table_insert, song_table_insert
+from commit_policy import CommitPolicy
+from extraction.h5_catalog import song_frame, artist_frame
+from validation import validate_catalog
+
+def records(frame):
+    """DataFrame -> list tuple tham số cho cur.executemany (NaN/NaT -> None, kiểu Python gốc)."""
+    if frame.empty:
+        return []
+    return list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+
+def bulk_insert(cur, query, frame, batch_size=BATCH_SIZE):
+    """
+    Ghi cả DataFrame (hoặc list tuple) theo lô bằng executemany (connector tự gộp thành
+    multi-row INSERT ... VALUES, giữ nguyên ON DUPLICATE KEY UPDATE).
+    Nếu một lô lỗi do dữ liệu (db.DATA_ERRORS) thì ghi lại từng dòng của lô đó để chỉ loại
+    dòng hỏng; lỗi khác (deadlock, lock wait, mất kết nối) được ném lại để transaction rollback.
+    Trả về (loaded, rejected).
+    """
+    rows = frame if isinstance(frame, list) else records(frame)
+    loaded = rejected = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            cur.executemany(query, batch)
+            loaded += len(batch)
+        except DATA_ERRORS:
+            for row in batch:
+                try:
+                    cur.execute(query, row)
+                    loaded += 1
+                except DATA_ERRORS:
+                    rejected += 1
+    return loaded, rejected
+
+def upsert_song_catalog(cur, conn, catalog, manifest=None, batch_size=BATCH_SIZE, timer=None, quarantine=None):
+    """
+    Ghi artists rồi songs từ catalog H5 (extraction.h5_catalog) theo từng lô file.
+    Dòng không hợp lệ (validation.validate_catalog) bị tách ra trước khi ghi và, nếu có
+    quarantine (validation.Quarantine), được ghi vào etl_rejects kèm mã lý do.
+    Commit theo CommitPolicy; manifest (nếu có) được đánh dấu trong cùng transaction.
+    timer (etl_logger.PhaseTimer, tùy chọn) nhận thời gian ghi ("write") và commit.
+    Trả về dict loaded / rejected / batches.
+    """
+    result = {"loaded": 0, "rejected": 0, "batches": 0}
+    policy = CommitPolicy(conn, timer=timer)
+    try:
+        with policy:
+            for start in range(0, len(catalog), batch_size):
+                part = catalog.iloc[start:start + batch_size]
+                good, rejects = validate_catalog(part)
+                if quarantine is not None:
+                    quarantine.clear(cur, part["file_path"])
+                    quarantine.add(cur, rejects)
+                write_started = time.perf_counter()
+                a_loaded, _ = bulk_insert(cur, artist_table_insert, artist_frame(good), batch_size)
+                s_loaded, s_rejected = bulk_insert(cur, song_table_insert, song_frame(good), batch_size)
+                if timer is not None:
+                    timer.add("write", time.perf_counter() - write_started, a_loaded + s_loaded)
+                result["loaded"] += a_loaded + s_loaded
+                result["rejected"] += s_rejected + len(rejects)
+                if manifest is not None:
+                    rejected_files = set(rejects["source_file"])
+                    for filepath in part["file_path"]:
+                        ok = filepath not in rejected_files
+                        manifest.mark(filepath, rows_loaded=2 if ok else 0, rows_rejected=0 if ok else 1,
+                                      status="LOADED" if ok else "REJECTED")
+                policy.record(rows=a_loaded + s_loaded, files=len(part))
+    finally:
+        result["batches"] = policy.batches
+    return result
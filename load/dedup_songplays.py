@@ -0,0 +1,46 @@
+# load/dedup_songplays.py
+"""
+Dọn một lần các songplays bị nhân bản bởi những lần chạy load_staging cũ
+(songplay_id = uuid4 ngẫu nhiên), rồi tính lại songplays_daily và các bảng mart.
+
+Nên chạy sau một lần `python -m load.load_staging --full-reload` để mọi sự kiện
+còn log gốc đã có id xác định (uuid5) và được giữ lại thay cho bản uuid4.
+"""
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from db import connection
+from sql_queries import songplay_dedup
+from etl_logger import ETLLogger
+from transform.create_aggregate import create_aggregate_table
+from load.load_mart import load_all_marts
+
+def dedup_songplays(cur, conn):
+    cur.execute(songplay_dedup)
+    removed = cur.rowcount
+    conn.commit()
+    print(f"Đã xóa {removed} songplays trùng lặp.")
+    return removed
+
+def main():
+    logger = ETLLogger("load.dedup_songplays")
+    logger.start()
+
+    try:
+        with connection() as (cur, conn):
+            removed = dedup_songplays(cur, conn)
+            create_aggregate_table(cur, conn, rebuild=True)
+            load_all_marts(cur, conn, rebuild=True)
+        logger.log_success(extracted=removed, loaded=0, rejected=removed)
+        print("Dedup songplays done.")
+    except Exception as e:
+        print(f"Error: {e}")
+        logger.log_fail(str(e))
+        raise
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# load/infile.py
+"""
+Nạp hàng loạt bằng LOAD DATA LOCAL INFILE:
+DataFrame -> file TSV tạm -> bảng tạm (scratch) -> một câu INSERT ... SELECT
+... ON DUPLICATE KEY UPDATE vào bảng đích.
+
+Danh sách cột và mệnh đề ON DUPLICATE KEY UPDATE được lấy từ chính câu upsert
+trong sql_queries, nên ngữ nghĩa upsert giữ nguyên như đường INSERT thường.
+"""
+import os
+import re
+import tempfile
+
+import pandas as pd
+
+_INSERT_RE = re.compile(r"INSERT\s+INTO\s+(\w+)\s*\(([^)]*)\)", re.IGNORECASE)
+_UPDATE_RE = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*?);?\s*$", re.IGNORECASE | re.DOTALL)
+
+def parse_upsert(query):
+    """Tách (table, columns, update_clause) từ một câu upsert trong sql_queries."""
+    m = _INSERT_RE.search(query)
+    table = m.group(1)
+    columns = [c.strip() for c in m.group(2).split(",")]
+    update = _UPDATE_RE.search(query).group(1).strip()
+    return table, columns, update
+
+def _escape(col):
+    """Một cột -> chuỗi theo định dạng mặc định của LOAD DATA (NULL = \\N)."""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        text = col.dt.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        text = col.astype(object).astype(str)
+        text = (text.str.replace("\\", "\\\\", regex=False)
+                    .str.replace("\t", "\\t", regex=False)
+                    .str.replace("\n", "\\n", regex=False)
+                    .str.replace("\r", "\\r", regex=False))
+    return text.where(col.notna(), "\\N")
+
+def write_tsv(frame, path):
+    """Ghi DataFrame ra TSV (không header) bằng các phép chuỗi vector hóa."""
+    columns = [_escape(frame[c]) for c in frame.columns]
+    lines = columns[0].str.cat(columns[1:], sep="\t") if len(columns) > 1 else columns[0]
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for line in lines:
+            f.write(line)
+            f.write("\n")
+
+# MySQL không cho bảng tạm có phân vùng (vd. songplays)
+ER_PARTITION_NO_TEMPORARY = 1562
+
+def _create_scratch(cur, scratch, table):
+    try:
+        cur.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {scratch} LIKE {table};")
+    except Exception as e:
+        if getattr(e, "errno", None) != ER_PARTITION_NO_TEMPORARY:
+            raise
+        # Chỉ chép cột rồi tự khai báo lại khóa chính (cần cho REPLACE trong LOAD DATA)
+        cur.execute(
+            "SELECT column_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = 'PRIMARY' "
+            "ORDER BY seq_in_index",
+            (table,)
+        )
+        primary_key = ", ".join(row[0] for row in cur.fetchall())
+        cur.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {scratch} (PRIMARY KEY ({primary_key})) "
+                    f"SELECT * FROM {table} LIMIT 0;")
+
+def load_data_upsert(cur, query, frame):
+    """
+    Ghi frame (cột theo đúng thứ tự của query) vào bảng đích qua LOAD DATA LOCAL INFILE.
+    Ném lỗi của connector nếu server/client tắt local_infile để caller chuyển về INSERT.
+    Trả về số dòng đã nạp.
+    """
+    if frame.empty:
+        return 0
+    table, columns, update = parse_upsert(query)
+    scratch = f"tmp_load_{table}"
+    column_list = ", ".join(columns)
+
+    # Bảng tạm theo phiên: không có khóa ngoại, không gây implicit commit
+    _create_scratch(cur, scratch, table)
+    cur.execute(f"DELETE FROM {scratch};")
+
+    fd, path = tempfile.mkstemp(suffix=".tsv", prefix=f"{table}_")
+    os.close(fd)
+    try:
+        write_tsv(frame, path)
+        # REPLACE: trong cùng lô, dòng sau thắng (giống thứ tự executemany)
+        cur.execute(
+            f"LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE {scratch} "
+            f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+            f"({column_list});",
+            (path,)
+        )
+    finally:
+        os.remove(path)
+
+    cur.execute(
+        f"INSERT INTO {table} ({column_list}) "
+        f"SELECT {column_list} FROM {scratch} "
+        f"ON DUPLICATE KEY UPDATE {update};"
+    )
+    return len(frame)
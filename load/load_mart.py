@@ -1,27 +1,112 @@
 # scripts/load_mart.py
-from db import create_connection
+import argparse
+from datetime import timedelta
 
-def load_datamart(cur, conn):
+from db import connection, ensure_column, to_date
+from config import WATERMARK_LAG_SECONDS
+from sql_queries import (
+    etl_watermarks_create, watermark_upsert, mart_daily_plays_create, mart_daily_plays_rebuild,
+    mart_daily_plays_refresh, mart_daily_plays_prune, songplay_mart_tables, device_mart_refresh,
+    hourly_mart_refresh, mart_kpis_create, kpi_mart_refresh
+)
+from transform.create_aggregate import changed_dates, date_ranges, read_watermark
+
+# Tên watermark trong etl_watermarks: load_time lớn nhất của songplays_daily đã đẩy sang mart
+MART_WATERMARK = "mart_daily_plays"
+# load_time lớn nhất của songplays đã được đếm vào mart thiết bị / heatmap
+SONGPLAY_MART_WATERMARK = "mart_songplays"
+
+# Các mart tính thẳng từ songplays theo ngày: mỗi lần chỉ đếm lại các ngày bị ảnh hưởng
+SONGPLAY_MART_TABLES = songplay_mart_tables
+
+def load_datamart(cur, conn, rebuild=False):
+    """
+    Đẩy songplays_daily sang mart_daily_plays. Mặc định chỉ các ngày có load_time
+    mới hơn watermark (tức là play_count vừa đổi); rebuild=True thì đẩy toàn bộ.
+    """
     # Example: create mart table and populate from songplays_daily
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS mart_daily_plays (
-        date DATE PRIMARY KEY,
-        total_plays INT
-    );
-    """)
+    cur.execute(mart_daily_plays_create)
+    ensure_column(cur, "songplays_daily", "load_time",
+                  "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+    cur.execute(etl_watermarks_create)
     conn.commit()
-    cur.execute("""
-    INSERT INTO mart_daily_plays (date, total_plays)
-    SELECT date, play_count FROM songplays_daily
-    ON DUPLICATE KEY UPDATE total_plays = VALUES(total_plays);
-    """)
+
+    cur.execute("SELECT MAX(load_time) FROM songplays_daily")
+    new_watermark = cur.fetchone()[0]
+    watermark = None if rebuild else read_watermark(cur, MART_WATERMARK)
+
+    if watermark is None:
+        cur.execute(mart_daily_plays_rebuild)
+    else:
+        cur.execute(mart_daily_plays_refresh, (watermark, WATERMARK_LAG_SECONDS))
+    rows = cur.rowcount
+
+    # Mart chỉ có một dòng mỗi ngày nên dọn ngày đã bị xóa khỏi songplays_daily luôn được
+    cur.execute(mart_daily_plays_prune)
+    if new_watermark is not None:
+        cur.execute(watermark_upsert, (MART_WATERMARK, new_watermark))
+    conn.commit()
+    print(f"Datamart loaded/updated. Rows affected: {rows}")
+    return rows
+
+def load_songplay_marts(cur, conn, rebuild=False):
+    """
+    Cập nhật mart_device_plays và mart_hourly_plays từ songplays: chỉ đếm lại các ngày
+    có songplays mới kể từ watermark; rebuild=True thì xóa và đếm lại toàn bộ.
+    """
+    for ddl in SONGPLAY_MART_TABLES.values():
+        cur.execute(ddl)
+    cur.execute(etl_watermarks_create)
     conn.commit()
-    print("Datamart loaded/updated.")
 
-def main():
-    cur, conn = create_connection()
-    load_datamart(cur, conn)
-    conn.close()
+    cur.execute("SELECT MAX(load_time) FROM songplays")
+    new_watermark = cur.fetchone()[0]
+    watermark = None if rebuild else read_watermark(cur, SONGPLAY_MART_WATERMARK)
+
+    if watermark is None:
+        for table in SONGPLAY_MART_TABLES:
+            cur.execute(f"DELETE FROM {table}")
+        cur.execute("SELECT MIN(start_time), MAX(start_time) FROM songplays")
+        first, last = cur.fetchone()
+        ranges = [[to_date(first), to_date(last) + timedelta(days=1)]] if first else []
+    else:
+        ranges = date_ranges(changed_dates(cur, watermark))
+
+    rows = 0
+    for start, end in ranges:
+        for query in (device_mart_refresh, hourly_mart_refresh):
+            cur.execute(query, (start, end))
+            rows += cur.rowcount
+
+    if new_watermark is not None:
+        cur.execute(watermark_upsert, (SONGPLAY_MART_WATERMARK, new_watermark))
+    conn.commit()
+    print(f"Device/heatmap marts updated ({len(ranges)} khoảng ngày). Rows affected: {rows}")
+    return rows
+
+def load_kpis(cur, conn):
+    """Tính lại dòng KPI đầu trang (tổng lượt nghe lấy từ mart_daily_plays, không quét songplays)."""
+    cur.execute(mart_kpis_create)
+    cur.execute(kpi_mart_refresh)
+    conn.commit()
+    print("KPI mart updated.")
+
+def load_all_marts(cur, conn, rebuild=False):
+    rows = load_datamart(cur, conn, rebuild=rebuild)
+    rows += load_songplay_marts(cur, conn, rebuild=rebuild)
+    load_kpis(cur, conn)
+    return rows
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cập nhật các bảng mart cho dashboard.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Bỏ qua watermark, tính lại toàn bộ các bảng mart")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with connection() as (cur, conn):
+        load_all_marts(cur, conn, rebuild=args.rebuild)
     print("Load mart done.")
 
 if __name__ == "__main__":
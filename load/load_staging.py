@@ -1,9 +1,12 @@
 # scripts/load/load_staging.py
 import os
 import glob
+import argparse
+import time
 import uuid
+import threading
 import pandas as pd
-import h5py
+import mysql.connector
 import sys
 
 # --- CẤU HÌNH ĐƯỜNG DẪN ĐỂ IMPORT MODULE TỪ THƯ MỤC GỐC ---
@@ -11,227 +14,489 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-from db import create_connection
+from db import connection, DATA_ERRORS
 from sql_queries import (
-    song_table_insert,
-    artist_table_insert,
     time_table_insert,
     user_table_insert,
     songplay_table_insert,
-    song_select
 )
-from config import SONG_DATA_DIR, LOG_DATA_DIR
-from etl_logger import ETLLogger
+from config import (
+    SONG_DATA_DIR, LOG_DATA_DIR, BATCH_SIZE, H5_WORKERS, LOG_CHUNK_SIZE, INGEST_MODE, PARQUET_STAGING,
+    PIPELINE_LANES, PIPELINE_QUEUE_SIZE, DB_BACKEND
+)
+from etl_logger import ETLLogger, PhaseTimer
+from load.song_lookup import SongLookup
+from load.infile import load_data_upsert
+from load.bulk import bulk_insert, upsert_song_catalog
+from load.pipeline import run_lanes
+from extraction.h5_catalog import load_catalog, catalog_signatures, song_frame, artist_frame
+from commit_policy import CommitPolicy
+from validation import Quarantine, validate_log_chunk
+from file_manifest import FileManifest
+from create_tables import ensure_songplay_partitions
+import parquet_staging
 
 # Biến toàn cục thống kê
 STATS = {
     "extracted": 0,
     "loaded": 0,
-    "rejected": 0
+    "rejected": 0,
+    "batches": 0
 }
+_STATS_LOCK = threading.Lock()
 
-def _fix(v):
-    """Hàm xử lý giá trị None / NaN."""
-    try:
-        return None if pd.isna(v) else v
-    except Exception:
-        return v
+def add_stats(**counts):
+    """Cộng vào STATS (an toàn khi nhiều thread ghi cùng chạy)."""
+    with _STATS_LOCK:
+        for key, value in counts.items():
+            STATS[key] += value
 
-def get_h5_value(h5_group, field_name, index=0, default_val=None):
-    try:
-        value = h5_group[field_name][index]
-        if isinstance(value, bytes):
-            return value.decode('utf-8')
-        if hasattr(value, 'item'):
-            return value.item()
-        return value
-    except (KeyError, IndexError, TypeError, ValueError):
-        return default_val
-
-def process_song_file(cur, filepath):
-    """Xử lý 1 file nhạc H5"""
-    global STATS
-    STATS["extracted"] += 1
-    
-    try:
-        with h5py.File(filepath, 'r') as f:
-            metadata_songs = f.get('metadata', {}).get('songs', {})
-            analysis_songs = f.get('analysis', {}).get('songs', {})
-
-            # --- Song Data ---
-            song_id = get_h5_value(metadata_songs, 'song_id', default_val=None)
-            title = get_h5_value(metadata_songs, 'title', default_val=None)
-            artist_id = get_h5_value(metadata_songs, 'artist_id', default_val=None)
-            year = get_h5_value(metadata_songs, 'year', default_val=0) 
-            duration = get_h5_value(analysis_songs, 'duration', default_val=None)
-            
-            if not song_id or not artist_id:
-                STATS["rejected"] += 1
-                return 
-
-            song_data = (
-                _fix(song_id), _fix(title), _fix(artist_id),
-                int(_fix(year)) if _fix(year) != 0 and _fix(year) is not None else None,
-                float(_fix(duration)) if _fix(duration) is not None else None,
-            )
-            try:
-                cur.execute(song_table_insert, song_data)
-                STATS["loaded"] += 1
-            except Exception:
-                STATS["rejected"] += 1
-                pass
-
-            # --- Artist Data ---
-            artist_name = get_h5_value(metadata_songs, 'artist_name', default_val=None)
-            artist_location = get_h5_value(metadata_songs, 'artist_location', default_val=None)
-            artist_longitude = get_h5_value(metadata_songs, 'artist_longitude', default_val=None)
-            artist_latitude = get_h5_value(metadata_songs, 'artist_latitude', default_val=None)
-
-            artist_data = (
-                _fix(artist_id), _fix(artist_name), _fix(artist_location),
-                float(_fix(artist_longitude)) if _fix(artist_longitude) is not None else None,
-                float(_fix(artist_latitude)) if _fix(artist_latitude) is not None else None,
-            )
-            try:
-                cur.execute(artist_table_insert, artist_data)
-                STATS["loaded"] += 1
-            except Exception:
-                pass
+# Thời gian theo pha (parse, lookup, write, commit) của lần chạy, ghi vào etl_log_metrics
+TIMER = PhaseTimer()
 
-    except Exception as e:
-        # print(f"Lỗi file H5: {filepath} - {e}") # Bỏ comment nếu muốn xem chi tiết
-        STATS["rejected"] += 1
+# Dòng bị loại ở bước validation (log và catalog H5) -> etl_rejects, đếm theo lý do
+QUARANTINE = Quarantine("load.load_staging")
+
+# Các start_time đã ghi vào bảng time trong lần chạy này
+KNOWN_START_TIMES = set()
+_KNOWN_LOCK = threading.Lock()
+
+# Namespace cố định cho songplay_id: cùng (ts, userId, sessionId, itemInSession) -> cùng id,
+# nên chạy lại trên cùng log sẽ rơi vào ON DUPLICATE KEY thay vì chèn bản sao mới
+SONGPLAY_NAMESPACE = uuid.UUID("2105570b-d61b-44dd-b4ad-d4d239b8af4f")
+
+def _key_part(values):
+    """
+    Chuỗi chuẩn của một cột khóa số: cùng giá trị -> cùng chuỗi, bất kể dtype pandas
+    suy ra cho khối (39, 39.0 hay "39" khi khối có dòng null đều thành "39"); null -> "".
+    """
+    return pd.to_numeric(values, errors="coerce").round().astype("Int64").astype("string").fillna("")
+
+def songplay_ids(df):
+    """songplay_id xác định (uuid5) từ khóa tự nhiên của sự kiện log."""
+    parts = [_key_part(df[c]) if c in df.columns else pd.Series("", index=df.index)
+             for c in ("ts", "userId", "sessionId", "itemInSession")]
+    keys = parts[0].str.cat(parts[1:], sep="|")
+    return [str(uuid.uuid5(SONGPLAY_NAMESPACE, k)) for k in keys]
+
+# Chỉ mục tra cứu song_id/artist_id, nạp một lần mỗi lần chạy (sau khi đã load song_data)
+SONG_LOOKUP = None
+
+# Trạng thái riêng của mỗi thread ghi ở chế độ pipeline (lookup gắn cursor riêng, sink Parquet riêng)
+LANE = threading.local()
+
+def get_song_lookup(cur):
+    global SONG_LOOKUP
+    lookup = getattr(LANE, "lookup", None)
+    if lookup is not None:
+        return lookup
+    if SONG_LOOKUP is None:
+        SONG_LOOKUP = SongLookup(cur).load()
+    return SONG_LOOKUP
+
+# Bản sao Parquet theo ngày của songplays/users (None = tắt); bật trong main()
+PARQUET = {"sink": None}
 
-def process_log_file(cur, filepath):
-    """Xử lý 1 file Log JSON"""
+def parquet_sink():
+    return getattr(LANE, "sink", PARQUET["sink"])
+
+# Chế độ ghi log hiện tại; tự chuyển về "insert" khi LOAD DATA LOCAL INFILE bị tắt
+INGEST = {"mode": INGEST_MODE}
+
+# Mã lỗi khi local_infile bị tắt: 1148/3948 phía server, 2068 phía client
+LOCAL_INFILE_DISABLED = {1148, 2068, 3948}
+
+def write_frame(cur, query, frame, batch_size=BATCH_SIZE):
+    """Ghi DataFrame theo INGEST["mode"]: LOAD DATA LOCAL INFILE hoặc executemany. Trả về (loaded, rejected)."""
+    with TIMER.track("write", rows=len(frame)):
+        if INGEST["mode"] == "load_data" and not frame.empty:
+            try:
+                return load_data_upsert(cur, query, frame), 0
+            except mysql.connector.Error as e:
+                if e.errno in LOCAL_INFILE_DISABLED:
+                    print(f"⚠️ LOAD DATA LOCAL INFILE không khả dụng ({e}), chuyển sang INSERT theo lô.")
+                    INGEST["mode"] = "insert"
+                elif not isinstance(e, DATA_ERRORS):
+                    # Deadlock, lock wait, mất kết nối...: transaction có thể đã rollback, không ghi tiếp
+                    raise
+                # Lỗi dữ liệu (dòng hỏng, khóa ngoại...): ghi lại lô này bằng INSERT để lọc dòng lỗi
+        return bulk_insert(cur, query, frame, batch_size)
+
+def load_song_catalog(cur, conn, manifest=None, workers=H5_WORKERS):
+    """
+    Load song_data từ catalog H5 dùng chung (extraction.h5_catalog, cache Parquet):
+    chỉ parse file H5 mới/đổi, chỉ ghi file chưa có trong manifest.
+    """
     global STATS
-    try:
-        # --- PHẦN QUAN TRỌNG NHẤT: BẮT LỖI JSON ---
-        df = pd.read_json(filepath, lines=True)
-    except (ValueError, pd.errors.EmptyDataError, pd.errors.ParserError) as e:
-        # Bắt tất cả lỗi liên quan đến định dạng file (ValueError chính là lỗi No ':' found)
-        print(f"⚠️ Bỏ qua file log lỗi: {os.path.basename(filepath)} | Lỗi: {e}")
-        STATS["rejected"] += 1
-        return
-    except Exception as e:
-        print(f"⚠️ Lỗi không xác định khi đọc file {filepath}: {e}")
-        STATS["rejected"] += 1
+    started = time.perf_counter()
+    catalog = load_catalog(SONG_DATA_DIR, workers=workers)
+    TIMER.add("parse", time.perf_counter() - started, len(catalog))
+    if PARQUET["sink"] is not None:
+        # Đặt tên cột artists theo bảng artists trong DB
+        artists = artist_frame(catalog).set_axis(["artist_id", "name", "location", "latitude", "longitude"], axis=1)
+        parquet_staging.write_catalog(song_frame(catalog), artists)
+    if manifest is not None:
+        pending = manifest.pending(catalog["file_path"].tolist(), signatures=catalog_signatures(catalog))
+        catalog = catalog[catalog["file_path"].isin(pending)]
+    STATS["extracted"] += len(catalog)
+
+    started = time.perf_counter()
+    result = upsert_song_catalog(cur, conn, catalog, manifest=manifest, timer=TIMER, quarantine=QUARANTINE)
+    STATS["loaded"] += result["loaded"]
+    STATS["rejected"] += result["rejected"]
+    STATS["batches"] += result["batches"]
+
+    elapsed = time.perf_counter() - started
+    rate = result["loaded"] / elapsed if elapsed > 0 else 0.0
+    print(f"{result['loaded']} rows loaded in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+def to_start_time(ts):
+    """
+    ts (ms) -> DATETIME làm tròn tới giây, dùng chung cho time và songplays để khóa ngoại khớp nhau.
+    Làm tròn nửa lên như MySQL khi đổi giá trị có phần lẻ giây sang DATETIME (cách các lần
+    nạp cũ đã lưu start_time), để dòng nạp lại trùng start_time với dòng cũ khi dedup.
+    """
+    return pd.to_datetime((pd.to_numeric(ts) + 500) // 1000, unit="s")
+
+def load_time_dim(cur, start_times):
+    """
+    Ghi bảng time từ tập start_time duy nhất của khối, bỏ qua các khóa đã ghi
+    trong lần chạy này (KNOWN_START_TIMES); các khóa mới đi trong một câu INSERT,
+    theo thứ tự tăng dần để các làn pipeline khóa dòng cùng một thứ tự.
+    """
+    t = pd.Series(start_times.dropna().unique()).sort_values(ignore_index=True)
+    # Kiểm tra và giữ chỗ trong cùng một lần khóa: hai làn không cùng coi một khóa là mới
+    with _KNOWN_LOCK:
+        t = t[~t.isin(KNOWN_START_TIMES)]
+        KNOWN_START_TIMES.update(t)
+    if t.empty:
         return
-    # --------------------------------------------
-        
+    time_df = pd.DataFrame({
+        "start_time": t, "hour": t.dt.hour, "day": t.dt.day, "week": t.dt.isocalendar().week,
+        "month": t.dt.month, "year": t.dt.year, "weekday": t.dt.weekday
+    })
+    loaded, _ = write_frame(cur, time_table_insert, time_df, batch_size=len(time_df))
+    if loaded < len(time_df):
+        # Ghi không trọn: trả lại các khóa để khối sau thử lại
+        with _KNOWN_LOCK:
+            KNOWN_START_TIMES.difference_update(t)
+
+def iter_log_chunks(filepath, chunk_size=LOG_CHUNK_SIZE):
+    """Đọc file JSON-lines theo từng khối chunk_size dòng: bộ nhớ không phụ thuộc kích thước file."""
+    # precise_float: length phải khớp tuyệt đối với songs.duration khi tra cứu song_id
+    with pd.read_json(filepath, lines=True, chunksize=chunk_size, precise_float=True) as reader:
+        yield from reader
+
+# Khối cuối do read_log_chunks sinh khi file đọc lỗi giữa chừng (đi qua được hàng đợi của pipeline)
+READ_FAILED = object()
+
+def read_log_chunks(filepath):
+    """
+    Sinh các khối của 1 file log; file JSON hỏng thì dừng tại đó, tính là 1 file bị loại
+    và sinh READ_FAILED để file được đánh dấu FAILED trong manifest.
+    """
+    chunks = iter_log_chunks(filepath)
+    while True:
+        try:
+            # --- PHẦN QUAN TRỌNG NHẤT: BẮT LỖI JSON ---
+            started = time.perf_counter()
+            df = next(chunks, None)
+            TIMER.add("parse", time.perf_counter() - started, 0 if df is None else len(df))
+        except (ValueError, pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            # Bắt tất cả lỗi liên quan đến định dạng file (ValueError chính là lỗi No ':' found)
+            # Các khối trước đó (nếu có) đã được ghi; phần còn lại của file bị bỏ qua
+            print(f"⚠️ Bỏ qua file log lỗi: {os.path.basename(filepath)} | Lỗi: {e}")
+            add_stats(rejected=1)
+            yield READ_FAILED
+            return
+        except Exception as e:
+            print(f"⚠️ Lỗi không xác định khi đọc file {filepath}: {e}")
+            add_stats(rejected=1)
+            yield READ_FAILED
+            return
+        # --------------------------------------------
+        if df is None:
+            return
+        yield df
+
+def process_log_file(cur, filepath, chunks=None, on_chunk=None):
+    """
+    Xử lý 1 file Log JSON, đọc và ghi theo từng khối. chunks: các khối đã đọc sẵn
+    (chế độ pipeline), mặc định tự đọc file. on_chunk(loaded): gọi sau khi ghi xong mỗi khối
+    (chế độ pipeline commit tại đây). Trả về (loaded, rejected, status) của file,
+    status là trạng thái ghi vào file_manifest: "LOADED", hoặc "FAILED" nếu file đọc lỗi
+    giữa chừng (các khối trước đó vẫn được ghi; lần chạy sau nạp lại cả file).
+    """
+    sink = parquet_sink()
+    if sink is not None:
+        sink.begin_file(filepath)
+    loaded = rejected = 0
+    status = "LOADED"
+    try:
+        # Nạp lại file: bỏ các dòng bị loại của lần trước (cùng transaction với dữ liệu mới)
+        QUARANTINE.clear(cur, [filepath])
+        for df in (read_log_chunks(filepath) if chunks is None else chunks):
+            if df is READ_FAILED:
+                status = "FAILED"
+                rejected += 1
+                break
+            chunk_loaded, chunk_rejected = process_log_chunk(cur, df, source=filepath)
+            loaded += chunk_loaded
+            rejected += chunk_rejected
+            if on_chunk is not None:
+                on_chunk(chunk_loaded)
+    except BaseException:
+        if sink is not None:
+            sink.end_file(commit=False)
+        raise
+    if sink is not None:
+        # File lỗi: giữ bản Parquet cũ, lần nạp lại sẽ ghi bản đầy đủ
+        sink.end_file(commit=status == "LOADED")
+    return loaded, rejected, status
+
+def process_log_chunk(cur, df, source=None):
+    """
+    Lọc NextSong, tách dòng không hợp lệ vào etl_rejects (validation) rồi ghi
+    time/users/songplays cho phần còn lại của khối log. Trả về (loaded, rejected).
+    """
     # Chỉ lấy log nghe nhạc
     if "page" in df.columns:
         df = df[df["page"] == "NextSong"]
     else:
-        return
+        return 0, 0
 
     if df.empty:
-        return
+        return 0, 0
 
-    STATS["extracted"] += len(df)
+    add_stats(extracted=len(df))
+    sink = parquet_sink()
+
+    # 0. Validation: loại cả lô một lần trước khi chạm DB (không còn dựa vào lỗi từng dòng)
+    with TIMER.track("validate", rows=len(df)):
+        df, rejects = validate_log_chunk(df, source)
+        quarantined = QUARANTINE.add(cur, rejects)
+    add_stats(rejected=quarantined)
+    if df.empty:
+        return 0, quarantined
 
     # 1. Process Time
-    if "ts" in df.columns:
-        t = pd.to_datetime(df["ts"], unit="ms")
-        time_df = pd.DataFrame({
-            "start_time": t, "hour": t.dt.hour, "day": t.dt.day, "week": t.dt.isocalendar().week,
-            "month": t.dt.month, "year": t.dt.year, "weekday": t.dt.weekday
-        })
-        for _, row in time_df.iterrows():
-            try:
-                values = [None if pd.isna(x) else x for x in list(row)]
-                cur.execute(time_table_insert, values)
-            except Exception:
-                pass
-
-    # 2. Process Users
-    if "userId" in df.columns:
-        user_df = df[["userId", "firstName", "lastName", "gender", "level"]]
-        for _, row in user_df.iterrows():
-            if str(row.userId).isdigit():
-                try:
-                    vals = (
-                        int(row.userId),
-                        None if pd.isna(row.firstName) else row.firstName,
-                        None if pd.isna(row.lastName) else row.lastName,
-                        None if pd.isna(row.gender) else row.gender,
-                        None if pd.isna(row.level) else row.level,
-                    )
-                    cur.execute(user_table_insert, vals)
-                except Exception:
-                    pass
+    start_times = to_start_time(df["ts"])
+    load_time_dim(cur, start_times)
+
+    # 2. Process Users (userId đã được kiểm tra là số nguyên)
+    user_ids = pd.to_numeric(df["userId"]).astype("Int64")
+    user_df = df[["userId", "firstName", "lastName", "gender", "level"]].copy()
+    user_df["userId"] = user_ids
+    # Mỗi user một dòng (dòng cuối thắng, như khi upsert lần lượt), theo thứ tự khóa
+    write_frame(cur, user_table_insert,
+                user_df.drop_duplicates("userId", keep="last").sort_values("userId"))
+    if sink is not None:
+        parquet_users = user_df.set_axis(["user_id", "first_name", "last_name", "gender", "level"], axis=1)
+        sink.write("users", parquet_users, start_times.dt.strftime("%Y-%m-%d"))
 
     # 3. Process Songplays
-    for _, row in df.iterrows():
-        try:
-            cur.execute(song_select, (row.song, row.artist, row.length))
-            result = cur.fetchone()
-            songid, artistid = result if result else (None, None)
-            
-            start_time = pd.to_datetime(row.ts, unit="ms")
-            song_play_id = str(uuid.uuid4())
-            
-            songplay_data = (
-                song_play_id,
-                start_time.to_pydatetime() if hasattr(start_time, 'to_pydatetime') else start_time,
-                int(row.userId) if str(row.userId).isdigit() else None,
-                None if pd.isna(row.level) else row.level,
-                None if pd.isna(songid) else songid,
-                None if pd.isna(artistid) else artistid,
-                None if pd.isna(row.sessionId) else row.sessionId,
-                None if pd.isna(row.location) else row.location,
-                None if pd.isna(row.userAgent) else row.userAgent,
-            )
-            cur.execute(songplay_table_insert, songplay_data)
-            STATS["loaded"] += 1 
-        except Exception:
-            STATS["rejected"] += 1
-            pass
-
-def process_data(cur, conn, filepath, func, file_extension="*.h5"):
+    with TIMER.track("lookup", rows=len(df)):
+        matched = get_song_lookup(cur).resolve(df)
+
+    songplay_df = pd.DataFrame({
+        "songplay_id": songplay_ids(df),
+        "start_time": start_times,
+        "user_id": user_ids,
+        "level": df["level"],
+        "song_id": matched["song_id"],
+        "artist_id": matched["artist_id"],
+        "session_id": pd.to_numeric(df["sessionId"]).astype("Int64"),
+        "location": df["location"],
+        "user_agent": df["userAgent"],
+    }, index=df.index)
+    loaded, rejected = write_frame(cur, songplay_table_insert, songplay_df)
+    if sink is not None:
+        with TIMER.track("parquet", rows=len(songplay_df)):
+            sink.write("songplays", songplay_df, start_times.dt.strftime("%Y-%m-%d"))
+    add_stats(loaded=loaded, rejected=rejected)
+    return loaded, rejected + quarantined
+
+def _list_files(filepath, file_extension):
     all_files = []
     for root, dirs, files in os.walk(filepath):
         files = glob.glob(os.path.join(root, file_extension))
         for f in files:
             all_files.append(os.path.abspath(f))
+    return all_files
+
+def process_data(cur, conn, filepath, func, file_extension="*.json", manifest=None):
+    all_files = _list_files(filepath, file_extension)
+    if manifest is not None:
+        all_files = manifest.pending(all_files)
             
     num_files = len(all_files)
     print(f"{num_files} files found in {filepath} (Loại: {file_extension})")
 
-    for i, datafile in enumerate(all_files, 1):
-        func(cur, datafile)
-        conn.commit() 
-        if i % 100 == 0 or i == num_files:
-            print(f"{i}/{num_files} processed: {datafile}")
+    started = time.perf_counter()
+    loaded_before = STATS["loaded"]
+    policy = CommitPolicy(conn, timer=TIMER)
+    try:
+        with policy:
+            for i, datafile in enumerate(all_files, 1):
+                before, rejected_before = STATS["loaded"], STATS["rejected"]
+                _, _, status = func(cur, datafile)
+                if manifest is not None:
+                    manifest.mark(datafile, rows_loaded=STATS["loaded"] - before,
+                                  rows_rejected=STATS["rejected"] - rejected_before, status=status)
+                policy.record(rows=STATS["loaded"] - before, files=1)
+                if i % 100 == 0 or i == num_files:
+                    print(f"{i}/{num_files} processed: {datafile}")
+    finally:
+        STATS["batches"] += policy.batches
+
+    elapsed = time.perf_counter() - started
+    loaded = STATS["loaded"] - loaded_before
+    rate = loaded / elapsed if elapsed > 0 else 0.0
+    print(f"{loaded} rows loaded in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+def process_logs_pipelined(cur, conn, filepath, manifest=None, lanes=PIPELINE_LANES,
+                           queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Như process_data(..., process_log_file) nhưng đọc và ghi chạy chồng lên nhau:
+    mỗi làn có một thread đọc JSON và một thread ghi với kết nối riêng lấy từ pool,
+    nối bằng hàng đợi giới hạn queue_size khối (load.pipeline.run_lanes). Mỗi file
+    thuộc trọn một làn nên dữ liệu và file_manifest của nó vẫn cùng một transaction.
+
+    Các làn cùng upsert users/time (khóa trùng nhau giữa các file) nên mỗi làn commit
+    sau từng khối thay vì theo CommitPolicy mặc định: khóa dòng chỉ giữ trong một khối,
+    ghi theo thứ tự khóa tăng dần, nên hai làn không khóa chéo nhau (deadlock 1213/1205).
+    Dòng của file vì thế có thể được commit trước manifest; file chưa được đánh dấu thì
+    lần chạy sau nạp lại cả file (songplay_id uuid5 nên upsert không nhân bản).
+    """
+    all_files = _list_files(filepath, "*.json")
+    if manifest is not None:
+        all_files = manifest.pending(all_files)
+    num_files = len(all_files)
+    print(f"{num_files} files found in {filepath} (Loại: *.json, {lanes} làn đọc/ghi)")
+
+    # Nạp chỉ mục tra cứu một lần trên kết nối chính; mỗi làn dùng chung chỉ mục với cursor riêng
+    lookup = get_song_lookup(cur)
+    started = time.perf_counter()
+    loaded_before = STATS["loaded"]
+    done = {"files": 0}
+    done_lock = threading.Lock()
+
+    def consume(work):
+        with connection() as (lane_cur, lane_conn):
+            LANE.lookup = lookup.bind(lane_cur)
+            LANE.sink = parquet_staging.ParquetStaging() if PARQUET["sink"] is not None else None
+            policy = CommitPolicy(lane_conn, every_files=1, timer=TIMER)
+            try:
+                with policy:
+                    def commit_chunk(rows):
+                        policy.record(rows=rows)
+                        policy.commit(force=True)
+
+                    for datafile, chunks in work:
+                        loaded, rejected, status = process_log_file(lane_cur, datafile, chunks,
+                                                                    on_chunk=commit_chunk)
+                        if manifest is not None:
+                            manifest.mark(datafile, rows_loaded=loaded, rows_rejected=rejected,
+                                          status=status, cur=lane_cur)
+                        policy.record(files=1)
+                        with done_lock:
+                            done["files"] += 1
+                            i = done["files"]
+                        if i % 100 == 0 or i == num_files:
+                            print(f"{i}/{num_files} processed: {datafile}")
+            finally:
+                add_stats(batches=policy.batches)
+                del LANE.lookup, LANE.sink
+
+    run_lanes(all_files, read_log_chunks, consume, lanes=max(1, min(lanes, num_files or 1)),
+              queue_size=queue_size)
 
-def main():
-    logger = ETLLogger("load.load_staging")
+    elapsed = time.perf_counter() - started
+    loaded = STATS["loaded"] - loaded_before
+    rate = loaded / elapsed if elapsed > 0 else 0.0
+    print(f"{loaded} rows loaded in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load song_data (H5) và log_data (JSON) vào staging.")
+    parser.add_argument("--workers", type=int, default=H5_WORKERS,
+                        help="Số process parse H5 song song (mặc định DW_H5_WORKERS, 1 = tuần tự)")
+    parser.add_argument("--ingest", choices=["insert", "load_data"], default=INGEST_MODE,
+                        help="Cách ghi log: executemany hoặc LOAD DATA LOCAL INFILE (mặc định DW_INGEST_MODE)")
+    parser.add_argument("--full-reload", action="store_true",
+                        help="Bỏ qua file_manifest, nạp lại toàn bộ file")
+    parser.add_argument("--no-parquet", action="store_true", default=not PARQUET_STAGING,
+                        help="Không ghi bản sao Parquet theo ngày (mặc định theo DW_PARQUET_STAGING)")
+    parser.add_argument("--lanes", type=int, default=PIPELINE_LANES,
+                        help="Số làn đọc/ghi log chạy chồng nhau, mỗi làn một kết nối "
+                             "(mặc định DW_PIPELINE_LANES, 0 = tuần tự như cũ)")
+    return parser.parse_args(argv)
+
+def reset_run_state():
+    """
+    Đưa trạng thái cấp module (thống kê, timer, quarantine, cache khóa/tra cứu, sink...) về
+    như lúc mới import, để main() chạy lại trong cùng process (pipeline_runner --in-process,
+    lần thử lại) không mang số liệu hay cache của lần trước.
+    """
+    global TIMER, QUARANTINE, SONG_LOOKUP
+    with _STATS_LOCK:
+        for key in STATS:
+            STATS[key] = 0
+    TIMER = PhaseTimer()
+    QUARANTINE = Quarantine("load.load_staging")
+    with _KNOWN_LOCK:
+        KNOWN_START_TIMES.clear()
+    SONG_LOOKUP = None
+    PARQUET["sink"] = None
+    INGEST["mode"] = INGEST_MODE
+
+def main(argv=None):
+    args = parse_args(argv)
+    reset_run_state()
+    INGEST["mode"] = args.ingest
+    if DB_BACKEND == "sqlite":
+        # Không có LOAD DATA; SQLite chỉ một người ghi nên một làn là đủ để chồng đọc/ghi
+        INGEST["mode"] = "insert"
+        args.lanes = min(args.lanes, 1)
+    if not args.no_parquet:
+        if parquet_staging.available():
+            PARQUET["sink"] = parquet_staging.ParquetStaging()
+        else:
+            print("[PARQUET] Bỏ qua staging Parquet (thiếu pyarrow).")
+    logger = ETLLogger("load.load_staging", timer=TIMER)
     logger.start()
     
-    cur, conn = create_connection()
-    
     try:
-        # Load song data
-        process_data(cur, conn, filepath=SONG_DATA_DIR, func=process_song_file, file_extension="*.h5")
-        
-        # Load log data
-        process_data(cur, conn, filepath=LOG_DATA_DIR, func=process_log_file, file_extension="*.json")
+        with connection() as (cur, conn):
+            # Tạo trước phân vùng tháng mới (DDL gây implicit commit nên làm trước khi ghi dữ liệu)
+            ensure_songplay_partitions(cur, conn)
+
+            # Load song data
+            song_manifest = FileManifest(cur, conn, "load_staging.song", full_reload=args.full_reload).load()
+            load_song_catalog(cur, conn, manifest=song_manifest, workers=args.workers)
+
+            # Load log data
+            log_manifest = FileManifest(cur, conn, "load_staging.log", full_reload=args.full_reload).load()
+            if args.lanes > 0:
+                process_logs_pipelined(cur, conn, LOG_DATA_DIR, manifest=log_manifest, lanes=args.lanes)
+            else:
+                process_data(cur, conn, filepath=LOG_DATA_DIR, func=process_log_file, file_extension="*.json",
+                             manifest=log_manifest)
         
+        logger.count_rejects(QUARANTINE.counts)
         logger.log_success(
             extracted=STATS["extracted"], 
             loaded=STATS["loaded"], 
-            rejected=STATS["rejected"]
+            rejected=STATS["rejected"],
+            batches=STATS["batches"]
         )
         print("Load staging done.")
         
     except Exception as e:
         print(f"Critical Error: {e}")
-        logger.log_fail(str(e))
-        # Không raise lỗi nữa để pipeline chạy tiếp các bước sau
-        # raise 
-    finally:
-        if conn:
-            conn.close()
+        logger.count_rejects(QUARANTINE.counts)
+        logger.log_fail(str(e), batches=STATS["batches"])
+        # Báo lỗi cho pipeline_runner: thử lại / bỏ qua các bước phụ thuộc
+        raise
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
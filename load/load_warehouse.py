@@ -1,131 +1,67 @@
-import os
-import glob
-import pandas as pd
-import h5py
-from db import create_connection
-from sql_queries import artist_table_insert, song_table_insert
+import time
+import argparse
+from db import connection
 from config import SONG_DATA_DIR
+from etl_logger import ETLLogger, PhaseTimer
+from file_manifest import FileManifest
+from extraction.h5_catalog import load_catalog, catalog_signatures
+from load.bulk import upsert_song_catalog
+from validation import Quarantine
 
-def _fix(v):
-    """Hàm xử lý giá trị None / NaN."""
-    if pd.isna(v):
-        return None
-    return v
-
-def get_h5_value(h5_group, field_name, index=0, default_val=None):
-    """
-    Trích xuất an toàn một giá trị từ nhóm H5,
-    xử lý các trường bị thiếu và giải mã bytes.
-    """
-    try:
-        value = h5_group[field_name][index]
-        if isinstance(value, bytes):
-            return value.decode('utf-8')
-        # Chuyển đổi các kiểu dữ liệu của numpy (như np.float64) 
-        # sang kiểu gốc của Python (float)
-        if hasattr(value, 'item'):
-            return value.item()
-        return value
-    except (KeyError, IndexError, TypeError, ValueError):
-        # Trả về giá trị mặc định nếu không tìm thấy trường
-        return default_val
-
-def process_song_file(cur, filepath):
+def process_all_songs(cur, conn, data_path, manifest=None, timer=None, quarantine=None):
     """
-    Đọc file HDF5 (H5) và insert dữ liệu.
-    Phiên bản này xử lý các file bị thiếu trường (field) một cách an toàn.
+    Load toàn bộ song_data vào warehouse từ catalog H5 dùng chung
+    (extraction.h5_catalog): lần chạy thứ hai đọc từ cache Parquet thay vì mở lại từng file H5.
+    Dòng không hợp lệ được ghi vào etl_rejects qua quarantine (validation.Quarantine, tùy chọn).
+    Commit theo CommitPolicy; trả về (số file, số dòng đã ghi, số dòng bị loại, số batch đã commit).
     """
-    try:
-        with h5py.File(filepath, 'r') as f:
-            # Trỏ tới các group chính một cách an toàn
-            metadata_songs = f.get('metadata', {}).get('songs', {})
-            analysis_songs = f.get('analysis', {}).get('songs', {})
-
-            # --- Lấy dữ liệu bài hát (Song Data) ---
-            song_id = get_h5_value(metadata_songs, 'song_id', default_val=None)
-            title = get_h5_value(metadata_songs, 'title', default_val=None)
-            artist_id = get_h5_value(metadata_songs, 'artist_id', default_val=None)
-            # Đây là trường bị lỗi, đặt default_val=0
-            year = get_h5_value(metadata_songs, 'year', default_val=0) 
-            duration = get_h5_value(analysis_songs, 'duration', default_val=None)
-            
-            # --- Lấy dữ liệu nghệ sĩ (Artist Data) ---
-            artist_name = get_h5_value(metadata_songs, 'artist_name', default_val=None)
-            artist_location = get_h5_value(metadata_songs, 'artist_location', default_val=None)
-            artist_longitude = get_h5_value(metadata_songs, 'artist_longitude', default_val=None)
-            artist_latitude = get_h5_value(metadata_songs, 'artist_latitude', default_val=None)
-
-            # Bỏ qua file nếu thiếu thông tin ID quan trọng
-            if not song_id or not artist_id:
-                # print(f"Bỏ qua file do thiếu song_id hoặc artist_id: {filepath}")
-                return
-
-            # --- Chèn Artist Data ---
-            artist_data = (
-                _fix(artist_id),
-                _fix(artist_name),
-                _fix(artist_location),
-                float(_fix(artist_longitude)) if _fix(artist_longitude) is not None else None,
-                float(_fix(artist_latitude)) if _fix(artist_latitude) is not None else None,
-            )
-            try:
-                cur.execute(artist_table_insert, artist_data)
-            except Exception:
-                 # Bỏ qua lỗi (ví dụ: trùng lặp PRIMARY KEY)
-                pass
+    timer = timer or PhaseTimer()
+    started = time.perf_counter()
+    catalog = load_catalog(data_path)
+    timer.add("parse", time.perf_counter() - started, len(catalog))
+    if manifest is not None:
+        pending = manifest.pending(catalog["file_path"].tolist(), signatures=catalog_signatures(catalog))
+        catalog = catalog[catalog["file_path"].isin(pending)]
 
-            # --- Chèn Song Data ---
-            song_data = (
-                _fix(song_id),
-                _fix(title),
-                _fix(artist_id),
-                int(_fix(year)) if _fix(year) != 0 and _fix(year) is not None else None,
-                float(_fix(duration)) if _fix(duration) is not None else None,
-            )
-            try:
-                cur.execute(song_table_insert, song_data)
-            except Exception:
-                
-                pass
-
-    except Exception as e:
-       
-        print(f"Lỗi nghiêm trọng khi đọc file H5 {filepath}: {e}")
-
-def process_all_songs(cur, conn, data_path):
-    """
-    Duyệt toàn bộ thư mục song_data để load vào warehouse.
-    """
-    all_files = []
-    for root, dirs, files in os.walk(data_path):
-        files = glob.glob(os.path.join(root, "*.h5"))
-        for f in files:
-            all_files.append(os.path.abspath(f))
-    
-    num_files = len(all_files)
+    num_files = len(catalog)
     print(f"🎵 Tổng cộng {num_files} file nhạc cần load vào warehouse.")
 
-    for i, file in enumerate(all_files, 1):
-        process_song_file(cur, file)
-        conn.commit()
-        if i % 100 == 0 or i == num_files:
-            print(f" Đã xử lý {i}/{num_files} files.")
+    result = upsert_song_catalog(cur, conn, catalog, manifest=manifest, timer=timer, quarantine=quarantine)
+    print(f" Đã commit {result['batches']} batch.")
+    return num_files, result["loaded"], result["rejected"], result["batches"]
 
-def load_to_warehouse(cur, conn):
+def load_to_warehouse(cur, conn, full_reload=False, timer=None, quarantine=None):
     """
     Load dữ liệu từ song_data (Million Song Subset) vào warehouse.
+    Chỉ nạp file mới/thay đổi theo file_manifest, trừ khi full_reload.
     """
-    process_all_songs(cur, conn, SONG_DATA_DIR)
+    manifest = FileManifest(cur, conn, "load_warehouse.song", full_reload=full_reload).load()
+    return process_all_songs(cur, conn, SONG_DATA_DIR, manifest=manifest, timer=timer, quarantine=quarantine)
 
-def main():
-    cur, conn = create_connection()
-    if not cur or not conn:
-        print("Không thể kết nối tới DB. Hủy bỏ load_warehouse.")
-        return
-        
-    print("Kết nối thành công tới MySQL!")
-    load_to_warehouse(cur, conn)
-    conn.close()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load song_data (H5) vào warehouse.")
+    parser.add_argument("--full-reload", action="store_true",
+                        help="Bỏ qua file_manifest, nạp lại toàn bộ file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logger = ETLLogger("load.load_warehouse")
+    logger.start()
+    quarantine = Quarantine("load.load_warehouse")
+
+    try:
+        with connection() as (cur, conn):
+            num_files, written, rejected, batches = load_to_warehouse(
+                cur, conn, full_reload=args.full_reload, timer=logger.timer, quarantine=quarantine)
+        logger.count_rejects(quarantine.counts)
+        # rejected gồm dòng bị validation loại (quarantine) và dòng DB từ chối khi ghi
+        logger.log_success(extracted=num_files, loaded=written, rejected=rejected, batches=batches)
+    except Exception as e:
+        print(f"Error: {e}")
+        logger.count_rejects(quarantine.counts)
+        logger.log_fail(str(e))
+        raise
     print(" Load warehouse hoàn tất.")
 
 if __name__ == "__main__":
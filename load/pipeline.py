@@ -0,0 +1,122 @@
+# load/pipeline.py
+import queue
+import threading
+
+# Hết khối của một công việc / hết công việc của một làn
+_END_ITEM = object()
+_END_LANE = object()
+
+class PipelineAborted(Exception):
+    """Làn khác đã lỗi nên làn này dừng giữa chừng (để transaction của nó được rollback)."""
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+def run_lanes(items, produce, consume, lanes=2, queue_size=4, poll_seconds=0.2):
+    """
+    Chạy song song đọc và ghi theo `lanes` làn độc lập.
+
+    Mỗi làn gồm một thread đọc và một thread ghi nối với nhau bằng hàng đợi giới hạn
+    queue_size khối: thread đọc lấy công việc kế tiếp trong `items` (dùng chung mọi làn),
+    gọi produce(item) để sinh từng khối; hàng đợi đầy thì thread đọc chờ (backpressure).
+    Thread ghi gọi consume(work) đúng một lần, với `work` là iterator các (item, chunks)
+    theo thứ tự đọc; `chunks` là iterator các khối của item đó. Một item chỉ thuộc một làn
+    nên thread ghi có thể giữ transaction/kết nối riêng như code tuần tự.
+
+    Lỗi ở bất kỳ thread nào: mọi làn dừng (PipelineAborted ở phía ghi), rồi lỗi đầu tiên
+    được ném lại ở thread gọi. Trả về list kết quả consume() theo thứ tự làn.
+    """
+    work = queue.Queue()
+    for item in items:
+        work.put(item)
+    stop = threading.Event()
+    errors = []
+    errors_lock = threading.Lock()
+    results = [None] * lanes
+
+    def fail(error):
+        with errors_lock:
+            errors.append(error)
+        stop.set()
+
+    def put(channel, message):
+        # Chờ chỗ trống nhưng vẫn thoát được khi làn khác đã lỗi
+        while not stop.is_set():
+            try:
+                channel.put(message, timeout=poll_seconds)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(channel):
+        while True:
+            if stop.is_set():
+                raise PipelineAborted()
+            try:
+                message = channel.get(timeout=poll_seconds)
+            except queue.Empty:
+                continue
+            if isinstance(message, _Failure):
+                raise message.error
+            return message
+
+    def reader(channel):
+        try:
+            while not stop.is_set():
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    break
+                if not put(channel, item):
+                    return
+                for chunk in produce(item):
+                    if not put(channel, chunk):
+                        return
+                if not put(channel, _END_ITEM):
+                    return
+            put(channel, _END_LANE)
+        except BaseException as e:
+            # Chuyển lỗi sang thread ghi của làn: nó rollback rồi báo lỗi cho cả pipeline
+            put(channel, _Failure(e))
+
+    def chunks_of(channel):
+        while True:
+            message = get(channel)
+            if message is _END_ITEM:
+                return
+            yield message
+
+    def items_of(channel):
+        while True:
+            message = get(channel)
+            if message is _END_LANE:
+                return
+            chunks = chunks_of(channel)
+            yield message, chunks
+            # consume() không đọc hết khối của item thì bỏ phần còn lại
+            for _ in chunks:
+                pass
+
+    def writer(lane, channel):
+        try:
+            results[lane] = consume(items_of(channel))
+        except BaseException as e:
+            fail(e)
+
+    threads = []
+    for lane in range(lanes):
+        channel = queue.Queue(maxsize=queue_size)
+        threads.append(threading.Thread(target=reader, args=(channel,), name=f"pipeline-read-{lane}", daemon=True))
+        threads.append(threading.Thread(target=writer, args=(lane, channel), name=f"pipeline-write-{lane}", daemon=True))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # PipelineAborted chỉ là hệ quả; báo lỗi gốc
+    root = [e for e in errors if not isinstance(e, PipelineAborted)] or errors
+    if root:
+        raise root[0]
+    return results
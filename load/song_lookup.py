@@ -0,0 +1,81 @@
+# load/song_lookup.py
+import copy
+
+import pandas as pd
+
+from config import BATCH_SIZE, LOOKUP_MAX_ROWS
+from sql_queries import song_lookup_select, song_lookup_by_title, song_count
+
+KEY_COLUMNS = ["title", "artist_name", "duration"]
+INDEX_COLUMNS = KEY_COLUMNS + ["song_id", "artist_id"]
+
+
+class SongLookup:
+    """
+    Chỉ mục (title, artist_name, duration) -> (song_id, artist_id).
+
+    - Chế độ đầy đủ: nạp toàn bộ songs/artists một lần, tra cứu bằng merge.
+    - Chế độ giới hạn bộ nhớ (kho nhạc > max_rows): mỗi lô chỉ nạp các bài
+      có title xuất hiện trong lô, bằng một vài câu SELECT ... IN (...).
+    """
+
+    def __init__(self, cur, max_rows=LOOKUP_MAX_ROWS):
+        self.cur = cur
+        self.max_rows = max_rows
+        self.index = None
+        self.bounded = False
+
+    def load(self):
+        """Nạp chỉ mục từ DB; tự chuyển sang chế độ giới hạn nếu kho nhạc quá lớn."""
+        self.cur.execute(song_count)
+        total = self.cur.fetchone()[0]
+        if self.max_rows and total > self.max_rows:
+            self.bounded = True
+            print(f"Song lookup: {total} songs > {self.max_rows}, dùng chế độ tra cứu theo lô.")
+            return self
+
+        self.cur.execute(song_lookup_select)
+        self.index = self._to_index(self.cur.fetchall())
+        print(f"Song lookup: đã nạp {len(self.index)} bài vào bộ nhớ.")
+        return self
+
+    def bind(self, cur):
+        """Bản sao dùng chung chỉ mục đã nạp nhưng tra cứu (chế độ theo lô) trên cursor khác."""
+        other = copy.copy(self)
+        other.cur = cur
+        return other
+
+    def resolve(self, df, title_col="song", artist_col="artist", duration_col="length"):
+        """Trả về DataFrame (song_id, artist_id) cùng index với df; không khớp -> None."""
+        keys = pd.DataFrame({
+            "title": df[title_col],
+            "artist_name": df[artist_col],
+            # float64 ở cả hai phía: read_json có thể suy ra length là int64 cho cả khối
+            "duration": pd.to_numeric(df[duration_col], errors="coerce").astype("float64"),
+        }, index=df.index)
+
+        index = self._fetch_titles(keys["title"]) if self.bounded else self.index
+        if index is None or index.empty:
+            return pd.DataFrame({"song_id": None, "artist_id": None}, index=df.index)
+
+        # index đã bỏ trùng khóa nên merge trái giữ nguyên số dòng và thứ tự của df
+        result = keys.merge(index, on=KEY_COLUMNS, how="left")[["song_id", "artist_id"]]
+        result.index = df.index
+        return result.astype(object).where(result.notna(), None)
+
+    def _fetch_titles(self, titles):
+        titles = titles.dropna().unique().tolist()
+        rows = []
+        for start in range(0, len(titles), BATCH_SIZE):
+            chunk = titles[start:start + BATCH_SIZE]
+            query = song_lookup_by_title.format(placeholders=", ".join(["%s"] * len(chunk)))
+            self.cur.execute(query, chunk)
+            rows.extend(self.cur.fetchall())
+        return self._to_index(rows)
+
+    @staticmethod
+    def _to_index(rows):
+        index = pd.DataFrame(rows, columns=INDEX_COLUMNS)
+        index["duration"] = pd.to_numeric(index["duration"], errors="coerce").astype("float64")
+        # Giữ bản ghi đầu tiên cho mỗi khóa, giống LIMIT 1 của song_select
+        return index.dropna(subset=KEY_COLUMNS).drop_duplicates(subset=KEY_COLUMNS, keep="first")
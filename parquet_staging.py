@@ -0,0 +1,166 @@
+# parquet_staging.py
+"""
+Lớp staging dạng Parquet chạy song song với staging MySQL.
+
+load_staging ghi sự kiện đã làm sạch (songplays) và bảng user theo ngày, dạng
+hive-partition dưới PARQUET_STAGING_DIR:
+
+    parquet/songplays/date=2018-11-01/2018-11-01-events.parquet
+    parquet/users/date=2018-11-01/2018-11-01-events.parquet
+    parquet/songs/songs.parquet, parquet/artists/artists.parquet
+
+Mỗi file log nguồn ứng với đúng một file trong mỗi phân vùng ngày (cùng tên), nên
+nạp lại một file log sẽ ghi đè chứ không nhân bản dữ liệu. Các bước transform đọc
+lại bằng pyarrow.dataset, chỉ mở các phân vùng ngày cần thiết.
+Không có pyarrow thì lớp này tự tắt, staging MySQL vẫn chạy bình thường.
+"""
+import os
+import glob
+from collections import defaultdict
+
+import pandas as pd
+
+from config import PARQUET_STAGING_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow là tùy chọn
+    pa = ds = pq = None
+
+SCHEMAS = {} if pa is None else {
+    "songplays": pa.schema([
+        ("songplay_id", pa.string()),
+        ("start_time", pa.timestamp("ms")),
+        ("user_id", pa.int64()),
+        ("level", pa.string()),
+        ("song_id", pa.string()),
+        ("artist_id", pa.string()),
+        ("session_id", pa.int64()),
+        ("location", pa.string()),
+        ("user_agent", pa.string()),
+    ]),
+    "users": pa.schema([
+        ("user_id", pa.int64()),
+        ("first_name", pa.string()),
+        ("last_name", pa.string()),
+        ("gender", pa.string()),
+        ("level", pa.string()),
+    ]),
+}
+DATE_PARTITIONING = None if pa is None else ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+def available():
+    return pa is not None
+
+class ParquetStaging:
+    """
+    Ghi các khối của một file log vào Parquet theo ngày. Mỗi (bảng, ngày) giữ một
+    ParquetWriter mở suốt file nguồn, ghi ra .tmp rồi đổi tên khi end_file().
+    """
+
+    def __init__(self, base_dir=PARQUET_STAGING_DIR):
+        self.base_dir = base_dir
+        self.source = None
+        self._writers = {}
+        self._rows = defaultdict(int)
+        self._stale = []
+
+    def _path(self, table, date):
+        return os.path.join(self.base_dir, table, f"date={date}", f"{self.source}.parquet")
+
+    @staticmethod
+    def _tmp_path(path):
+        # Tiền tố "." để pyarrow.dataset bỏ qua file đang ghi dở
+        return os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+
+    def begin_file(self, filepath):
+        """Bắt đầu file log nguồn; phần Parquet cũ của chính file này chỉ bị xóa khi end_file() commit."""
+        self.source = os.path.splitext(os.path.basename(filepath))[0]
+        self._stale = [
+            old for table in SCHEMAS
+            for old in glob.glob(os.path.join(self.base_dir, table, "date=*", f"{self.source}.parquet"))
+        ]
+
+    def write(self, table, frame, dates):
+        """Ghi frame (cột theo SCHEMAS[table]) chia theo `dates` (Series 'YYYY-MM-DD' cùng index)."""
+        if frame.empty:
+            return
+        schema = SCHEMAS[table]
+        for date, part in frame.groupby(dates, sort=False):
+            key = (table, date)
+            writer = self._writers.get(key)
+            if writer is None:
+                path = self._path(table, date)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = self._writers[key] = pq.ParquetWriter(self._tmp_path(path), schema)
+            writer.write_table(pa.Table.from_pandas(part[schema.names], schema=schema, preserve_index=False))
+            self._rows[key] += len(part)
+
+    def end_file(self, commit=True):
+        """Đóng các writer của file nguồn; commit=False thì bỏ phần đang ghi dở, giữ bản cũ."""
+        written = set()
+        for (table, date), writer in self._writers.items():
+            writer.close()
+            path = self._path(table, date)
+            if commit:
+                os.replace(self._tmp_path(path), path)
+                written.add(path)
+            else:
+                os.remove(self._tmp_path(path))
+        if commit:
+            # Ngày không còn dữ liệu từ file này (vd. file nguồn đã sửa) thì bỏ bản cũ
+            for old in self._stale:
+                if old not in written and os.path.exists(old):
+                    os.remove(old)
+        self._writers.clear()
+        self._stale = []
+        self._rows.clear()
+        self.source = None
+
+def write_catalog(songs, artists, base_dir=PARQUET_STAGING_DIR):
+    """Ghi đè bảng songs/artists (không phân vùng) từ catalog H5."""
+    for table, frame in (("songs", songs), ("artists", artists)):
+        path = os.path.join(base_dir, table, f"{table}.parquet")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+def dataset(table, base_dir=PARQUET_STAGING_DIR):
+    path = os.path.join(base_dir, table)
+    if pa is None or not os.path.isdir(path):
+        return None
+    return ds.dataset(path, format="parquet", partitioning=DATE_PARTITIONING)
+
+def _date_filter(start=None, end=None):
+    """Biểu thức lọc phân vùng date trong [start, end] (chuỗi hoặc date)."""
+    expr = None
+    if start is not None:
+        expr = ds.field("date") >= str(start)
+    if end is not None:
+        cond = ds.field("date") <= str(end)
+        expr = cond if expr is None else expr & cond
+    return expr
+
+def read_table(table, columns=None, start=None, end=None, base_dir=PARQUET_STAGING_DIR):
+    """Đọc bảng dạng cột (chỉ các phân vùng ngày trong khoảng) thành DataFrame."""
+    data = dataset(table, base_dir)
+    if data is None:
+        return pd.DataFrame(columns=columns)
+    return data.to_table(columns=columns, filter=_date_filter(start, end)).to_pandas()
+
+def daily_counts(table="songplays", start=None, end=None, base_dir=PARQUET_STAGING_DIR):
+    """
+    Số dòng mỗi ngày, lấy từ metadata của từng file Parquet (không đọc dữ liệu).
+    Trả về DataFrame (date, play_count) sắp theo ngày.
+    """
+    data = dataset(table, base_dir)
+    counts = defaultdict(int)
+    if data is not None:
+        for fragment in data.get_fragments(filter=_date_filter(start, end)):
+            date = ds.get_partition_keys(fragment.partition_expression)["date"]
+            counts[date] += fragment.count_rows()
+    frame = pd.DataFrame(sorted(counts.items()), columns=["date", "play_count"])
+    frame["date"] = pd.to_datetime(frame["date"]).dt.date
+    return frame
@@ -1,73 +1,186 @@
 # pipeline_runner.py
+import argparse
+import importlib
+import inspect
 import subprocess
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
 
-# Danh sách các bước theo đúng thứ tự chuẩn:
+# Các bước của pipeline và bước phụ thuộc (DAG):
 # 1. Tạo bảng (quan trọng nhất, nếu không sẽ lỗi "Table doesn't exist")
 # 2. Extract (Giải nén data nhạc)
 # 3. Load Staging (Đọc JSON log & H5 music -> Ghi vào bảng Staging: songs, artists, songplays...)
 # 4. Load Warehouse (Xử lý dữ liệu gốc H5 chi tiết -> Ghi vào Warehouse)
+#    -> 4 chạy sau 3: cả hai đọc chung catalog H5 (cache Parquet) và upsert cùng artists/songs,
+#       chạy song song thì parse H5 hai lần khi cache nguội và tranh khóa trên cùng bảng.
+#       4 vẫn chạy song song với 5/6.
 # 5. Transform (Tổng hợp dữ liệu -> Ghi vào bảng aggregate songplays_daily)
 # 6. Load Mart (Đưa dữ liệu báo cáo -> Ghi vào bảng Mart mart_daily_plays)
+STAGES = {
+    "create_tables": [],
+    "extraction.extract": ["create_tables"],
+    "load.load_staging": ["extraction.extract"],       # Đọc file JSON log + catalog H5
+    "load.load_warehouse": ["load.load_staging"],       # Dùng lại cache catalog H5 do load_staging ghi
+    "transform.create_aggregate": ["load.load_staging"],
+    "load.load_mart": ["transform.create_aggregate"],
+}
 
-SCRIPTS = [
-    "create_tables",          
-    "extraction.extract",
-    "load.load_staging",        # Script này sẽ đọc file JSON vừa tạo ở Bước 1
-    "load.load_warehouse",
-    "transform.create_aggregate",
-    "load.load_mart"
-]
+# Giữ lại danh sách tuần tự cho các chỗ cũ còn dùng
+SCRIPTS = list(STAGES)
+
+PIPELINE_WORKERS = int(os.getenv("DW_PIPELINE_WORKERS", 2))
+STAGE_RETRIES = int(os.getenv("DW_STAGE_RETRIES", 0))
+
+class StageError(Exception):
+    pass
+
+def script_path(module_name):
+    # create_tables là file gốc, các file khác nằm trong thư mục con
+    return os.path.join(ROOT, *module_name.split('.')) + ".py"
 
 def run_script(module_name):
+    """Chạy một bước trong interpreter con (chế độ mặc định)."""
     print(f"\n>>> Running {module_name}...")
-    
+
     # Thiết lập môi trường UTF-8 để tránh lỗi font chữ/ký tự lạ
     child_env = os.environ.copy()
     child_env["PYTHONUTF8"] = "1"
 
     # Chạy script con
     res = subprocess.run(
-        [sys.executable, "-m", module_name], 
+        [sys.executable, "-m", module_name],
         cwd=ROOT,
-        capture_output=True, 
+        capture_output=True,
         env=child_env
     )
-    
+
     # In kết quả ra màn hình
     if res.stdout:
         print(res.stdout.decode('utf-8', errors='ignore'))
-    
+
     # Báo lỗi nếu có
     if res.returncode != 0:
         print(f"!!! ERROR in {module_name} (stderr):")
         if res.stderr:
             print(res.stderr.decode('utf-8', errors='ignore'))
-        # Dừng pipeline nếu gặp lỗi
-        raise SystemExit(res.returncode)
-
-def main():
-    for s in SCRIPTS:
-        # Kiểm tra file tồn tại trước khi chạy (đường dẫn xử lý dấu chấm thành dấu gạch chéo)
-        # Lưu ý: create_tables là file gốc, các file khác nằm trong thư mục con
-        if "." in s:
-            script_path = os.path.join(ROOT, *s.split('.')) + ".py"
+        raise StageError(f"{module_name} exited with code {res.returncode}")
+
+def run_in_process(module_name):
+    """
+    Chạy main() của bước ngay trong process hiện tại: pandas/h5py/pool kết nối
+    chỉ import/khởi tạo một lần cho cả pipeline.
+    """
+    print(f"\n>>> Running {module_name} (in-process)...")
+    stage_main = importlib.import_module(module_name).main
+    try:
+        # main(argv=None) dùng argparse: truyền [] để không đọc nhầm tham số của runner
+        if inspect.signature(stage_main).parameters:
+            stage_main([])
         else:
-            script_path = os.path.join(ROOT, s + ".py")
+            stage_main()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise StageError(f"{module_name} exited with code {e.code}") from e
+    except Exception as e:
+        raise StageError(f"{module_name}: {e}") from e
 
-        if not os.path.exists(script_path):
-            print(f"Cảnh báo: Không tìm thấy file {script_path}, bỏ qua bước này.")
-            continue
-            
+def run_stage(module_name, in_process=False, retries=STAGE_RETRIES):
+    """Chạy một bước, thử lại tối đa `retries` lần; trả về (số lần thử, thời gian)."""
+    runner = run_in_process if in_process else run_script
+    started = time.perf_counter()
+    for attempt in range(1, retries + 2):
         try:
-            run_script(s)
-        except SystemExit:
-            print("Pipeline đã dừng lại do lỗi.")
-            break
+            runner(module_name)
+            return attempt, time.perf_counter() - started
+        except StageError as e:
+            if attempt > retries:
+                raise
+            print(f"!!! {module_name} lỗi (lần {attempt}): {e} -> thử lại")
+            time.sleep(min(2 ** attempt, 30))
+
+def run_pipeline(stages=STAGES, workers=PIPELINE_WORKERS, in_process=False, retries=STAGE_RETRIES):
+    """
+    Chạy DAG: mỗi bước bắt đầu ngay khi mọi bước phụ thuộc đã xong, tối đa `workers`
+    bước cùng lúc. Bước lỗi làm các bước phụ thuộc nó bị bỏ qua; các nhánh khác vẫn chạy.
+    Trả về dict kết quả từng bước.
+    """
+    results = {name: {"status": "PENDING", "attempts": 0, "seconds": 0.0} for name in stages}
+    remaining = dict(stages)
+    running = {}
+
+    def settle():
+        # Bỏ qua các bước có phụ thuộc đã lỗi/bị bỏ qua
+        changed = True
+        while changed:
+            changed = False
+            for name, deps in list(remaining.items()):
+                if any(results[d]["status"] in ("FAILED", "SKIPPED_DEP") for d in deps):
+                    results[name]["status"] = "SKIPPED_DEP"
+                    del remaining[name]
+                    changed = True
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while remaining or running:
+            settle()
+            ready = [name for name, deps in remaining.items()
+                     if all(results[d]["status"] in ("SUCCESS", "MISSING") for d in deps)]
+            for name in ready:
+                del remaining[name]
+                # Kiểm tra file tồn tại trước khi chạy
+                if not os.path.exists(script_path(name)):
+                    print(f"Cảnh báo: Không tìm thấy file {script_path(name)}, bỏ qua bước này.")
+                    results[name]["status"] = "MISSING"
+                    continue
+                results[name]["status"] = "RUNNING"
+                running[pool.submit(run_stage, name, in_process, retries)] = name
+
+            if not running:
+                if remaining and not ready:
+                    # Không bước nào chạy được nữa (phụ thuộc vòng hoặc không tồn tại)
+                    for name in remaining:
+                        results[name]["status"] = "SKIPPED_DEP"
+                    remaining.clear()
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    attempts, seconds = future.result()
+                    results[name].update(status="SUCCESS", attempts=attempts, seconds=seconds)
+                except StageError as e:
+                    print(f"!!! Bước {name} thất bại: {e}")
+                    results[name].update(status="FAILED", attempts=retries + 1)
+    return results
+
+def print_summary(results):
+    print("\n=== TÓM TẮT PIPELINE ===")
+    for name, r in results.items():
+        print(f"{name:<30} {r['status']:<12} {r['seconds']:>8.2f}s  (lần thử: {r['attempts']})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy pipeline ETL theo DAG.")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS,
+                        help="Số bước chạy song song tối đa (mặc định DW_PIPELINE_WORKERS)")
+    parser.add_argument("--retries", type=int, default=STAGE_RETRIES,
+                        help="Số lần thử lại mỗi bước khi lỗi (mặc định DW_STAGE_RETRIES)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Import và gọi main() của từng bước thay vì mở interpreter con")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_pipeline(workers=args.workers, in_process=args.in_process, retries=args.retries)
+    print_summary(results)
+    if any(r["status"] in ("FAILED", "SKIPPED_DEP") for r in results.values()):
+        print("Pipeline đã dừng lại do lỗi.")
     print("\n=== PIPELINE HOÀN TẤT ===")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
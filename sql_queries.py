@@ -2,15 +2,29 @@
 
 # --- 1. DANH SÁCH DROP (Xóa bảng cũ nếu có) ---
 drop_table_queries = [
+    "DROP TABLE IF EXISTS etl_log_metrics;",
     "DROP TABLE IF EXISTS songplays;",
     "DROP TABLE IF EXISTS users;",
     "DROP TABLE IF EXISTS time;",
     "DROP TABLE IF EXISTS songs;",
     "DROP TABLE IF EXISTS artists;",
-    "DROP TABLE IF EXISTS etl_logs;"  # <--- Thêm dòng này
+    "DROP TABLE IF EXISTS etl_logs;",  # <--- Thêm dòng này
+    "DROP TABLE IF EXISTS file_manifest;",
+    "DROP TABLE IF EXISTS etl_watermarks;",
+    "DROP TABLE IF EXISTS schema_migrations;",
+    "DROP TABLE IF EXISTS etl_rejects;"
 ]
 
 # --- 2. DANH SÁCH CREATE (Tạo bảng mới) ---
+# Bảng watermark cũng được tạo lại (IF NOT EXISTS) bởi create_aggregate / load_mart
+etl_watermarks_create = ("""
+    CREATE TABLE IF NOT EXISTS etl_watermarks (
+        name VARCHAR(100) PRIMARY KEY,
+        watermark DATETIME,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+""")
+
 create_table_queries = [
     """
     CREATE TABLE IF NOT EXISTS artists (
@@ -57,8 +71,8 @@ create_table_queries = [
     """,
     """
     CREATE TABLE IF NOT EXISTS songplays (
-        songplay_id VARCHAR(36) PRIMARY KEY,
-        start_time DATETIME,
+        songplay_id VARCHAR(36),
+        start_time DATETIME NOT NULL,
         user_id INT,
         level VARCHAR(50),
         song_id VARCHAR(255),
@@ -66,9 +80,15 @@ create_table_queries = [
         session_id INT,
         location VARCHAR(255),
         user_agent VARCHAR(512),
-        FOREIGN KEY (start_time) REFERENCES time(start_time),
-        FOREIGN KEY (user_id) REFERENCES users(user_id),
-        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        -- Bảng phân vùng: khóa chính phải chứa start_time và InnoDB không cho khóa ngoại
+        -- (time/users luôn được load_staging ghi trước songplays)
+        PRIMARY KEY (songplay_id, start_time),
+        INDEX idx_songplays_load_time (load_time)
+    )
+    -- Phân vùng theo tháng; create_tables tách p_future thành các tháng pYYYYMM
+    PARTITION BY RANGE COLUMNS (start_time) (
+        PARTITION p_future VALUES LESS THAN (MAXVALUE)
     );
     """,
     # --- BẢNG MỚI: ETL LOGS ---
@@ -82,9 +102,78 @@ create_table_queries = [
         rows_extracted INT DEFAULT 0,
         rows_loaded INT DEFAULT 0,
         rows_rejected INT DEFAULT 0,
+        batches_committed INT DEFAULT 0,
         error_message TEXT
     );
+    """,
+    # --- BẢNG CON: thời gian từng pha, rows/sec, peak RSS của mỗi lần chạy ---
     """
+    CREATE TABLE IF NOT EXISTS etl_log_metrics (
+        log_id INT,
+        phase VARCHAR(50),
+        seconds DOUBLE,
+        rows_processed BIGINT DEFAULT 0,
+        rows_per_sec DOUBLE,
+        peak_rss_mb DOUBLE,
+        PRIMARY KEY (log_id, phase),
+        FOREIGN KEY (log_id) REFERENCES etl_logs(log_id)
+    );
+    """,
+    # --- BẢNG MANIFEST: các file đã nạp (để load tăng dần) ---
+    """
+    CREATE TABLE IF NOT EXISTS file_manifest (
+        stage VARCHAR(50),
+        file_path VARCHAR(700),
+        file_size BIGINT,
+        file_mtime DOUBLE,
+        content_hash CHAR(64),
+        status VARCHAR(20),
+        rows_loaded INT DEFAULT 0,
+        rows_rejected INT DEFAULT 0,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (stage, file_path)
+    );
+    """,
+    # --- BẢNG WATERMARK: mốc load_time đã xử lý của các bước tổng hợp tăng dần ---
+    etl_watermarks_create,
+    # --- BẢNG MIGRATION: các bước nâng cấp schema đã chạy (create_tables) ---
+    """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(100) PRIMARY KEY,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # --- BẢNG QUARANTINE: dòng bị loại ở bước kiểm tra (validation) kèm mã lý do ---
+    """
+    CREATE TABLE IF NOT EXISTS etl_rejects (
+        reject_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        stage VARCHAR(50),
+        source_file VARCHAR(700),
+        reason VARCHAR(50),
+        payload TEXT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+]
+
+# --- INDEX PHỤ (create_tables tạo bằng migration nên bảng cũ cũng có) ---
+# (bảng, tên index, cột). Index phụ của InnoDB luôn kèm khóa chính nên các index dưới
+# "phủ" luôn các truy vấn tương ứng, không phải đọc lại dòng gốc.
+secondary_indexes = [
+    # song_lookup_by_title / song_select: lọc title (+duration), lấy song_id, artist_id
+    ("songs", "idx_songs_title_duration", "title, duration, artist_id"),
+    # join theo artists.name khi tra cứu bài hát
+    ("artists", "idx_artists_name", "name"),
+    # create_aggregate + mart thiết bị/heatmap: quét theo khoảng start_time, đọc user_agent
+    ("songplays", "idx_songplays_start_agent", "start_time, user_agent"),
+    # truy vấn theo người dùng
+    ("songplays", "idx_songplays_user_time", "user_id, start_time"),
+    # watermark của create_aggregate / load_mart
+    ("songplays", "idx_songplays_load_time", "load_time"),
+    # bộ lọc năm trên dashboard
+    ("time", "idx_time_year", "year"),
+    # xóa dòng bị loại cũ khi nạp lại file / đếm theo lý do
+    ("etl_rejects", "idx_etl_rejects_source", "stage, source_file"),
 ]
 
 # --- 3. CÁC CÂU LỆNH INSERT DỮ LIỆU ---
@@ -126,6 +215,25 @@ songplay_table_insert = ("""
     ON DUPLICATE KEY UPDATE session_id = VALUES(session_id);
 """)
 
+# Xóa songplays trùng do các lần chạy cũ dùng uuid4 ngẫu nhiên.
+# Mỗi nhóm sự kiện giống hệt nhau giữ lại 1 dòng, ưu tiên id xác định (uuid5, ký tự thứ 15 = '5').
+# Chỉ xóa dòng uuid4: hai uuid5 khác nhau là hai sự kiện khác nhau (khác itemInSession...)
+# dù trùng các cột phân nhóm, nên không bao giờ bị xóa. Khóa chính là (songplay_id, start_time)
+# nên phép nối dùng đủ cả hai cột.
+songplay_dedup = ("""
+    DELETE sp FROM songplays sp
+    JOIN (
+        SELECT songplay_id, start_time,
+               ROW_NUMBER() OVER (
+                   PARTITION BY start_time, user_id, session_id, level, song_id,
+                                artist_id, location, user_agent
+                   ORDER BY SUBSTRING(songplay_id, 15, 1) = '5' DESC, load_time, songplay_id
+               ) AS rn
+        FROM songplays
+    ) d ON d.songplay_id = sp.songplay_id AND d.start_time = sp.start_time
+    WHERE d.rn > 1 AND SUBSTRING(sp.songplay_id, 15, 1) <> '5';
+""")
+
 song_select = ("""
     SELECT s.song_id, a.artist_id
     FROM songs s
@@ -134,6 +242,43 @@ song_select = ("""
     LIMIT 1;
 """)
 
+# Nạp chỉ mục tra cứu bài hát một lần cho cả lần chạy (thay cho song_select từng dòng)
+song_lookup_select = ("""
+    SELECT s.title, a.name, s.duration, s.song_id, a.artist_id
+    FROM songs s
+    JOIN artists a ON s.artist_id = a.artist_id
+    WHERE s.title IS NOT NULL AND a.name IS NOT NULL AND s.duration IS NOT NULL;
+""")
+
+# Chế độ giới hạn bộ nhớ: chỉ lấy các bài có title nằm trong lô hiện tại
+song_lookup_by_title = ("""
+    SELECT s.title, a.name, s.duration, s.song_id, a.artist_id
+    FROM songs s
+    JOIN artists a ON s.artist_id = a.artist_id
+    WHERE s.title IN ({placeholders});
+""")
+
+song_count = ("""
+    SELECT COUNT(*) FROM songs;
+""")
+
+# --- QUERIES CHO FILE MANIFEST ---
+# File FAILED (đọc lỗi giữa chừng) coi như chưa nạp: lần chạy sau thử lại
+file_manifest_select = ("""
+    SELECT file_path, file_size, file_mtime, content_hash, status, rows_loaded, rows_rejected
+    FROM file_manifest
+    WHERE stage = %s AND status <> 'FAILED';
+""")
+
+file_manifest_upsert = ("""
+    INSERT INTO file_manifest (stage, file_path, file_size, file_mtime, content_hash, status, rows_loaded, rows_rejected)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      file_size = VALUES(file_size), file_mtime = VALUES(file_mtime),
+      content_hash = VALUES(content_hash), status = VALUES(status),
+      rows_loaded = VALUES(rows_loaded), rows_rejected = VALUES(rows_rejected);
+""")
+
 # --- 4. QUERIES CHO LOGGING (MỚI) ---
 etl_log_insert = ("""
     INSERT INTO etl_logs (package_name, start_time, status)
@@ -146,14 +291,236 @@ etl_log_update_success = ("""
         status = 'SUCCESS',
         rows_extracted = %s,
         rows_loaded = %s,
-        rows_rejected = %s
+        rows_rejected = %s,
+        batches_committed = %s
     WHERE log_id = %s;
 """)
 
+etl_log_metrics_insert = ("""
+    INSERT INTO etl_log_metrics (log_id, phase, seconds, rows_processed, rows_per_sec, peak_rss_mb)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      seconds = VALUES(seconds), rows_processed = VALUES(rows_processed),
+      rows_per_sec = VALUES(rows_per_sec), peak_rss_mb = VALUES(peak_rss_mb);
+""")
+
 etl_log_update_fail = ("""
     UPDATE etl_logs
     SET end_time = NOW(),
         status = 'FAILED',
-        error_message = %s
+        error_message = %s,
+        batches_committed = %s
     WHERE log_id = %s;
-""")
\ No newline at end of file
+""")
+
+# --- WATERMARK cho các bước tổng hợp tăng dần ---
+watermark_select = ("""
+    SELECT watermark FROM etl_watermarks WHERE name = %s;
+""")
+
+watermark_upsert = ("""
+    INSERT INTO etl_watermarks (name, watermark)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE watermark = VALUES(watermark);
+""")
+
+# --- QUARANTINE (validation.Quarantine) ---
+reject_insert = ("""
+    INSERT INTO etl_rejects (stage, source_file, reason, payload)
+    VALUES (%s, %s, %s, %s);
+""")
+
+# Migration 001 (create_tables): songplays không có start_time không vào được khóa chính mới,
+# chuyển nguyên dòng vào etl_rejects trước khi xóa (MySQL, chỉ chạy trên bảng cũ)
+songplay_missing_start_quarantine = ("""
+    INSERT INTO etl_rejects (stage, source_file, reason, payload)
+    SELECT %s, NULL, %s, JSON_OBJECT(
+        'songplay_id', songplay_id, 'start_time', start_time, 'user_id', user_id, 'level', level,
+        'song_id', song_id, 'artist_id', artist_id, 'session_id', session_id,
+        'location', location, 'user_agent', user_agent, 'load_time', load_time)
+    FROM songplays WHERE start_time IS NULL;
+""")
+
+reject_clear = ("""
+    DELETE FROM etl_rejects WHERE stage = %s AND source_file IN ({placeholders});
+""")
+
+schema_migration_select = ("""
+    SELECT version FROM schema_migrations;
+""")
+
+schema_migration_insert = ("""
+    INSERT IGNORE INTO schema_migrations (version) VALUES (%s);
+""")
+
+# --- 5. TỔNG HỢP THEO NGÀY (transform.create_aggregate) ---
+songplays_daily_create = ("""
+    CREATE TABLE IF NOT EXISTS songplays_daily (
+        date DATE PRIMARY KEY,
+        play_count INT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+""")
+
+# Các ngày có songplays được nạp/sửa từ watermark (lùi thêm số giây trễ)
+songplay_changed_dates = ("""
+    SELECT DISTINCT DATE(start_time) FROM songplays
+    WHERE load_time >= %s - INTERVAL %s SECOND AND start_time IS NOT NULL;
+""")
+
+songplays_daily_rebuild = ("""
+    INSERT INTO songplays_daily (date, play_count)
+    SELECT DATE(start_time) as date, COUNT(*) as play_count
+    FROM songplays
+    GROUP BY DATE(start_time)
+    ON DUPLICATE KEY UPDATE play_count = VALUES(play_count);
+""")
+
+# Ngày không còn songplays nào (vd. sau dedup) thì bỏ khỏi bảng tổng hợp
+songplays_daily_prune = ("""
+    DELETE d FROM songplays_daily d
+    LEFT JOIN (SELECT DISTINCT DATE(start_time) AS date FROM songplays) s ON s.date = d.date
+    WHERE s.date IS NULL;
+""")
+
+# Tính lại các ngày trong khoảng [start, end)
+songplays_daily_refresh = ("""
+    INSERT INTO songplays_daily (date, play_count)
+    SELECT DATE(start_time) as date, COUNT(*) as play_count
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY DATE(start_time)
+    ON DUPLICATE KEY UPDATE play_count = VALUES(play_count);
+""")
+
+songplays_daily_upsert = ("""
+    INSERT INTO songplays_daily (date, play_count) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE play_count = VALUES(play_count);
+""")
+
+# --- 6. CÁC BẢNG MART CHO DASHBOARD (load.load_mart) ---
+mart_daily_plays_create = ("""
+    CREATE TABLE IF NOT EXISTS mart_daily_plays (
+        date DATE PRIMARY KEY,
+        total_plays INT
+    );
+""")
+
+mart_daily_plays_rebuild = ("""
+    INSERT INTO mart_daily_plays (date, total_plays)
+    SELECT date, play_count FROM songplays_daily
+    ON DUPLICATE KEY UPDATE total_plays = VALUES(total_plays);
+""")
+
+# Chỉ các ngày có load_time mới hơn watermark (lùi thêm số giây trễ)
+mart_daily_plays_refresh = ("""
+    INSERT INTO mart_daily_plays (date, total_plays)
+    SELECT date, play_count FROM songplays_daily
+    WHERE load_time >= %s - INTERVAL %s SECOND
+    ON DUPLICATE KEY UPDATE total_plays = VALUES(total_plays);
+""")
+
+# Mart chỉ có một dòng mỗi ngày nên dọn ngày đã bị xóa khỏi songplays_daily luôn được
+mart_daily_plays_prune = ("""
+    DELETE m FROM mart_daily_plays m
+    LEFT JOIN songplays_daily d ON d.date = m.date
+    WHERE d.date IS NULL;
+""")
+
+# Các mart tính thẳng từ songplays theo ngày: mỗi lần chỉ đếm lại các ngày bị ảnh hưởng
+songplay_mart_tables = {
+    "mart_device_plays": """
+    CREATE TABLE IF NOT EXISTS mart_device_plays (
+        date DATE,
+        os VARCHAR(20),
+        plays INT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (date, os)
+    );
+    """,
+    "mart_hourly_plays": """
+    CREATE TABLE IF NOT EXISTS mart_hourly_plays (
+        date DATE,
+        hour TINYINT,
+        weekday TINYINT,
+        plays INT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (date, hour)
+    );
+    """,
+}
+
+# Cùng cách phân loại với dashboard cũ; dùng INSTR thay cho LIKE '%...%' để câu có tham số %s không bị lẫn ký tự %
+device_mart_refresh = ("""
+    INSERT INTO mart_device_plays (date, os, plays)
+    SELECT DATE(start_time) AS date,
+           CASE
+               WHEN INSTR(user_agent, 'Macintosh') > 0 THEN 'Mac'
+               WHEN INSTR(user_agent, 'Windows') > 0 THEN 'Windows'
+               WHEN INSTR(user_agent, 'Linux') > 0 THEN 'Linux'
+               WHEN INSTR(user_agent, 'iPhone') > 0 THEN 'iPhone'
+               ELSE 'Other'
+           END AS os,
+           COUNT(*) AS plays
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY date, os
+    ON DUPLICATE KEY UPDATE plays = VALUES(plays);
+""")
+
+# weekday theo WEEKDAY() của MySQL (0 = Thứ 2), khớp với cột time.weekday
+hourly_mart_refresh = ("""
+    INSERT INTO mart_hourly_plays (date, hour, weekday, plays)
+    SELECT DATE(start_time) AS date, HOUR(start_time) AS hour,
+           WEEKDAY(start_time) AS weekday, COUNT(*) AS plays
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY date, hour, weekday
+    ON DUPLICATE KEY UPDATE plays = VALUES(plays);
+""")
+
+mart_kpis_create = ("""
+    CREATE TABLE IF NOT EXISTS mart_kpis (
+        id TINYINT PRIMARY KEY,
+        total_plays BIGINT,
+        total_users INT,
+        total_songs INT,
+        avg_song_duration DOUBLE,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+""")
+
+# Một dòng duy nhất (id = 1) chứa các KPI đầu trang của dashboard
+kpi_mart_refresh = ("""
+    INSERT INTO mart_kpis (id, total_plays, total_users, total_songs, avg_song_duration)
+    SELECT 1,
+           (SELECT COALESCE(SUM(total_plays), 0) FROM mart_daily_plays),
+           (SELECT COUNT(*) FROM users),
+           (SELECT COUNT(*) FROM songs),
+           (SELECT AVG(duration) FROM songs)
+    ON DUPLICATE KEY UPDATE
+      total_plays = VALUES(total_plays), total_users = VALUES(total_users),
+      total_songs = VALUES(total_songs), avg_song_duration = VALUES(avg_song_duration);
+""")
+
+# --- 7. EXPORT (transform.transform) ---
+# Tham số (start, start, end, end); ngày cuối được tính cả ngày đó
+export_songplays_summary = ("""
+    SELECT DATE(start_time) as date, COUNT(*) as play_count
+    FROM songplays
+    WHERE (%s IS NULL OR start_time >= %s) AND (%s IS NULL OR start_time < %s + INTERVAL 1 DAY)
+    GROUP BY DATE(start_time)
+    ORDER BY date;
+""")
+
+export_songplays = ("""
+    SELECT songplay_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent
+    FROM songplays
+    WHERE (%s IS NULL OR start_time >= %s) AND (%s IS NULL OR start_time < %s + INTERVAL 1 DAY)
+    ORDER BY start_time;
+""")
+
+# --- DIALECT: DW_DB_BACKEND=sqlite thay các câu khác dialect ở trên bằng bản SQLite ---
+from config import DB_BACKEND  # noqa: E402
+if DB_BACKEND == "sqlite":
+    from sql_queries_sqlite import *  # noqa: E402,F401,F403
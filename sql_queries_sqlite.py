@@ -0,0 +1,403 @@
+# sql_queries_sqlite.py
+"""
+Bản SQLite của các câu trong sql_queries khác dialect MySQL (sql_queries tự nạp
+đè khi DW_DB_BACKEND=sqlite). Các câu không có ở đây dùng chung cho cả hai backend.
+
+- ON DUPLICATE KEY UPDATE x = VALUES(x) -> ON CONFLICT(khóa) DO UPDATE SET x = excluded.x
+- load_time ... ON UPDATE CURRENT_TIMESTAMP -> gán load_time trong chính câu upsert
+- NOW() -> datetime('now', 'localtime'); ngày giờ lưu dạng chuỗi 'YYYY-MM-DD HH:MM:SS'
+- INSERT ... SELECT ... ON CONFLICT cần có WHERE trong SELECT (cú pháp SQLite)
+"""
+
+etl_watermarks_create = ("""
+    CREATE TABLE IF NOT EXISTS etl_watermarks (
+        name VARCHAR(100) PRIMARY KEY,
+        watermark DATETIME,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+""")
+
+# Không phân vùng; index phụ (kể cả idx_songplays_load_time) do migration của create_tables tạo
+create_table_queries = [
+    """
+    CREATE TABLE IF NOT EXISTS artists (
+        artist_id VARCHAR(255) PRIMARY KEY,
+        name VARCHAR(255),
+        location VARCHAR(255),
+        latitude DOUBLE,
+        longitude DOUBLE,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS songs (
+        song_id VARCHAR(255) PRIMARY KEY,
+        title VARCHAR(255),
+        artist_id VARCHAR(255),
+        year INT,
+        duration DOUBLE,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (artist_id) REFERENCES artists(artist_id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INT PRIMARY KEY,
+        first_name VARCHAR(255),
+        last_name VARCHAR(255),
+        gender VARCHAR(10),
+        level VARCHAR(50),
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS time (
+        start_time DATETIME PRIMARY KEY,
+        hour INT,
+        day INT,
+        week INT,
+        month INT,
+        year INT,
+        weekday INT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS songplays (
+        songplay_id VARCHAR(36),
+        start_time DATETIME NOT NULL,
+        user_id INT,
+        level VARCHAR(50),
+        song_id VARCHAR(255),
+        artist_id VARCHAR(255),
+        session_id INT,
+        location VARCHAR(255),
+        user_agent VARCHAR(512),
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (songplay_id, start_time)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS etl_logs (
+        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        package_name VARCHAR(255),
+        start_time DATETIME,
+        end_time DATETIME,
+        status VARCHAR(50),
+        rows_extracted INT DEFAULT 0,
+        rows_loaded INT DEFAULT 0,
+        rows_rejected INT DEFAULT 0,
+        batches_committed INT DEFAULT 0,
+        error_message TEXT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS etl_log_metrics (
+        log_id INT,
+        phase VARCHAR(50),
+        seconds DOUBLE,
+        rows_processed BIGINT DEFAULT 0,
+        rows_per_sec DOUBLE,
+        peak_rss_mb DOUBLE,
+        PRIMARY KEY (log_id, phase),
+        FOREIGN KEY (log_id) REFERENCES etl_logs(log_id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS file_manifest (
+        stage VARCHAR(50),
+        file_path VARCHAR(700),
+        file_size BIGINT,
+        file_mtime DOUBLE,
+        content_hash CHAR(64),
+        status VARCHAR(20),
+        rows_loaded INT DEFAULT 0,
+        rows_rejected INT DEFAULT 0,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (stage, file_path)
+    );
+    """,
+    etl_watermarks_create,
+    """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(100) PRIMARY KEY,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS etl_rejects (
+        reject_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stage VARCHAR(50),
+        source_file VARCHAR(700),
+        reason VARCHAR(50),
+        payload TEXT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+]
+
+# --- INSERT / UPSERT ---
+artist_table_insert = ("""
+    INSERT INTO artists (artist_id, name, location, latitude, longitude)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT(artist_id) DO UPDATE SET
+      name = excluded.name, location = excluded.location,
+      latitude = excluded.latitude, longitude = excluded.longitude;
+""")
+
+song_table_insert = ("""
+    INSERT INTO songs (song_id, title, artist_id, year, duration)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT(song_id) DO UPDATE SET
+      title = excluded.title, artist_id = excluded.artist_id,
+      year = excluded.year, duration = excluded.duration;
+""")
+
+user_table_insert = ("""
+    INSERT INTO users (user_id, first_name, last_name, gender, level)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT(user_id) DO UPDATE SET
+      first_name = excluded.first_name, last_name = excluded.last_name,
+      gender = excluded.gender, level = excluded.level;
+""")
+
+time_table_insert = ("""
+    INSERT INTO time (start_time, hour, day, week, month, year, weekday)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT(start_time) DO NOTHING;
+""")
+
+songplay_table_insert = ("""
+    INSERT INTO songplays (songplay_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT(songplay_id, start_time) DO UPDATE SET session_id = excluded.session_id;
+""")
+
+songplay_dedup = ("""
+    DELETE FROM songplays
+    WHERE rowid IN (
+        SELECT rowid FROM (
+            SELECT rowid, songplay_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY start_time, user_id, session_id, level, song_id,
+                                    artist_id, location, user_agent
+                       ORDER BY substr(songplay_id, 15, 1) = '5' DESC, load_time, songplay_id
+                   ) AS rn
+            FROM songplays
+        ) WHERE rn > 1 AND substr(songplay_id, 15, 1) <> '5'
+    );
+""")
+
+file_manifest_upsert = ("""
+    INSERT INTO file_manifest (stage, file_path, file_size, file_mtime, content_hash, status, rows_loaded, rows_rejected)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT(stage, file_path) DO UPDATE SET
+      file_size = excluded.file_size, file_mtime = excluded.file_mtime,
+      content_hash = excluded.content_hash, status = excluded.status,
+      rows_loaded = excluded.rows_loaded, rows_rejected = excluded.rows_rejected,
+      load_time = CURRENT_TIMESTAMP;
+""")
+
+# --- LOGGING ---
+etl_log_insert = ("""
+    INSERT INTO etl_logs (package_name, start_time, status)
+    VALUES (%s, datetime('now', 'localtime'), 'RUNNING');
+""")
+
+etl_log_update_success = ("""
+    UPDATE etl_logs
+    SET end_time = datetime('now', 'localtime'),
+        status = 'SUCCESS',
+        rows_extracted = %s,
+        rows_loaded = %s,
+        rows_rejected = %s,
+        batches_committed = %s
+    WHERE log_id = %s;
+""")
+
+etl_log_metrics_insert = ("""
+    INSERT INTO etl_log_metrics (log_id, phase, seconds, rows_processed, rows_per_sec, peak_rss_mb)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT(log_id, phase) DO UPDATE SET
+      seconds = excluded.seconds, rows_processed = excluded.rows_processed,
+      rows_per_sec = excluded.rows_per_sec, peak_rss_mb = excluded.peak_rss_mb;
+""")
+
+etl_log_update_fail = ("""
+    UPDATE etl_logs
+    SET end_time = datetime('now', 'localtime'),
+        status = 'FAILED',
+        error_message = %s,
+        batches_committed = %s
+    WHERE log_id = %s;
+""")
+
+watermark_upsert = ("""
+    INSERT INTO etl_watermarks (name, watermark)
+    VALUES (%s, %s)
+    ON CONFLICT(name) DO UPDATE SET watermark = excluded.watermark, load_time = CURRENT_TIMESTAMP;
+""")
+
+schema_migration_insert = ("""
+    INSERT OR IGNORE INTO schema_migrations (version) VALUES (%s);
+""")
+
+# --- TỔNG HỢP THEO NGÀY ---
+songplays_daily_create = ("""
+    CREATE TABLE IF NOT EXISTS songplays_daily (
+        date DATE PRIMARY KEY,
+        play_count INT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+""")
+
+songplay_changed_dates = ("""
+    SELECT DISTINCT DATE(start_time) FROM songplays
+    WHERE load_time >= datetime(%s, '-' || %s || ' seconds') AND start_time IS NOT NULL;
+""")
+
+# load_time chỉ đổi khi play_count đổi (như ON UPDATE CURRENT_TIMESTAMP của MySQL)
+songplays_daily_rebuild = ("""
+    INSERT INTO songplays_daily (date, play_count)
+    SELECT DATE(start_time) as date, COUNT(*) as play_count
+    FROM songplays
+    WHERE true
+    GROUP BY DATE(start_time)
+    ON CONFLICT(date) DO UPDATE SET play_count = excluded.play_count, load_time = CURRENT_TIMESTAMP
+    WHERE play_count IS NOT excluded.play_count;
+""")
+
+songplays_daily_prune = ("""
+    DELETE FROM songplays_daily
+    WHERE NOT EXISTS (
+        SELECT 1 FROM songplays s
+        WHERE s.start_time >= songplays_daily.date AND s.start_time < date(songplays_daily.date, '+1 day')
+    );
+""")
+
+songplays_daily_refresh = ("""
+    INSERT INTO songplays_daily (date, play_count)
+    SELECT DATE(start_time) as date, COUNT(*) as play_count
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY DATE(start_time)
+    ON CONFLICT(date) DO UPDATE SET play_count = excluded.play_count, load_time = CURRENT_TIMESTAMP
+    WHERE play_count IS NOT excluded.play_count;
+""")
+
+songplays_daily_upsert = ("""
+    INSERT INTO songplays_daily (date, play_count) VALUES (%s, %s)
+    ON CONFLICT(date) DO UPDATE SET play_count = excluded.play_count, load_time = CURRENT_TIMESTAMP
+    WHERE play_count IS NOT excluded.play_count;
+""")
+
+# --- MART ---
+mart_daily_plays_rebuild = ("""
+    INSERT INTO mart_daily_plays (date, total_plays)
+    SELECT date, play_count FROM songplays_daily
+    WHERE true
+    ON CONFLICT(date) DO UPDATE SET total_plays = excluded.total_plays;
+""")
+
+mart_daily_plays_refresh = ("""
+    INSERT INTO mart_daily_plays (date, total_plays)
+    SELECT date, play_count FROM songplays_daily
+    WHERE load_time >= datetime(%s, '-' || %s || ' seconds')
+    ON CONFLICT(date) DO UPDATE SET total_plays = excluded.total_plays;
+""")
+
+mart_daily_plays_prune = ("""
+    DELETE FROM mart_daily_plays
+    WHERE NOT EXISTS (SELECT 1 FROM songplays_daily d WHERE d.date = mart_daily_plays.date);
+""")
+
+songplay_mart_tables = {
+    "mart_device_plays": """
+    CREATE TABLE IF NOT EXISTS mart_device_plays (
+        date DATE,
+        os VARCHAR(20),
+        plays INT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (date, os)
+    );
+    """,
+    "mart_hourly_plays": """
+    CREATE TABLE IF NOT EXISTS mart_hourly_plays (
+        date DATE,
+        hour TINYINT,
+        weekday TINYINT,
+        plays INT,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (date, hour)
+    );
+    """,
+}
+
+device_mart_refresh = ("""
+    INSERT INTO mart_device_plays (date, os, plays)
+    SELECT DATE(start_time) AS date,
+           CASE
+               WHEN INSTR(user_agent, 'Macintosh') > 0 THEN 'Mac'
+               WHEN INSTR(user_agent, 'Windows') > 0 THEN 'Windows'
+               WHEN INSTR(user_agent, 'Linux') > 0 THEN 'Linux'
+               WHEN INSTR(user_agent, 'iPhone') > 0 THEN 'iPhone'
+               ELSE 'Other'
+           END AS os,
+           COUNT(*) AS plays
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY date, os
+    ON CONFLICT(date, os) DO UPDATE SET plays = excluded.plays, load_time = CURRENT_TIMESTAMP;
+""")
+
+# strftime('%w') đếm 0 = Chủ nhật; đổi về 0 = Thứ 2 như WEEKDAY() của MySQL
+hourly_mart_refresh = ("""
+    INSERT INTO mart_hourly_plays (date, hour, weekday, plays)
+    SELECT DATE(start_time) AS date, CAST(strftime('%H', start_time) AS INTEGER) AS hour,
+           (CAST(strftime('%w', start_time) AS INTEGER) + 6) % 7 AS weekday, COUNT(*) AS plays
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY date, hour, weekday
+    ON CONFLICT(date, hour) DO UPDATE SET plays = excluded.plays, load_time = CURRENT_TIMESTAMP;
+""")
+
+mart_kpis_create = ("""
+    CREATE TABLE IF NOT EXISTS mart_kpis (
+        id TINYINT PRIMARY KEY,
+        total_plays BIGINT,
+        total_users INT,
+        total_songs INT,
+        avg_song_duration DOUBLE,
+        load_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+""")
+
+kpi_mart_refresh = ("""
+    INSERT INTO mart_kpis (id, total_plays, total_users, total_songs, avg_song_duration)
+    SELECT 1,
+           (SELECT COALESCE(SUM(total_plays), 0) FROM mart_daily_plays),
+           (SELECT COUNT(*) FROM users),
+           (SELECT COUNT(*) FROM songs),
+           (SELECT AVG(duration) FROM songs)
+    WHERE true
+    ON CONFLICT(id) DO UPDATE SET
+      total_plays = excluded.total_plays, total_users = excluded.total_users,
+      total_songs = excluded.total_songs, avg_song_duration = excluded.avg_song_duration,
+      load_time = CURRENT_TIMESTAMP;
+""")
+
+# --- EXPORT ---
+export_songplays_summary = ("""
+    SELECT DATE(start_time) as date, COUNT(*) as play_count
+    FROM songplays
+    WHERE (%s IS NULL OR start_time >= %s) AND (%s IS NULL OR start_time < date(%s, '+1 day'))
+    GROUP BY DATE(start_time)
+    ORDER BY date;
+""")
+
+export_songplays = ("""
+    SELECT songplay_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent
+    FROM songplays
+    WHERE (%s IS NULL OR start_time >= %s) AND (%s IS NULL OR start_time < date(%s, '+1 day'))
+    ORDER BY start_time;
+""")
@@ -0,0 +1,93 @@
+# sqlite_backend.py
+"""
+Backend SQLite nhúng (DW_DB_BACKEND=sqlite): bọc sqlite3 cho giống phần
+mysql-connector mà pipeline dùng (tham số %s, cursor(buffered=...),
+column_names, is_connected...). Câu SQL theo dialect SQLite nằm ở
+sql_queries_sqlite; db.py chọn backend theo config.
+"""
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from config import SQLITE_PATH, SQLITE_BUSY_TIMEOUT
+
+# %s -> ? (bỏ qua %% là ký tự % thật)
+_PARAM_RE = re.compile(r"%(s|%)")
+
+def _placeholders(query):
+    return _PARAM_RE.sub(lambda m: "?" if m.group(1) == "s" else "%", query)
+
+# Ngày giờ lưu dạng chuỗi như CURRENT_TIMESTAMP của SQLite để so sánh/sắp xếp đúng
+sqlite3.register_adapter(datetime, lambda v: v.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_adapter(pd.Timestamp, lambda v: v.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_adapter(date, lambda v: v.isoformat())
+for _np_type in (np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64):
+    sqlite3.register_adapter(_np_type, int)
+sqlite3.register_adapter(np.float32, float)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(np.bool_, bool)
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=None):
+        self._cursor.execute(_placeholders(query), tuple(params) if params is not None else ())
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(_placeholders(query), [tuple(p) for p in seq_of_params])
+        return self
+
+    @property
+    def column_names(self):
+        return tuple(d[0] for d in self._cursor.description or ())
+
+    def __getattr__(self, name):
+        # fetchone/fetchmany/fetchall, description, rowcount, lastrowid, close
+        return getattr(self._cursor, name)
+
+class SQLiteConnection:
+    """Một kết nối riêng cho mỗi lần acquire (sqlite3 không chia kết nối giữa các thread)."""
+
+    def __init__(self, path=SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout)
+        # WAL: người đọc (dashboard, bước khác) không chặn người ghi
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def cursor(self, buffered=True):
+        # sqlite3 luôn đọc dần từng dòng nên buffered không có tác dụng
+        return SQLiteCursor(self._conn.cursor())
+
+    def is_connected(self):
+        return True
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+# Lỗi do dữ liệu của dòng (db.DATA_ERRORS)
+DATA_ERRORS = (sqlite3.DataError, sqlite3.IntegrityError)
+
+def version():
+    return sqlite3.sqlite_version
+
+def column_exists(cur, table, column):
+    cur.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cur.fetchall())
+
+def index_exists(cur, table, index):
+    cur.execute(f"PRAGMA index_list({table})")
+    return any(row[1] == index for row in cur.fetchall())
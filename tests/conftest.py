@@ -0,0 +1,8 @@
+# tests/conftest.py
+import os
+import sys
+
+# Các module của repo import phẳng (from config import ...) như khi chạy từ thư mục gốc
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
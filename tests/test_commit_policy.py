@@ -0,0 +1,57 @@
+# tests/test_commit_policy.py
+import pytest
+
+from commit_policy import CommitPolicy
+
+class FakeConn:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+def policy(conn, rows=0, files=0, seconds=0):
+    return CommitPolicy(conn, every_rows=rows, every_files=files, every_seconds=seconds)
+
+def test_commits_on_row_and_file_thresholds():
+    conn = FakeConn()
+    p = policy(conn, rows=10, files=3)
+    p.record(rows=4, files=1)
+    p.record(rows=4, files=1)
+    assert conn.commits == 0
+    p.record(rows=4)
+    assert (conn.commits, p.batches) == (1, 1)
+    p.record(files=1)
+    p.record(files=1)
+    p.record(files=1)
+    assert conn.commits == 2
+
+def test_exit_commits_remainder_only_when_pending():
+    conn = FakeConn()
+    with policy(conn, rows=100) as p:
+        p.record(rows=1)
+    assert (conn.commits, p.batches) == (1, 1)
+    with policy(conn, rows=100):
+        pass
+    assert conn.commits == 1
+
+def test_force_commit_without_recorded_work():
+    conn = FakeConn()
+    p = policy(conn)
+    p.commit()
+    assert conn.commits == 0
+    p.commit(force=True)
+    assert (conn.commits, p.batches) == (1, 1)
+
+def test_exception_rolls_back_and_propagates():
+    conn = FakeConn()
+    with pytest.raises(RuntimeError):
+        with policy(conn, rows=100) as p:
+            p.record(rows=5, files=1)
+            raise RuntimeError("boom")
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+    assert p.pending_rows == 0
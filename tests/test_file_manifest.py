@@ -0,0 +1,61 @@
+# tests/test_file_manifest.py
+import os
+
+from file_manifest import FileManifest, file_hash
+
+class FakeCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+class FakeConn:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+def manifest_for(tmp_path, rows):
+    cur, conn = FakeCursor(rows), FakeConn()
+    return FileManifest(cur, conn, "test", base_dir=str(tmp_path)).load(), cur, conn
+
+def test_pending_new_changed_and_unchanged(tmp_path):
+    same = write(tmp_path / "same.json", "a")
+    changed = write(tmp_path / "changed.json", "b")
+    new = write(tmp_path / "new.json", "c")
+    st = os.stat(same)
+    manifest, cur, conn = manifest_for(tmp_path, [
+        ("same.json", st.st_size, st.st_mtime, file_hash(same), "LOADED", 3, 0),
+        ("changed.json", 1, 0.0, "old-hash", "LOADED", 3, 0),
+    ])
+    assert manifest.pending([same, changed, new]) == [changed, new]
+    assert conn.commits == 0
+
+def test_pending_touched_file_keeps_counts(tmp_path):
+    touched = write(tmp_path / "touched.json", "a")
+    manifest, cur, conn = manifest_for(tmp_path, [
+        ("touched.json", 1, 0.0, file_hash(touched), "LOADED", 7, 2),
+    ])
+    cur.executed.clear()
+    assert manifest.pending([touched]) == []
+    (_, params), = cur.executed
+    assert params[0:2] == ("test", "touched.json")
+    assert params[5:] == ("LOADED", 7, 2)
+    assert conn.commits == 1
+
+def test_full_reload_ignores_manifest(tmp_path):
+    path = write(tmp_path / "a.json", "a")
+    cur, conn = FakeCursor([("a.json", 1, 0.0, file_hash(path), "LOADED", 1, 0)]), FakeConn()
+    manifest = FileManifest(cur, conn, "test", full_reload=True, base_dir=str(tmp_path)).load()
+    assert cur.executed == []
+    assert manifest.pending([path]) == [path]
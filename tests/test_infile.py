@@ -0,0 +1,32 @@
+# tests/test_infile.py
+import pandas as pd
+
+from load.infile import parse_upsert, write_tsv
+
+def test_parse_upsert():
+    query = """
+        INSERT INTO users (user_id, first_name, level)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+          first_name = VALUES(first_name), level = VALUES(level);
+    """
+    table, columns, update = parse_upsert(query)
+    assert table == "users"
+    assert columns == ["user_id", "first_name", "level"]
+    assert update == "first_name = VALUES(first_name), level = VALUES(level)"
+
+def test_write_tsv_escapes_and_nulls(tmp_path):
+    frame = pd.DataFrame({
+        "text": ["a\tb", "line\nbreak", "back\\slash", None],
+        "when": pd.to_datetime(["2018-11-01 20:57:10", None, "2018-11-02 00:00:00", "2018-11-03 00:00:00"]),
+        "n": pd.array([1, None, 3, 4], dtype="Int64"),
+    })
+    path = tmp_path / "out.tsv"
+    write_tsv(frame, str(path))
+    assert path.read_text(encoding="utf-8").split("\n") == [
+        "a\\tb\t2018-11-01 20:57:10\t1",
+        "line\\nbreak\t\\N\t\\N",
+        "back\\\\slash\t2018-11-02 00:00:00\t3",
+        "\\N\t2018-11-03 00:00:00\t4",
+        "",
+    ]
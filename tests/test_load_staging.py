@@ -0,0 +1,29 @@
+# tests/test_load_staging.py
+import uuid
+
+import pandas as pd
+
+from load.load_staging import SONGPLAY_NAMESPACE, songplay_ids, to_start_time
+
+def test_to_start_time_rounds_half_up_like_mysql():
+    result = to_start_time(pd.Series([1541105830499, 1541105830500, "1541105830999"]))
+    assert result.tolist() == [
+        pd.Timestamp("2018-11-01 20:57:10"),
+        pd.Timestamp("2018-11-01 20:57:11"),
+        pd.Timestamp("2018-11-01 20:57:11"),
+    ]
+
+def test_songplay_id_independent_of_inferred_dtype():
+    ints = pd.DataFrame({"ts": [1541105830796], "userId": [39], "sessionId": [5], "itemInSession": [1]})
+    strings = pd.DataFrame({"ts": [1541105830796], "userId": ["39"], "sessionId": [5], "itemInSession": [1]})
+    # Dòng null bên cạnh làm pandas suy ra float64 cho cả cột
+    floats = pd.DataFrame({"ts": [1541105830796, 1541105830797.0], "userId": [39.0, None],
+                           "sessionId": [5, None], "itemInSession": [1, 2]})
+    expected = str(uuid.uuid5(SONGPLAY_NAMESPACE, "1541105830796|39|5|1"))
+    assert songplay_ids(ints)[0] == expected
+    assert songplay_ids(strings)[0] == expected
+    assert songplay_ids(floats)[0] == expected
+
+def test_songplay_id_null_and_missing_parts():
+    df = pd.DataFrame({"ts": [1541105830796], "userId": [None], "sessionId": [5]})
+    assert songplay_ids(df) == [str(uuid.uuid5(SONGPLAY_NAMESPACE, "1541105830796||5|"))]
@@ -0,0 +1,33 @@
+# tests/test_pipeline.py
+import pytest
+
+from load.pipeline import run_lanes
+
+def consume_all(work):
+    return [(item, list(chunks)) for item, chunks in work]
+
+def test_every_item_consumed_once_in_order_within_lane():
+    results = run_lanes(range(10), lambda i: iter([i, i * 10]), consume_all, lanes=3, queue_size=1)
+    consumed = [entry for lane in results for entry in lane]
+    assert sorted(item for item, _ in consumed) == list(range(10))
+    assert all(chunks == [item, item * 10] for item, chunks in consumed)
+
+def test_reader_error_propagates():
+    def produce(item):
+        yield item
+        if item == 3:
+            raise ValueError("bad file")
+
+    with pytest.raises(ValueError, match="bad file"):
+        run_lanes(range(6), produce, consume_all, lanes=2, queue_size=1)
+
+def test_writer_error_propagates_and_stops_other_lanes():
+    def consume(work):
+        for item, chunks in work:
+            list(chunks)
+            if item == 2:
+                raise RuntimeError("commit failed")
+        return "done"
+
+    with pytest.raises(RuntimeError, match="commit failed"):
+        run_lanes(range(50), lambda i: iter([i]), consume, lanes=2, queue_size=1)
@@ -0,0 +1,79 @@
+# tests/test_validation.py
+import json
+
+import pandas as pd
+
+import validation
+from validation import split, validate_log_chunk, validate_catalog
+
+NOW_MS = 1600000000000
+
+def log_row(**overrides):
+    row = {"ts": 1541105830796, "userId": "39", "sessionId": 5, "firstName": "Anh", "lastName": "Le",
+           "gender": "F", "level": "free", "location": "Ha Noi", "userAgent": "Mozilla"}
+    row.update(overrides)
+    return row
+
+def test_split_first_matching_reason_wins():
+    frame = pd.DataFrame({"a": [1, 2, 3]})
+    good, rejects = split(frame, [
+        ("first", pd.Series([False, True, True])),
+        ("second", pd.Series([False, False, True])),
+    ], "f.json")
+    assert good.index.tolist() == [0]
+    assert rejects["reason"].tolist() == ["first", "first"]
+    assert rejects["source_file"].tolist() == ["f.json", "f.json"]
+    assert [json.loads(p)["a"] for p in rejects["payload"]] == [2, 3]
+
+def test_split_without_rejects_keeps_frame():
+    frame = pd.DataFrame({"a": [1, 2]})
+    good, rejects = split(frame, [("x", pd.Series([False, False]))], "f.json")
+    assert good is frame
+    assert rejects.empty
+    assert list(rejects.columns) == ["source_file", "reason", "payload"]
+
+def test_validate_log_chunk_reasons():
+    df = pd.DataFrame([
+        log_row(),
+        log_row(ts=None),
+        log_row(ts=5),
+        log_row(userId="abc"),
+        log_row(userId=""),
+        log_row(sessionId=None),
+        log_row(firstName="x" * 300),
+        log_row(userId=39.0),
+    ])
+    good, rejects = validate_log_chunk(df, "f.json", now_ms=NOW_MS)
+    assert good.index.tolist() == [0, 7]
+    assert rejects["reason"].tolist() == [
+        validation.MISSING_TS, validation.TS_OUT_OF_RANGE, validation.NON_NUMERIC_USER_ID,
+        validation.NON_NUMERIC_USER_ID, validation.MISSING_SESSION_ID, validation.VALUE_TOO_LONG,
+    ]
+
+def test_validate_log_chunk_missing_column_rejects_all():
+    df = pd.DataFrame([log_row()]).drop(columns=["sessionId"])
+    good, rejects = validate_log_chunk(df, "f.json", now_ms=NOW_MS)
+    assert good.empty
+    assert rejects["reason"].tolist() == [validation.MISSING_SESSION_ID]
+
+def test_validate_catalog_allows_unknown_year():
+    catalog = pd.DataFrame({
+        "file_path": ["a.h5", "b.h5", "c.h5", "d.h5"],
+        "ok": [True, False, True, True],
+        "song_id": ["S1", None, "S3", "S4"],
+        "title": ["t"] * 4,
+        "artist_id": ["A1", None, "A3", "A4"],
+        "year": [0, None, 1800, 2000],
+        "duration": [10.0, None, 5.0, -1.0],
+        "artist_name": ["n"] * 4,
+        "artist_location": ["l"] * 4,
+        "artist_latitude": [1.0, None, None, 2.0],
+        "artist_longitude": [1.0, None, None, 2.0],
+    })
+    good, rejects = validate_catalog(catalog, max_year=2030)
+    assert good["file_path"].tolist() == ["a.h5"]
+    assert dict(zip(rejects["source_file"], rejects["reason"])) == {
+        "b.h5": validation.H5_PARSE_ERROR,
+        "c.h5": validation.YEAR_OUT_OF_RANGE,
+        "d.h5": validation.INVALID_DURATION,
+    }
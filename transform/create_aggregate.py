@@ -7,48 +7,121 @@ current_dir = os.path.dirname(os.path.abspath(__file__)) # .../transform
 parent_dir = os.path.dirname(current_dir)                # .../
 sys.path.append(parent_dir)
 
-from db import create_connection
+import argparse
+from datetime import timedelta
+
+from db import connection, ensure_column, ensure_index, to_date
 from etl_logger import ETLLogger
+from config import WATERMARK_LAG_SECONDS
+from sql_queries import (
+    etl_watermarks_create, watermark_select, watermark_upsert, songplays_daily_create,
+    songplay_changed_dates, songplays_daily_rebuild, songplays_daily_prune,
+    songplays_daily_refresh, songplays_daily_upsert
+)
+import parquet_staging
 
-def create_aggregate_table(cur, conn):
-    # 1. Tạo bảng songplays_daily nếu chưa có
-    q = """
-    CREATE TABLE IF NOT EXISTS songplays_daily (
-        date DATE PRIMARY KEY,
-        play_count INT
-    );
+# Tên watermark trong etl_watermarks: load_time lớn nhất của songplays đã được tổng hợp
+AGG_WATERMARK = "songplays_daily"
+
+def date_ranges(dates):
+    """Gom các ngày liên tiếp thành khoảng [start, end) để lọc theo start_time (dùng được index)."""
+    ranges = []
+    for d in sorted(dates):
+        if ranges and ranges[-1][1] == d:
+            ranges[-1][1] = d + timedelta(days=1)
+        else:
+            ranges.append([d, d + timedelta(days=1)])
+    return ranges
+
+def read_watermark(cur, name):
+    cur.execute(watermark_select, (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def changed_dates(cur, since):
+    """Các ngày có songplays được nạp/sửa từ watermark (lùi thêm WATERMARK_LAG_SECONDS)."""
+    cur.execute(songplay_changed_dates, (since, WATERMARK_LAG_SECONDS))
+    return [to_date(row[0]) for row in cur.fetchall()]
+
+def create_aggregate_table(cur, conn, rebuild=False):
+    """
+    Cập nhật songplays_daily. Mặc định chỉ tính lại những ngày có songplays mới
+    kể từ watermark; rebuild=True (hoặc chưa có watermark) thì tính lại toàn bộ.
     """
-    cur.execute(q)
+    # 1. Tạo bảng songplays_daily nếu chưa có
+    cur.execute(songplays_daily_create)
+    # load_time chỉ đổi khi play_count đổi -> load_mart dựa vào đó để chỉ đẩy ngày thay đổi
+    ensure_column(cur, "songplays_daily", "load_time",
+                  "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+    ensure_index(cur, "songplays", "idx_songplays_load_time", "load_time")
+    cur.execute(etl_watermarks_create)
     conn.commit()
 
+    # Chụp mốc trước khi tính: dòng nạp trong lúc đang tính sẽ được lượt sau quét lại
+    cur.execute("SELECT MAX(load_time) FROM songplays")
+    new_watermark = cur.fetchone()[0]
+    watermark = None if rebuild else read_watermark(cur, AGG_WATERMARK)
+
     # 2. Tính toán và đổ dữ liệu vào (Aggregation)
-    query_insert = """
-    INSERT INTO songplays_daily (date, play_count)
-    SELECT DATE(start_time) as date, COUNT(*) as play_count
-    FROM songplays
-    GROUP BY DATE(start_time)
-    ON DUPLICATE KEY UPDATE play_count = VALUES(play_count);
-    """
-    cur.execute(query_insert)
-    
-    # Lấy số dòng được insert/update
-    rows_affected = cur.rowcount
+    if watermark is None:
+        cur.execute(songplays_daily_rebuild)
+        # Lấy số dòng được insert/update
+        rows_affected = cur.rowcount
+        # Ngày không còn songplays nào (vd. sau dedup) thì bỏ khỏi bảng tổng hợp
+        cur.execute(songplays_daily_prune)
+        print("Full rebuild of songplays_daily.")
+    else:
+        dates = changed_dates(cur, watermark)
+        rows_affected = 0
+        for start, end in date_ranges(dates):
+            cur.execute(songplays_daily_refresh, (start, end))
+            rows_affected += cur.rowcount
+        print(f"Incremental refresh since {watermark}: {len(dates)} ngày bị ảnh hưởng.")
+
+    if new_watermark is not None:
+        cur.execute(watermark_upsert, (AGG_WATERMARK, new_watermark))
     conn.commit()
-    
+
     print(f"Aggregate table created/updated. Rows affected: {rows_affected}")
     return rows_affected
 
-def main():
+def aggregate_from_parquet(cur, conn, start=None, end=None):
+    """
+    Tính songplays_daily từ staging Parquet (đếm theo metadata từng phân vùng ngày,
+    không quét songplays trong MySQL) rồi upsert một lô. Không đụng tới watermark.
+    """
+    cur.execute(songplays_daily_create)
+    counts = parquet_staging.daily_counts("songplays", start, end)
+    rows = [(d, int(n)) for d, n in zip(counts["date"], counts["play_count"])]
+    if rows:
+        cur.executemany(songplays_daily_upsert, rows)
+    conn.commit()
+    print(f"songplays_daily updated from Parquet: {len(rows)} ngày.")
+    return len(rows)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tổng hợp songplays theo ngày (songplays_daily).")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Bỏ qua watermark, tính lại toàn bộ songplays_daily")
+    parser.add_argument("--from-parquet", action="store_true",
+                        help="Đếm từ staging Parquet thay vì truy vấn songplays")
+    parser.add_argument("--start", help="Ngày đầu (YYYY-MM-DD) khi dùng --from-parquet")
+    parser.add_argument("--end", help="Ngày cuối (YYYY-MM-DD) khi dùng --from-parquet")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     # Khởi tạo Logger
     logger = ETLLogger("transform.create_aggregate")
     logger.start()
 
-    cur, conn = create_connection()
-    
     try:
         # Chạy logic chính
-        rows = create_aggregate_table(cur, conn)
-        conn.close()
+        with connection() as (cur, conn):
+            if args.from_parquet:
+                rows = aggregate_from_parquet(cur, conn, args.start, args.end)
+            else:
+                rows = create_aggregate_table(cur, conn, rebuild=args.rebuild)
         
         # Ghi log thành công
         # Với bước transform: extracted = loaded = số dòng tạo ra
@@ -59,8 +132,6 @@ def main():
         # Ghi log thất bại
         print(f"Error: {e}")
         logger.log_fail(str(e))
-        if conn:
-            conn.close()
         raise
 
 if __name__ == "__main__":
@@ -1,32 +1,147 @@
 # scripts/transform.py
+import os
+import argparse
+from contextlib import closing
 import pandas as pd
-from db import create_connection
+from db import connection
+from config import EXPORT_CHUNK_SIZE
+from sql_queries import export_songplays_summary, export_songplays
+import parquet_staging
 
-def create_songplay_summary(cur, conn):
+TRANSFORM_DIR = "data/transform"
+
+# Các export hỗ trợ: câu SQL nhận (start, start, end, end); ngày cuối được tính cả ngày đó
+EXPORTS = {
+    "songplays_summary": export_songplays_summary,
+    "songplays": export_songplays,
+}
+
+def iter_query_chunks(cur, query, params=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Chạy query rồi trả về từng khối DataFrame bằng fetchmany. Với cursor không buffer
+    (connection(buffered=False)) dòng được đọc dần từ server nên bộ nhớ chỉ cỡ một khối.
+    Dừng giữa chừng (lỗi ghi file, generator bị đóng): phần kết quả chưa đọc được đọc bỏ
+    theo khối, để kết nối trả về pool không còn kết quả dở ("Unread result found").
+    """
+    cur.execute(query, params)
+    try:
+        columns = list(cur.column_names)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=columns)
+    finally:
+        try:
+            while cur.fetchmany(chunk_size):
+                pass
+        except Exception:
+            # Kết nối đã hỏng: db.connection() dọn tiếp trước khi trả về pool
+            pass
+
+def _parquet_schema(name, frame):
+    """Schema cố định cho cả file: lấy từ staging nếu có, không thì suy từ khối đầu (cột toàn NULL -> string)."""
+    pa = parquet_staging.pa
+    if name in parquet_staging.SCHEMAS:
+        return parquet_staging.SCHEMAS[name]
+    inferred = pa.Schema.from_pandas(frame, preserve_index=False)
+    return pa.schema([
+        pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in inferred
+    ])
+
+def write_chunks(chunks, out, fmt="csv", name=None):
+    """
+    Ghi nối dần từng khối ra CSV hoặc Parquet (file .tmp, đổi tên khi xong để
+    không để lại file dở). Trả về số dòng đã ghi.
+    """
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    tmp_path = out + ".tmp"
+    rows = 0
+    writer = None
+    try:
+        for frame in chunks:
+            if fmt == "parquet":
+                if writer is None:
+                    writer = parquet_staging.pq.ParquetWriter(tmp_path, _parquet_schema(name, frame))
+                writer.write_table(parquet_staging.pa.Table.from_pandas(
+                    frame, schema=writer.schema, preserve_index=False))
+            else:
+                frame.to_csv(tmp_path, mode="a" if rows else "w", header=not rows, index=False)
+            rows += len(frame)
+        if writer is not None:
+            writer.close()
+            writer = None
+        elif not rows:
+            # Không có dòng nào: vẫn tạo file rỗng để bước sau không đọc nhầm file cũ
+            open(tmp_path, "w").close()
+        os.replace(tmp_path, out)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return rows
+
+def export_query(cur, name, out=None, fmt="csv", start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream một export trong EXPORTS ra file với khoảng ngày [start, end]."""
+    out = out or os.path.join(TRANSFORM_DIR, f"{name}.{fmt}")
+    # closing: lỗi khi ghi file thì đọc bỏ phần kết quả còn lại ngay, trước khi trả kết nối
+    with closing(iter_query_chunks(cur, EXPORTS[name], (start, start, end, end), chunk_size)) as chunks:
+        rows = write_chunks(chunks, out, fmt, name)
+    print(f"Transform saved to {out} ({rows} dòng)")
+    return rows
+
+def use_parquet(source):
+    if source == "db":
+        return False
+    has_data = parquet_staging.dataset("songplays") is not None
+    if source == "parquet" and not has_data:
+        raise FileNotFoundError("Chưa có staging Parquet cho songplays (chạy load_staging trước).")
+    return has_data
+
+def create_songplay_summary(cur, conn, source="db", start=None, end=None, fmt="csv"):
     """
     Ví dụ transform: tổng số songplays theo ngày, top artists, ...
     Kết quả ghi vào bảng aggregate trong DB hoặc file.
+    source="parquet"/"auto" chỉ nên dùng khi staging Parquet đầy đủ (vd. sau một lần
+    load_staging --full-reload): staging không được bù cho file manifest bỏ qua và không dedup.
     """
-    # simple query to get songplays with start_time date
-    q = """
-    SELECT DATE(start_time) as dt, COUNT(*) as play_count
-    FROM songplays
-    GROUP BY DATE(start_time);
-    """
-    cur.execute(q)
-    rows = cur.fetchall()
-    df = pd.DataFrame(rows, columns=["date", "play_count"])
-    # save to CSV in staging transform folder
-    out = "data/transform/songplays_summary.csv"
-    import os
-    os.makedirs(os.path.dirname(out), exist_ok=True)
-    df.to_csv(out, index=False)
-    print(f"Transform saved to {out}")
-
-def main():
-    cur, conn = create_connection()
-    create_songplay_summary(cur, conn)
-    conn.close()
+    if use_parquet(source):
+        # Staging Parquet: chỉ đọc metadata các phân vùng ngày trong khoảng
+        out = os.path.join(TRANSFORM_DIR, f"songplays_summary.{fmt}")
+        rows = write_chunks([parquet_staging.daily_counts("songplays", start, end)], out, fmt, "songplays_summary")
+        print(f"Transform saved to {out} ({rows} ngày)")
+        return rows
+    return export_query(cur, "songplays_summary", fmt=fmt, start=start, end=end)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export dữ liệu songplays ra CSV/Parquet theo khối.")
+    parser.add_argument("--export", choices=sorted(EXPORTS), default="songplays_summary",
+                        help="Dữ liệu cần export (mặc định tổng hợp theo ngày)")
+    parser.add_argument("--source", choices=["auto", "parquet", "db"], default="db",
+                        help="Nguồn cho songplays_summary: MySQL (mặc định), staging Parquet, "
+                             "hoặc auto (Parquet nếu có). Staging Parquet có thể thiếu sau các lần "
+                             "nạp tăng dần nên chỉ dùng khi biết chắc nó đầy đủ")
+    parser.add_argument("--format", dest="fmt", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--out", help="File đích (mặc định data/transform/<export>.<format>)")
+    parser.add_argument("--start", help="Ngày đầu (YYYY-MM-DD), tính cả ngày này")
+    parser.add_argument("--end", help="Ngày cuối (YYYY-MM-DD), tính cả ngày này")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE,
+                        help="Số dòng mỗi lần fetchmany (mặc định DW_EXPORT_CHUNK_SIZE)")
+    args = parser.parse_args(argv)
+    if args.fmt == "parquet" and not parquet_staging.available():
+        parser.error("--format parquet cần pyarrow")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.export == "songplays_summary" and args.out is None and use_parquet(args.source):
+        create_songplay_summary(None, None, "parquet", args.start, args.end, args.fmt)
+    else:
+        # Cursor không buffer: dòng được kéo về theo từng fetchmany thay vì cả kết quả một lúc
+        with connection(buffered=False) as (cur, conn):
+            export_query(cur, args.export, args.out, args.fmt, args.start, args.end, args.chunk_size)
     print("Transform done.")
 
 if __name__ == "__main__":
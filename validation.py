@@ -0,0 +1,150 @@
+# validation.py
+"""
+Kiểm tra dữ liệu dạng vector trước khi ghi DB.
+
+Mỗi khối (log JSON hoặc catalog H5) được tách thành phần hợp lệ và phần bị loại,
+mỗi dòng bị loại mang một mã lý do (lý do đầu tiên khớp theo thứ tự kiểm tra).
+Quarantine ghi phần bị loại thành một lô vào bảng etl_rejects (cùng transaction
+với dữ liệu) và đếm theo lý do để ETLLogger ghi vào etl_log_metrics.
+"""
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+from config import BATCH_SIZE
+from sql_queries import reject_insert, reject_clear
+
+# --- MÃ LÝ DO ---
+NON_NUMERIC_USER_ID = "non_numeric_user_id"
+MISSING_TS = "missing_ts"
+MISSING_START_TIME = "missing_start_time"
+TS_OUT_OF_RANGE = "ts_out_of_range"
+MISSING_SESSION_ID = "missing_session_id"
+VALUE_TOO_LONG = "value_too_long"
+H5_PARSE_ERROR = "h5_parse_error"
+MISSING_SONG_ID = "missing_song_id"
+MISSING_ARTIST_ID = "missing_artist_id"
+INVALID_DURATION = "invalid_duration"
+YEAR_OUT_OF_RANGE = "year_out_of_range"
+COORD_OUT_OF_RANGE = "coord_out_of_range"
+
+# ts (ms) hợp lệ: từ 2000-01-01 tới hiện tại + 1 ngày
+TS_MIN_MS = 946684800000
+TS_FUTURE_MS = 24 * 3600 * 1000
+
+# Độ dài tối đa theo cột VARCHAR đích (sql_queries), để không phải chờ DB từ chối
+LOG_MAX_LENGTHS = {
+    "firstName": 255, "lastName": 255, "gender": 10, "level": 50, "location": 255, "userAgent": 512,
+}
+CATALOG_MAX_LENGTHS = {
+    "song_id": 255, "title": 255, "artist_id": 255, "artist_name": 255, "artist_location": 255,
+}
+
+def _column(frame, name):
+    if name in frame.columns:
+        return frame[name]
+    return pd.Series(None, index=frame.index, dtype=object)
+
+def _whole_number(values):
+    """Số nguyên không âm (chấp nhận chuỗi "39" hay số thực 39.0); còn lại -> False."""
+    numbers = pd.to_numeric(values, errors="coerce")
+    return numbers.notna() & (numbers >= 0) & (numbers == numbers.round())
+
+def _too_long(frame, limits):
+    mask = pd.Series(False, index=frame.index)
+    for name, limit in limits.items():
+        if name in frame.columns:
+            mask |= (frame[name].astype("string").str.len() > limit).fillna(False)
+    return mask
+
+def split(frame, checks, source):
+    """
+    checks: list (mã lý do, mask dòng lỗi) theo thứ tự ưu tiên; source: tên file (chuỗi hoặc Series).
+    Trả về (good, rejects) với rejects gồm source_file, reason, payload (JSON của dòng gốc).
+    """
+    reason = pd.Series(None, index=frame.index, dtype=object)
+    for code, mask in checks:
+        reason = reason.mask(reason.isna() & mask.fillna(False).astype(bool), code)
+    bad = reason.notna()
+    if not bad.any():
+        return frame, pd.DataFrame(columns=["source_file", "reason", "payload"])
+    rejected = frame[bad]
+    rejects = pd.DataFrame({
+        "source_file": source[bad] if isinstance(source, pd.Series) else source,
+        "reason": reason[bad],
+        "payload": rejected.to_json(orient="records", lines=True, date_format="iso").splitlines(),
+    }, index=rejected.index)
+    return frame[~bad], rejects
+
+def validate_log_chunk(df, source=None, now_ms=None):
+    """Các sự kiện NextSong: userId/ts/sessionId phải là số hợp lệ, chuỗi không vượt độ dài cột."""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    ts = pd.to_numeric(_column(df, "ts"), errors="coerce")
+    return split(df, [
+        (MISSING_TS, ts.isna()),
+        (TS_OUT_OF_RANGE, (ts < TS_MIN_MS) | (ts > now_ms + TS_FUTURE_MS)),
+        (NON_NUMERIC_USER_ID, ~_whole_number(_column(df, "userId"))),
+        (MISSING_SESSION_ID, ~_whole_number(_column(df, "sessionId"))),
+        (VALUE_TOO_LONG, _too_long(df, LOG_MAX_LENGTHS)),
+    ], source)
+
+def validate_catalog(catalog, max_year=None):
+    """Các dòng catalog H5: phải đọc được, có song_id/artist_id, giá trị số trong khoảng hợp lệ."""
+    max_year = time.localtime().tm_year + 1 if max_year is None else max_year
+    ok = catalog["ok"].astype(bool)
+    missing_song = catalog["song_id"].isna()
+    missing_artist = catalog["artist_id"].isna()
+    duration = pd.to_numeric(catalog["duration"], errors="coerce")
+    year = pd.to_numeric(catalog["year"], errors="coerce")
+    latitude = pd.to_numeric(catalog["artist_latitude"], errors="coerce")
+    longitude = pd.to_numeric(catalog["artist_longitude"], errors="coerce")
+    return split(catalog, [
+        # File không mở được: mọi cột đều trống
+        (H5_PARSE_ERROR, ~ok & missing_song & missing_artist),
+        (MISSING_SONG_ID, missing_song),
+        (MISSING_ARTIST_ID, missing_artist),
+        (H5_PARSE_ERROR, ~ok),
+        (INVALID_DURATION, duration <= 0),
+        # year = 0 là "không rõ" trong Million Song Dataset, vẫn hợp lệ
+        (YEAR_OUT_OF_RANGE, (year != 0) & ((year < 1900) | (year > max_year))),
+        (COORD_OUT_OF_RANGE, (latitude.abs() > 90) | (longitude.abs() > 180)),
+        (VALUE_TOO_LONG, _too_long(catalog, CATALOG_MAX_LENGTHS)),
+    ], catalog["file_path"])
+
+class Quarantine:
+    """
+    Ghi các dòng bị loại của một stage vào etl_rejects và đếm theo lý do.
+    Dùng chung được giữa các thread ghi (mỗi thread truyền cursor của mình).
+    """
+
+    def __init__(self, stage, batch_size=BATCH_SIZE):
+        self.stage = stage
+        self.batch_size = batch_size
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def clear(self, cur, source_files):
+        """Xóa các dòng bị loại cũ của những file sắp được nạp lại (tránh nhân bản khi chạy lại)."""
+        source_files = list(source_files)
+        for start in range(0, len(source_files), self.batch_size):
+            chunk = source_files[start:start + self.batch_size]
+            cur.execute(reject_clear.format(placeholders=", ".join(["%s"] * len(chunk))), [self.stage] + chunk)
+
+    def add(self, cur, rejects):
+        """Ghi một lô dòng bị loại (source_file, reason, payload); trả về số dòng."""
+        if rejects.empty:
+            return 0
+        rows = [(self.stage, source, reason, payload)
+                for source, reason, payload in rejects[["source_file", "reason", "payload"]].itertuples(
+                    index=False, name=None)]
+        for start in range(0, len(rows), self.batch_size):
+            cur.executemany(reject_insert, rows[start:start + self.batch_size])
+        with self._lock:
+            self.counts.update(rejects["reason"].value_counts().to_dict())
+        return len(rows)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())